@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.urls import re_path
+from django.views.static import serve
+from eventify.urls import urlpatterns as app_urlpatterns
+
+# Static and media serving as it was before WhiteNoise, for
+# bench_page_weight: Django's static view, uncompressed, with Last-Modified
+# but no Cache-Control.
+
+
+def serve_static(request, path):
+    return serve(request, path, document_root=settings.STATIC_ROOT)
+
+
+def serve_media(request, path):
+    return serve(request, path, document_root=settings.MEDIA_ROOT)
+
+
+urlpatterns = [
+    pattern for pattern in app_urlpatterns
+    if getattr(pattern, 'name', None) != 'event_image'
+] + [
+    re_path(r'^static/(?P<path>.*)$', serve_static),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
+]
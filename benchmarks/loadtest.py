@@ -0,0 +1,314 @@
+import asyncio
+import json
+import re
+import time
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+# Flash-sale load test: virtual users walking the real purchase flow
+# against a running server.
+#
+# Every virtual user is one asyncio task with its own keep-alive connection
+# and cookie jar, so thousands of them fit in one process. Each one
+# registers, books a ticket, starts an M-Pesa payment, waits on the
+# long-poll status endpoint for the callback and opens the success page,
+# just as a browser would. The server must send STK pushes to the fake
+# Daraja (payments.simulator), which the command runs on the same loop and
+# which posts callbacks back to the server.
+
+STEPS = ('register', 'create_booking', 'process_payment', 'callback',
+         'payment_success')
+
+BOOKING_ID = re.compile(r'/payments/process/(\d+)/')
+PAYMENT_ID = re.compile(r'/payments/(pending|failed|success)/(\d+)/')
+
+
+class FlowError(Exception):
+    """A step got a response the flow can't continue from"""
+
+    def __init__(self, outcome, message):
+        super().__init__(message)
+        self.outcome = outcome
+
+
+class Response:
+    __slots__ = ('status', 'headers', 'cookies', 'body')
+
+    def __init__(self, status, headers, cookies, body):
+        self.status = status
+        self.headers = headers
+        self.cookies = cookies
+        self.body = body
+
+    @property
+    def location(self):
+        return self.headers.get('location', '')
+
+
+async def read_response(reader):
+    """One HTTP/1.1 response, keeping every Set-Cookie header"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Server closed the connection")
+    headers, cookies = {}, []
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip()
+        if name == 'set-cookie':
+            cookies.append(value)
+        headers[name] = value
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = b''
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            body += await reader.readexactly(size + 2)
+            if size == 0:
+                break
+        body = body[:-2]
+    else:
+        length = int(headers.get('content-length', 0))
+        body = await reader.readexactly(length) if length else b''
+    return Response(int(status_line.split()[1]), headers, cookies, body)
+
+
+class HttpSession:
+    """A browser's worth of HTTP: one keep-alive connection and cookies"""
+
+    def __init__(self, base_url, timeout):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.netloc = url.netloc
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+        self.requests = 0
+
+    async def request(self, method, path, form=None):
+        body = urlencode(form).encode() if form is not None else b''
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.netloc}"]
+        if self.cookies:
+            head.append("Cookie: " + '; '.join(
+                f"{name}={value}" for name, value in self.cookies.items()))
+        if form is not None:
+            head.append("Content-Type: application/x-www-form-urlencoded")
+        head.append(f"Content-Length: {len(body)}")
+        message = ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+
+        # A kept-alive connection may have been closed by the server
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout)
+            reader, writer = self.connection
+            try:
+                writer.write(message)
+                response = await asyncio.wait_for(
+                    read_response(reader), self.timeout)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+        self.requests += 1
+        for header in response.cookies:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.headers.get('connection', '').lower() == 'close':
+            self.close()
+        return response
+
+    async def post(self, path, form):
+        form = {**form, 'csrfmiddlewaretoken': self.cookies.get('csrftoken', '')}
+        return await self.request('POST', path, form)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection[1].close()
+            self.connection = None
+
+
+class LoadTest:
+    """Runs virtual users and collects step timings and outcomes"""
+
+    def __init__(self, base_url, event_id, run_id, timeout=30,
+                 status_timeout=120, phone='254708374149'):
+        self.base_url = base_url
+        self.event_id = event_id
+        self.run_id = run_id
+        self.timeout = timeout
+        self.status_timeout = status_timeout
+        self.phone = phone
+        self.timings = defaultdict(list)
+        self.step_errors = Counter()
+        self.outcomes = Counter()
+        self.errors = Counter()
+        self.seen_success = []
+        self.requests = 0
+
+    async def timed(self, step, flow):
+        start = time.perf_counter()
+        try:
+            result = await flow
+        except Exception:
+            self.step_errors[step] += 1
+            raise
+        self.timings[step].append(time.perf_counter() - start)
+        return result
+
+    async def user(self, number):
+        session = HttpSession(self.base_url, self.timeout)
+        try:
+            outcome = await self.flow(session, number)
+        except FlowError as e:
+            outcome = e.outcome
+            self.errors[f"{e.outcome}: {e}"] += 1
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ValueError) as e:
+            outcome = 'error'
+            self.errors[f"{type(e).__name__}: {e}"[:200]] += 1
+        finally:
+            self.requests += session.requests
+            session.close()
+        self.outcomes[outcome] += 1
+
+    async def flow(self, session, number):
+        username = f"{self.run_id}-{number}"
+        await self.timed('register', self.register(session, username))
+        booking_id = await self.timed('create_booking', self.book(session))
+        kind, payment_id = await self.timed(
+            'process_payment', self.pay(session, booking_id))
+        if kind == 'failed':
+            return 'payment_refused'
+        status = await self.timed('callback', self.wait(session, payment_id))
+        if status != 'successful':
+            return f'payment_{status}'
+        await self.timed('payment_success', self.success(session, payment_id))
+        self.seen_success.append(payment_id)
+        return 'confirmed'
+
+    async def register(self, session, username):
+        await session.request('GET', '/users/register/')
+        response = await session.post('/users/register/', {
+            'username': username, 'email': f"{username}@loadtest.example.com",
+            'password1': 'load-test-Passw0rd', 'password2': 'load-test-Passw0rd',
+            'first_name': 'Load', 'last_name': str(username),
+        })
+        if response.status != 302:
+            raise FlowError('register_failed', f"HTTP {response.status}")
+
+    async def book(self, session):
+        path = f'/bookings/create/{self.event_id}/'
+        await session.request('GET', path)
+        response = await session.post(path, {'ticket_type': 'regular', 'quantity': '1'})
+        match = BOOKING_ID.search(response.location)
+        if response.status != 302 or match is None:
+            # The form is shown again (sold out) or we're sent home
+            raise FlowError('booking_refused', f"HTTP {response.status} {response.location}")
+        return int(match.group(1))
+
+    async def pay(self, session, booking_id):
+        response = await session.post(
+            f'/payments/process/{booking_id}/', {'phone_number': self.phone})
+        match = PAYMENT_ID.search(response.location)
+        if response.status == 503:
+            raise FlowError('gateway_unavailable', "HTTP 503")
+        if response.status != 302 or match is None:
+            raise FlowError('payment_not_started', f"HTTP {response.status} {response.location}")
+        return match.group(1), int(match.group(2))
+
+    async def wait(self, session, payment_id):
+        """Long-poll (or, against a WSGI server, poll) the status endpoint
+        until the callback lands"""
+        deadline = time.monotonic() + self.status_timeout
+        while time.monotonic() < deadline:
+            response = await session.request('GET', f'/payments/status/{payment_id}/')
+            if response.status != 200:
+                raise FlowError('status_failed', f"HTTP {response.status}")
+            body = json.loads(response.body)
+            if body['status'] != 'pending':
+                return body['status']
+            if body.get('retry_after'):
+                await asyncio.sleep(body['retry_after'])
+        raise FlowError('callback_timeout', f"No callback within {self.status_timeout}s")
+
+    async def success(self, session, payment_id):
+        response = await session.request('GET', f'/payments/success/{payment_id}/')
+        if response.status != 200:
+            raise FlowError('success_page_failed', f"HTTP {response.status} {response.location}")
+
+    async def run(self, users, concurrency, ramp_seconds=0):
+        """Start `users` virtual users, at most `concurrency` at a time,
+        spreading their arrival over `ramp_seconds`"""
+        limit = asyncio.Semaphore(concurrency)
+
+        async def start(number):
+            if ramp_seconds:
+                await asyncio.sleep(ramp_seconds * number / users)
+            async with limit:
+                await self.user(number)
+
+        begin = time.perf_counter()
+        await asyncio.gather(*(start(number) for number in range(users)))
+        return time.perf_counter() - begin
+
+
+def latency_summary(timings, errors):
+    """Count and p50/p95/p99/max in milliseconds (nearest rank)"""
+    timings = sorted(timings)
+    summary = {'count': len(timings), 'errors': errors}
+    if timings:
+        for name, share in (('p50_ms', .50), ('p95_ms', .95), ('p99_ms', .99)):
+            summary[name] = round(
+                timings[min(len(timings) - 1, int(len(timings) * share))] * 1000, 1)
+        summary['max_ms'] = round(timings[-1] * 1000, 1)
+    return summary
+
+
+def ticket_stock(event):
+    """Tickets left to sell, by ticket type category"""
+    return {ticket_type.category: ticket_type.quantity_available
+            for ticket_type in event.ticket_types.all()}
+
+
+def find_anomalies(event, run_id, seen_success, stock):
+    """Oversells and duplicates left in the database by a run. `stock` is
+    ticket_stock(event) from before the run."""
+    from django.db.models import Count, Sum
+    from bookings.models import Booking
+    from payments.models import Payment, PaymentPayload
+
+    bookings = Booking.objects.filter(event=event, user__username__startswith=f"{run_id}-")
+    payments = Payment.objects.filter(booking__in=bookings)
+    confirmed = bookings.filter(status='confirmed')
+    sold = confirmed.aggregate(tickets=Sum('quantity'))['tickets'] or 0
+    sold_by_type = dict(confirmed.values_list('ticket_type').annotate(Sum('quantity')))
+    successful = set(payments.filter(status='successful').values_list('id', flat=True))
+    return {
+        'tickets_sold': sold,
+        'oversold': max(0, sold - event.total_capacity),
+        'oversold_by_ticket_type': {
+            category: sold_by_type.get(category, 0) - available
+            for category, available in sorted(stock.items())
+            if sold_by_type.get(category, 0) > available
+        },
+        'duplicate_bookings_per_user': bookings.values('user').annotate(
+            n=Count('id')).filter(n__gt=1).count(),
+        'duplicate_receipts': payments.filter(status='successful').exclude(
+            mpesa_receipt_number='').values('mpesa_receipt_number').annotate(
+            n=Count('id')).filter(n__gt=1).count(),
+        'callbacks_applied_twice': PaymentPayload.objects.filter(
+            payment__in=payments, kind='callback').values('payment').annotate(
+            n=Count('id')).filter(n__gt=1).count(),
+        # Never resolved: the callback was ignored (e.g. it arrived before
+        # the STK push response was saved) and nothing queried Daraja later
+        'stuck_pending': payments.filter(status='pending').count(),
+        'paid_not_confirmed': payments.filter(status='successful').exclude(
+            booking__status='confirmed').count(),
+        'confirmed_without_payment': confirmed.exclude(payment__status='successful').count(),
+        'success_page_for_unpaid': len(set(seen_success) - successful),
+    }
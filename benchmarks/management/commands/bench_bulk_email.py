@@ -0,0 +1,55 @@
+import time
+from django.core.mail import EmailMultiAlternatives
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from benchmarks.smtp_sink import SmtpSink
+from emails.bulk import BulkMailer, SendThrottle, send_bulk
+
+
+def sample_messages(count):
+    attachment = b'%PDF-1.4 ' + b'x' * 2600
+    for i in range(count):
+        message = EmailMultiAlternatives(
+            subject=f"Your Event Ticket #{i}", body="Ticket details " * 40,
+            from_email='noreply@eventify.com', to=[f"user{i}@example.com"])
+        message.attach_alternative("<p>Ticket details</p>" * 60, "text/html")
+        message.attach(f"ticket_{i}.pdf", attachment, "application/pdf")
+        yield message
+
+
+class Command(BaseCommand):
+    help = "Compare per-message SMTP connections with bulk connection reuse"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument(
+            '--connect-ms', type=float, default=50,
+            help="Simulated TLS handshake + login time per connection")
+
+    def handle(self, *args, **options):
+        sink = SmtpSink(connect_delay=options['connect_ms'] / 1000)
+        port = sink.start()
+        count = options['messages']
+
+        with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                EMAIL_HOST='127.0.0.1', EMAIL_PORT=port, EMAIL_USE_TLS=False,
+                EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD=''):
+            # Before: every message opens and closes its own connection
+            start = time.perf_counter()
+            for message in sample_messages(count):
+                message.send(fail_silently=False)
+            per_message = time.perf_counter() - start
+            per_message_connections = sink.connections
+
+            mailer = BulkMailer(throttle=SendThrottle(rate=0), fail_silently=True)
+            result = send_bulk(sample_messages(count), mailer=mailer)
+
+        self.stdout.write(
+            f"messages: {count}  simulated connect: {options['connect_ms']:.0f} ms")
+        self.stdout.write(
+            f"per-message connections: {count / per_message:8.1f} msg/s  "
+            f"({per_message_connections} connections)")
+        self.stdout.write(
+            f"bulk (reused):           {result.rate:8.1f} msg/s  "
+            f"({mailer.connections_opened} connections, {result.failed} failed)")
@@ -0,0 +1,83 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from benchmarks.seed import seed_bookings, seed_events, seed_users
+from benchmarks.utils import throwaway_database
+from bookings.ticket_codes import event_key, sign_ticket
+from checkin.gate import EventGate
+from checkin.models import Admission
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return {
+        'p50': timings[len(timings) // 2],
+        'p99': timings[int(len(timings) * 0.99)],
+        'max': timings[-1],
+    }
+
+
+class Command(BaseCommand):
+    help = "Time gate decisions for a large event scanned at two gates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attendees', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        count = options['attendees']
+        with throwaway_database():
+            users = seed_users(min(count, 5000))
+            event = seed_events(1)[0]
+            bookings = seed_bookings(event, users, count)
+            key = event_key(event.id)
+            codes = [sign_ticket(booking.id, event.id, booking.quantity, key)
+                     for booking in bookings]
+            random.Random(7).shuffle(codes)
+
+            gates = [EventGate(event.id, scanner=name, key=key)
+                     for name in ('gate-a', 'gate-b')]
+            start = time.perf_counter()
+            for gate in gates:
+                gate.load()
+            load_ms = (time.perf_counter() - start) * 1000 / len(gates)
+            self.stdout.write(
+                f"attendees: {count}  load: {load_ms:.0f} ms per gate  "
+                f"memory: {len(gates[0]) * 7 / 1024:.0f} KiB of arrays per gate")
+
+            # Alternate gates; maybe_sync() runs after every scan as it
+            # would in a scanner, so batched writes and syncs are included
+            decide, total = [], []
+            admitted = 0
+            run_start = time.perf_counter()
+            for index, code in enumerate(codes):
+                gate = gates[index % 2]
+                start = time.perf_counter()
+                decision = gate.scan(code)
+                decided = time.perf_counter()
+                gate.maybe_sync()
+                end = time.perf_counter()
+                decide.append((decided - start) * 1000)
+                total.append((end - start) * 1000)
+                admitted += decision.admitted
+            elapsed = time.perf_counter() - run_start
+            for gate in gates:
+                gate.sync()
+
+            for label, timings in (('decision', decide),
+                                   ('decision + sync', total)):
+                stats = percentiles(timings)
+                self.stdout.write(
+                    f"{label:<16} p50 {stats['p50']:.3f} ms  "
+                    f"p99 {stats['p99']:.3f} ms  max {stats['max']:.2f} ms  "
+                    f"mean {statistics.mean(timings):.3f} ms")
+            self.stdout.write(
+                f"admitted {admitted}/{count} in {elapsed:.1f}s "
+                f"({count / elapsed:.0f} scans/s); "
+                f"{Admission.objects.filter(event=event).count()} admission rows")
+
+            # Every ticket re-presented at the other gate is turned away
+            rejected = sum(
+                not gates[(index + 1) % 2].scan(code).admitted
+                for index, code in enumerate(codes))
+            self.stdout.write(f"re-scans at the other gate rejected: {rejected}/{count}")
@@ -0,0 +1,33 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from benchmarks.startup import run_startup, startup_report
+
+
+class Command(BaseCommand):
+    help = "Time cold starts: fresh interpreters loading the app up to the first request"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10)
+
+    def handle(self, *args, **options):
+        walls, phases, heavy = [], {}, set()
+        run_startup()  # warm the OS file cache and .pyc files
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            completed = run_startup()
+            walls.append(time.perf_counter() - start)
+            report = startup_report(completed)
+            for name, seconds in report['phases'].items():
+                phases.setdefault(name, []).append(seconds)
+            heavy.update(report['heavy'])
+
+        self.stdout.write(
+            f"runs: {len(walls)}  median {statistics.median(walls) * 1000:.0f} ms  "
+            f"min {min(walls) * 1000:.0f} ms  max {max(walls) * 1000:.0f} ms "
+            f"(whole process, including interpreter start-up)")
+        for name, timings in phases.items():
+            self.stdout.write(
+                f"  {name:<9} {statistics.median(timings) * 1000:7.1f} ms")
+        self.stdout.write(
+            f"heavy modules loaded at start-up: {', '.join(sorted(heavy)) or 'none'}")
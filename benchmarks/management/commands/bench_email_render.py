@@ -0,0 +1,80 @@
+import time
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from benchmarks.seed import seed_bookings, seed_events, seed_payments, seed_users
+from benchmarks.utils import throwaway_database
+from bookings.models import Booking
+from emails.campaigns import attendees, campaign_layouts, campaign_message
+from emails.utils import ticket_fields, ticket_layouts
+
+
+def rate(count, func):
+    start = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - start)
+
+
+class Command(BaseCommand):
+    help = "Compare per-message template renders with per-event layouts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attendees', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        count = options['attendees']
+        with throwaway_database():
+            event = seed_events(1)[0]
+            seed_payments(seed_bookings(event, seed_users(count), count),
+                          with_callback=False)
+            people = list(attendees(event))
+            tickets = [
+                (booking, booking.payment)
+                for booking in Booking.objects.select_related('user', 'event', 'payment')
+            ]
+
+            # Campaign: the whole message, as send_event_campaign builds it
+            def render_each():
+                for email, name in people:
+                    render_to_string('event_campaign.html', {
+                        'event': event, 'kind': 'reminder', 'name': name,
+                        'message': ''})
+
+            def fill_layout():
+                for email, name in people:
+                    campaign_message(event, 'reminder', email, name)
+
+            html_layout, _ = campaign_layouts(event, 'reminder')
+            sample_email, sample_name = people[0]
+            assert html_layout.fill({'name': sample_name}) == render_to_string(
+                'event_campaign.html', {'event': event, 'kind': 'reminder',
+                                        'name': sample_name, 'message': ''})
+
+            self.stdout.write(f"attendees: {len(people)}")
+            self.stdout.write(
+                f"campaign  render_to_string per message: "
+                f"{rate(len(people), render_each):8.0f} bodies/s")
+            self.stdout.write(
+                f"campaign  layout (whole message):       "
+                f"{rate(len(people), fill_layout):8.0f} msgs/s")
+
+            # Ticket email HTML bodies; the QR image and PDF are left out
+            # since they cost the same either way
+            fields = [ticket_fields(booking, payment, 'EV1CODE')
+                      for booking, payment in tickets]
+
+            def render_tickets():
+                for values in fields:
+                    render_to_string('ticket_email.html', {'event': event, **values})
+
+            def fill_tickets():
+                html_layout, text_layout = ticket_layouts(event)
+                for values in fields:
+                    html_layout.fill(values)
+                    text_layout.fill(values)
+
+            self.stdout.write(
+                f"ticket    render_to_string per message: "
+                f"{rate(len(fields), render_tickets):8.0f} bodies/s")
+            self.stdout.write(
+                f"ticket    layout (html + text):         "
+                f"{rate(len(fields), fill_tickets):8.0f} bodies/s")
@@ -0,0 +1,125 @@
+import io
+import re
+import shutil
+import tempfile
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from PIL import Image
+from benchmarks.seed import seed_events
+from benchmarks.utils import throwaway_database
+from events.models import Event
+
+PAGES = ('/', '/admin/login/')
+ASSET = re.compile(r'(?:src|href)="(/(?:static|media)/[^"]+)"')
+MAX_AGE = re.compile(r'max-age=(\d+)')
+# A returning visitor comes back this much later
+REVISIT_AFTER = 60 * 60
+ACCEPT_ENCODING = 'gzip, deflate, br'
+
+CONFIGS = (
+    ('before', {
+        'ROOT_URLCONF': 'benchmarks.baseline_urls',
+        'STORAGES': {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        },
+        'MIDDLEWARE': [name for name in settings.MIDDLEWARE if 'whitenoise' not in name],
+    }),
+    ('after', {}),
+)
+
+
+def poster(seed):
+    """A WebP event poster; noise, so it doesn't compress away"""
+    image = Image.effect_noise((1200, 630), 12 + seed).convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'WEBP', quality=80)
+    return out.getvalue()
+
+
+def response_bytes(response):
+    body = (b''.join(response.streaming_content) if response.streaming
+            else response.content)
+    headers = sum(len(name) + len(value) + 4 for name, value in response.items())
+    return len(body) + headers + len('HTTP/1.1 200 OK\r\n\r\n')
+
+
+class Browser:
+    """Fetches a page and the local static/media files it links to, keeping
+    a cache the way a browser does: fresh entries are not requested again,
+    stale ones are revalidated."""
+
+    def __init__(self):
+        self.client = Client(headers={'accept-encoding': ACCEPT_ENCODING})
+        self.cache = {}
+
+    def load(self, page):
+        response = self.client.get(page)
+        requests, transferred = 1, response_bytes(response)
+        for url in dict.fromkeys(ASSET.findall(response.content.decode())):
+            cached = self.cache.get(url)
+            if cached and cached['max_age'] >= REVISIT_AFTER:
+                continue
+            headers = {}
+            if cached and cached['last_modified']:
+                headers['if-modified-since'] = cached['last_modified']
+            if cached and cached['etag']:
+                headers['if-none-match'] = cached['etag']
+            asset = self.client.get(url, headers=headers)
+            requests += 1
+            transferred += response_bytes(asset)
+            if asset.status_code == 200:
+                max_age = MAX_AGE.search(asset.get('Cache-Control', ''))
+                self.cache[url] = {
+                    'max_age': int(max_age.group(1)) if max_age else 0,
+                    'last_modified': asset.get('Last-Modified'),
+                    'etag': asset.get('ETag'),
+                }
+        return requests, transferred
+
+
+class Command(BaseCommand):
+    help = "Bytes transferred per page load, first and repeat visits, before and after WhiteNoise"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=24)
+        parser.add_argument('--posters', type=int, default=6,
+                            help="Distinct poster images; events share them")
+
+    def handle(self, *args, **options):
+        posters = [poster(i) for i in range(options['posters'])]
+        with throwaway_database():
+            events = seed_events(options['events'])
+            for label, overrides in CONFIGS:
+                static_root = tempfile.mkdtemp()
+                media_root = tempfile.mkdtemp()
+                try:
+                    with override_settings(
+                            DEBUG=False, ALLOWED_HOSTS=['testserver'],
+                            STATIC_ROOT=static_root, MEDIA_ROOT=media_root,
+                            **overrides):
+                        call_command('collectstatic', interactive=False, verbosity=0)
+                        # Each event's organiser uploads its poster
+                        for index, event in enumerate(events):
+                            event.image.save(
+                                'poster.webp',
+                                ContentFile(posters[index % len(posters)]),
+                                save=False)
+                        Event.objects.bulk_update(events, ['image'])
+                        self.report(label)
+                finally:
+                    shutil.rmtree(static_root)
+                    shutil.rmtree(media_root)
+
+    def report(self, label):
+        for page in PAGES:
+            browser = Browser()
+            first = browser.load(page)
+            repeat = browser.load(page)
+            self.stdout.write(
+                f"{label:<6} {page:<14} first visit {first[0]:3} requests "
+                f"{first[1] / 1024:8.1f} KiB   repeat visit {repeat[0]:3} "
+                f"requests {repeat[1] / 1024:8.1f} KiB")
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from benchmarks.seed import seed_bookings, seed_events, seed_payments, seed_users
+from benchmarks.utils import throwaway_database, time_call
+from payments.models import Payment
+
+
+def store_payloads(callbacks):
+    """Attach raw callback bodies wherever the current schema keeps them"""
+    field_names = {field.name for field in Payment._meta.get_fields()}
+    if 'callback_data' in field_names:
+        for payment_id, data in callbacks.items():
+            Payment.objects.filter(pk=payment_id).update(callback_data=data)
+    else:
+        from payments.models import PaymentPayload
+        for payment_id, data in callbacks.items():
+            PaymentPayload.record(payment_id, data)
+
+
+def average_row_bytes(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT * FROM {connection.ops.quote_name(table)}')
+        rows = cursor.fetchall()
+    total = sum(len(value) if isinstance(value, (bytes, memoryview))
+                else len(str(value).encode()) for row in rows for value in row
+                if value is not None)
+    return total / len(rows) if rows else 0
+
+
+class Command(BaseCommand):
+    help = "Measure Payment row size and fetch time on seeded data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=5000)
+        parser.add_argument('--lookups', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            users = seed_users(50)
+            event = seed_events(1)[0]
+            bookings = seed_bookings(event, users, options['payments'])
+            store_payloads(seed_payments(bookings))
+
+            ids = list(Payment.objects.values_list('id', flat=True))
+            ids = ids[:options['lookups']]
+            user = users[0]
+
+            row_bytes = average_row_bytes(Payment._meta.db_table)
+            scan = time_call(lambda: list(Payment.objects.all()))
+            per_user = time_call(
+                lambda: list(Payment.objects.filter(user=user)))
+            lookups = time_call(lambda: [
+                Payment.objects.select_related('booking').get(pk=pk)
+                for pk in ids
+            ], repeat=3)
+
+        self.stdout.write(f"payments:            {len(bookings)}")
+        self.stdout.write(f"avg payment row:     {row_bytes:.0f} bytes")
+        self.stdout.write(f"fetch all:           {scan * 1000:.1f} ms")
+        self.stdout.write(f"fetch one user:      {per_user * 1000:.2f} ms")
+        self.stdout.write(
+            f"get by id (x{len(ids)}):  {lookups * 1000:.1f} ms "
+            f"({lookups / len(ids) * 1e6:.0f} us each)")
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from benchmarks.seed import seed_events
+from benchmarks.utils import throwaway_database
+
+# Middleware is built when the client's handler is, so each configuration
+# gets its own Client
+CONFIGS = (
+    ('off', {'PERF_SAMPLE_RATE': 0, 'PERF_ROUTE_SAMPLE_RATES': {}}),
+    ('on, not sampled', {'PERF_SAMPLE_RATE': 0, 'PERF_ROUTE_SAMPLE_RATES': {'other': 1}}),
+    ('on, every request', {'PERF_SAMPLE_RATE': 1, 'PERF_ROUTE_SAMPLE_RATES': {}}),
+)
+
+
+class Command(BaseCommand):
+    help = "Per-request cost of the timing middleware on the home page"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        with throwaway_database():
+            seed_events(24)
+            for label, overrides in CONFIGS:
+                with override_settings(ALLOWED_HOSTS=['testserver'], **overrides):
+                    client = Client()
+                    response = client.get('/')
+                    start = time.perf_counter()
+                    for _ in range(count):
+                        client.get('/')
+                    elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{label:<18} {elapsed * 1000 / count:6.2f} ms/request  "
+                    f"Server-Timing: {response.get('Server-Timing', '-')}")
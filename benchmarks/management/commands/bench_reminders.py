@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from benchmarks.seed import seed_bookings, seed_events, seed_users
+from benchmarks.utils import throwaway_database
+from emails.bulk import BulkMailer, SendThrottle
+from emails.reminders import run_reminders
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = "Time a reminder run for one large event, then an idempotent re-run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attendees', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        count = options['attendees']
+        with throwaway_database(), override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend'):
+            users = seed_users(count)
+            event = seed_events(1)[0]
+            Event.objects.filter(pk=event.pk).update(
+                start_date=timezone.now() + timedelta(hours=12))
+            seed_bookings(event, users, count)
+
+            for label in ('first run', 're-run'):
+                mailer = BulkMailer(throttle=SendThrottle(rate=0))
+                with CaptureQueriesContext(connection) as queries:
+                    result = run_reminders(
+                        mailer=mailer, batch_size=options['batch_size'])
+                self.stdout.write(
+                    f"{label:<10} {result}  queries: {len(queries)}  "
+                    f"connections: {mailer.connections_opened}")
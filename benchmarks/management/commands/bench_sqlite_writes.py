@@ -0,0 +1,91 @@
+import multiprocessing
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from benchmarks.seed import seed_events, seed_users
+from benchmarks.utils import throwaway_database
+from bookings.models import Booking
+from events.models import Event
+from payments.models import Payment
+
+# Stock SQLite as Django configures it with no OPTIONS
+DEFAULT_OPTIONS = {'init_command': 'PRAGMA journal_mode=DELETE'}
+
+
+def book_tickets(args):
+    """One worker process: booking transactions shaped like process_payment's"""
+    worker, count, event_id, user_id = args
+    committed = locked = 0
+    start = time.perf_counter()
+    for i in range(count):
+        try:
+            with transaction.atomic():
+                # Read first, then write: the pattern that needs a lock upgrade
+                event = Event.objects.get(pk=event_id)
+                booking = Booking.objects.create(
+                    user_id=user_id, event=event, ticket_type='regular',
+                    quantity=1, unit_price=Decimal('500'),
+                    total_price=Decimal('500'), status='pending',
+                    expires_at=timezone.now() + timedelta(minutes=30))
+                Payment.objects.create(
+                    booking=booking, user_id=user_id,
+                    phone_number='254708374149', amount=booking.total_price,
+                    checkout_request_id=f"ws_CO_{worker}_{i}")
+                Event.objects.filter(pk=event_id).update(
+                    tickets_sold=F('tickets_sold') + 1)
+            committed += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+    connection.close()
+    return committed, locked, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Compare booking write throughput from several processes, stock vs tuned SQLite"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--transactions', type=int, default=300,
+                            help="Booking transactions per process")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This benchmark compares SQLite settings")
+        processes, count = options['processes'], options['transactions']
+        configs = (
+            ('stock', DEFAULT_OPTIONS),
+            ('tuned', settings.DATABASES['default']['OPTIONS']),
+        )
+        original = connection.settings_dict['OPTIONS']
+        self.stdout.write(
+            f"{processes} processes x {count} booking transactions")
+        try:
+            for label, db_options in configs:
+                connection.settings_dict['OPTIONS'] = dict(db_options)
+                with throwaway_database():
+                    event = seed_events(1)[0]
+                    user = seed_users(1, prefix='writer')[0]
+                    # Children open their own connections after the fork
+                    connections.close_all()
+                    start = time.perf_counter()
+                    with multiprocessing.get_context('fork').Pool(processes) as pool:
+                        results = pool.map(book_tickets, [
+                            (worker, count, event.id, user.id)
+                            for worker in range(processes)])
+                    elapsed = time.perf_counter() - start
+                    committed = sum(result[0] for result in results)
+                    locked = sum(result[1] for result in results)
+                    sold = Event.objects.get(pk=event.id).tickets_sold
+                self.stdout.write(
+                    f"{label:<6} {committed / elapsed:7.0f} bookings/s  "
+                    f"{committed} committed, {locked} 'database is locked' "
+                    f"errors, tickets_sold={sold}")
+        finally:
+            connection.settings_dict['OPTIONS'] = original
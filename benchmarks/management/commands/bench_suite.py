@@ -0,0 +1,82 @@
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from benchmarks.suite import BENCHMARKS, compare, run
+from benchmarks.utils import git_revision
+
+
+def duration(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return f"{seconds * scale:.2f} {unit}"
+    return f"{seconds * 1e9:.0f} ns"
+
+
+class Command(BaseCommand):
+    help = ("Run the benchmark suite, append the results to the history and "
+            "fail on any benchmark slower than the baseline by more than the threshold")
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', metavar='benchmark',
+                            help=f"Benchmarks to run (default all: {', '.join(BENCHMARKS)})")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Timed batches per benchmark")
+        parser.add_argument('--threshold', type=float, default=0.15,
+                            help="Allowed slowdown of the median, as a fraction")
+        parser.add_argument('--results-dir',
+                            default=os.path.join(settings.BASE_DIR, 'benchmark-results'))
+        parser.add_argument('--save', action='store_true',
+                            help="Make these results the new baseline")
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+        results_dir = options['results_dir']
+        baseline_path = os.path.join(results_dir, 'baseline.json')
+        baseline = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)['results']
+
+        results = {}
+        for name in names:
+            result = results[name] = run(name, options['repeat'])
+            previous = baseline.get(name)
+            change = (f"{result['median'] / previous['median'] - 1:+7.1%}"
+                      if previous else '    new')
+            self.stdout.write(
+                f"{name:<28} median {duration(result['median']):>10}   "
+                f"min {duration(result['min']):>10}   {change}   {BENCHMARKS[name][1]}")
+
+        record = {
+            'recorded_at': timezone.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        os.makedirs(results_dir, exist_ok=True)
+        with open(os.path.join(results_dir, 'history.jsonl'), 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+        if options['save'] or not baseline:
+            # Keep the baseline entries of benchmarks that weren't run
+            record['results'] = {**baseline, **results}
+            with open(baseline_path, 'w') as f:
+                json.dump(record, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f"baseline saved to {baseline_path}")
+            return
+
+        regressions = compare(results, baseline, options['threshold'])
+        for name, (before, after) in regressions.items():
+            self.stderr.write(
+                f"REGRESSION {name}: {duration(before)} -> {duration(after)} "
+                f"({after / before - 1:+.1%}, threshold {options['threshold']:.0%})")
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed")
+        self.stdout.write(self.style.SUCCESS(
+            f"no regressions beyond {options['threshold']:.0%}"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from benchmarks.utils import time_call
+from bookings.ticket_codes import TicketVerifier, event_key, sign_ticket
+
+
+class Command(BaseCommand):
+    help = "Measure ticket code signing and offline verification rates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--codes', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        count = options['codes']
+        event_id = 1
+        key = event_key(event_id)
+        verifier = TicketVerifier({event_id: key})
+
+        elapsed = time_call(
+            lambda: [sign_ticket(booking_id, event_id, 2, key)
+                     for booking_id in range(1, count + 1)])
+        self.stdout.write(f"sign:   {count / elapsed:10.0f} codes/s")
+
+        codes = [sign_ticket(booking_id, event_id, 2, key)
+                 for booking_id in range(1, count + 1)]
+        elapsed = time_call(lambda: [verifier.verify(code) for code in codes])
+        self.stdout.write(f"verify: {count / elapsed:10.0f} codes/s")
+
+        # Forged codes cost the same as genuine ones to reject
+        forged = [code[:-1] + ('A' if code[-1] != 'A' else 'B') for code in codes]
+        assert all(verifier.verify(code)[0] is None for code in forged)
+        elapsed = time_call(lambda: [verifier.verify(code) for code in forged])
+        self.stdout.write(f"reject: {count / elapsed:10.0f} codes/s")
@@ -0,0 +1,50 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from benchmarks.seed import seed_bookings, seed_events, seed_payments, seed_users
+from benchmarks.utils import throwaway_database, time_call
+from bookings.models import Booking
+from emails.pdf import render_tickets, shutdown_pool, start_pool
+from emails.utils import ticket_context
+
+
+class Command(BaseCommand):
+    help = "Measure ticket PDF rendering throughput at 1, 4 and all cores"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=500)
+        parser.add_argument(
+            '--renderer', default=settings.TICKET_PDF_RENDERER,
+            choices=['canvas', 'platypus'])
+        parser.add_argument(
+            '--workers', type=int, nargs='*',
+            help="Pool sizes to try (default: 1 4 and os.cpu_count())")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            users = seed_users(50)
+            event = seed_events(1)[0]
+            seed_payments(seed_bookings(event, users, options['tickets']))
+            contexts = [
+                ticket_context(booking, booking.payment)
+                for booking in Booking.objects.select_related(
+                    'user', 'event', 'payment')
+            ]
+
+        cores = os.cpu_count() or 1
+        pool_sizes = options['workers'] or sorted({1, 4, cores})
+        renderer = options['renderer']
+        self.stdout.write(
+            f"tickets: {len(contexts)}  cores: {cores}  renderer: {renderer}")
+        try:
+            for workers in pool_sizes:
+                start_pool(workers)
+                # Warm the pool so process start-up isn't timed
+                render_tickets(contexts[:workers * 2], renderer=renderer)
+                elapsed = time_call(
+                    lambda: render_tickets(contexts, renderer=renderer),
+                    repeat=3)
+                self.stdout.write(
+                    f"workers={workers:<3} {len(contexts) / elapsed:8.0f} tickets/s")
+        finally:
+            shutdown_pool()
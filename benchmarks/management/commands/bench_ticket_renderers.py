@@ -0,0 +1,57 @@
+import statistics
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from benchmarks.seed import seed_bookings, seed_events, seed_payments, seed_users
+from benchmarks.utils import throwaway_database
+from bookings.models import Booking
+from emails.pdf import RENDERERS
+from emails.utils import ticket_context
+
+
+class Command(BaseCommand):
+    help = "Compare ticket PDF renderers for latency, memory and file size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=300)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            users = seed_users(50)
+            event = seed_events(1)[0]
+            seed_payments(seed_bookings(event, users, options['tickets']))
+            contexts = [
+                ticket_context(booking, booking.payment)
+                for booking in Booking.objects.select_related(
+                    'user', 'event', 'payment')
+            ]
+
+        self.stdout.write(f"tickets: {len(contexts)}")
+        self.stdout.write(
+            f"{'renderer':<10} {'median ms':>10} {'p95 ms':>8} "
+            f"{'tickets/s':>10} {'peak KB':>8} {'avg bytes':>10}")
+        for name, render in RENDERERS.items():
+            render(contexts[0])
+
+            latencies, sizes = [], []
+            for context in contexts:
+                start = time.perf_counter()
+                pdf = render(context)
+                latencies.append(time.perf_counter() - start)
+                sizes.append(len(pdf))
+
+            # Traced separately: tracemalloc slows rendering several times over
+            peaks = []
+            for context in contexts[:20]:
+                tracemalloc.start()
+                render(context)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+            latencies.sort()
+            self.stdout.write(
+                f"{name:<10} {statistics.median(latencies) * 1000:>10.2f} "
+                f"{latencies[int(len(latencies) * 0.95)] * 1000:>8.2f} "
+                f"{len(latencies) / sum(latencies):>10.0f} "
+                f"{statistics.median(peaks) / 1024:>8.0f} "
+                f"{statistics.mean(sizes):>10.0f}")
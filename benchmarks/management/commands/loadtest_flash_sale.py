@@ -0,0 +1,180 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from benchmarks.loadtest import (STEPS, LoadTest, find_anomalies, latency_summary,
+                                  ticket_stock)
+from benchmarks.utils import git_revision
+from events.models import Event, TicketType
+from payments.simulator import DarajaSimulator, parse_result_codes
+
+
+class Command(BaseCommand):
+    help = ("Flash-sale load test: virtual users register, book, pay and wait "
+            "for the M-Pesa callback against a running server. Run it with the "
+            "server's database settings; start the server with "
+            "MPESA_BASE_URL=http://127.0.0.1:8001 so STK pushes reach the "
+            "simulator this command runs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help="Virtual users in flight at once")
+        parser.add_argument('--ramp-seconds', type=float, default=0.0,
+                            help="Spread user arrivals over this many seconds")
+        parser.add_argument('--capacity', type=int, default=500,
+                            help="Tickets on sale (fewer than --users makes it a flash sale)")
+        parser.add_argument('--event', type=int,
+                            help="Book this existing event instead of creating one")
+        parser.add_argument('--report', default='loadtest-report.json')
+        parser.add_argument('--timeout', type=float, default=30.0,
+                            help="Seconds to wait for any one response")
+        parser.add_argument('--status-timeout', type=float, default=120.0,
+                            help="Seconds to wait for a payment's callback")
+        parser.add_argument('--no-simulator', action='store_true',
+                            help="Don't start a Daraja simulator (one is already running)")
+        parser.add_argument('--daraja-port', type=int, default=8001)
+        parser.add_argument('--min-latency', type=float, default=1.0)
+        parser.add_argument('--max-latency', type=float, default=3.0)
+        parser.add_argument('--result-codes', default='0:85,1032:10,1:3,4999:2')
+        parser.add_argument('--duplicate-rate', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        try:
+            result_codes = parse_result_codes(options['result_codes'])
+        except ValueError:
+            raise CommandError(f"Invalid --result-codes: {options['result_codes']}")
+
+        if options['event']:
+            event = Event.objects.filter(id=options['event']).first()
+            if event is None:
+                raise CommandError(f"No event with id {options['event']}")
+        else:
+            event = self.create_event(options['capacity'])
+        run_id = f"lt{uuid.uuid4().hex[:8]}"
+
+        simulator = None
+        if not options['no_simulator']:
+            simulator = DarajaSimulator(
+                min_latency=options['min_latency'],
+                max_latency=options['max_latency'],
+                result_codes=result_codes,
+                duplicate_rate=options['duplicate_rate'],
+                callback_url=f"{base_url}/payments/callback/",
+                seed=options['seed'],
+            )
+        test = LoadTest(base_url, event.id, run_id, timeout=options['timeout'],
+                        status_timeout=options['status_timeout'])
+
+        self.stdout.write(
+            f"{options['users']} users, {options['concurrency']} at a time, "
+            f"booking event {event.id} ({event.total_capacity} tickets) at {base_url}")
+        stock = ticket_stock(event)
+        started_at = timezone.now()
+        elapsed = asyncio.run(self.run(test, simulator, options))
+
+        report = {
+            'config': {
+                'base_url': base_url,
+                'users': options['users'],
+                'concurrency': options['concurrency'],
+                'ramp_seconds': options['ramp_seconds'],
+                'event': event.id,
+                'capacity': event.total_capacity,
+                'result_codes': options['result_codes'] if simulator else None,
+                'duplicate_rate': options['duplicate_rate'] if simulator else None,
+                'callback_latency': ([options['min_latency'], options['max_latency']]
+                                     if simulator else None),
+            },
+            'run_id': run_id,
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'elapsed_seconds': round(elapsed, 2),
+            'throughput': {
+                'requests_per_second': round(test.requests / elapsed, 1),
+                'users_per_second': round(options['users'] / elapsed, 1),
+                'confirmed_per_second': round(test.outcomes['confirmed'] / elapsed, 1),
+            },
+            'steps': {step: latency_summary(test.timings[step], test.step_errors[step])
+                      for step in STEPS},
+            'outcomes': dict(sorted(test.outcomes.items())),
+            'errors': dict(test.errors.most_common(10)),
+            'anomalies': find_anomalies(event, run_id, test.seen_success, stock),
+            'simulator': simulator.stats() if simulator else None,
+        }
+        with open(options['report'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        self.print_summary(report, options['report'])
+        if simulator and simulator.pushes == 0 and test.timings['create_booking']:
+            self.stderr.write(
+                "The simulator received no STK pushes; start the server with "
+                f"MPESA_BASE_URL=http://127.0.0.1:{options['daraja_port']}")
+
+    def create_event(self, capacity):
+        now = timezone.now()
+        event = Event.objects.create(
+            title=f"Flash sale {now:%Y-%m-%d %H:%M}",
+            description="Load test event",
+            short_description="Load test event",
+            start_date=now + timedelta(days=14),
+            end_date=now + timedelta(days=14, hours=4),
+            venue="Load Test Arena",
+            city="Nairobi",
+            total_capacity=capacity,
+        )
+        TicketType.objects.create(event=event, category='regular',
+                                  price=Decimal('100'), quantity_available=capacity)
+        return event
+
+    async def run(self, test, simulator, options):
+        server = None
+        if simulator is not None:
+            server = asyncio.create_task(simulator.serve(port=options['daraja_port']))
+            await asyncio.sleep(0.1)
+            if server.done():
+                # Usually the port is taken
+                server.result()
+        try:
+            elapsed = await test.run(options['users'], options['concurrency'],
+                                     options['ramp_seconds'])
+            # Let duplicate callbacks land before the database is checked
+            deadline = time.monotonic() + options['max_latency'] * 2 + 5
+            while (simulator is not None and simulator.dispatcher.pending
+                   and time.monotonic() < deadline):
+                await asyncio.sleep(0.2)
+            return elapsed
+        finally:
+            if server is not None:
+                server.cancel()
+
+    def print_summary(self, report, path):
+        self.stdout.write(
+            f"{'step':<16}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'max ms':>10}")
+        for step, summary in report['steps'].items():
+            self.stdout.write(
+                f"{step:<16}{summary['count']:>7}{summary['errors']:>8}"
+                + ''.join(f"{summary.get(name, '-'):>10}"
+                          for name in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms')))
+        throughput = report['throughput']
+        self.stdout.write(
+            f"{report['elapsed_seconds']} s, {throughput['requests_per_second']} "
+            f"requests/s, {throughput['confirmed_per_second']} confirmed/s")
+        self.stdout.write(f"outcomes: {report['outcomes']}")
+        for error, count in report['errors'].items():
+            self.stdout.write(f"  {count} x {error}")
+        found = {name: value for name, value in report['anomalies'].items()
+                 if value and name != 'tickets_sold'}
+        if found:
+            self.stdout.write(self.style.ERROR(f"anomalies: {found}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("no anomalies"))
+        self.stdout.write(f"report written to {path}")
@@ -0,0 +1,35 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from benchmarks.startup import parse_importtime, run_startup
+
+
+class Command(BaseCommand):
+    help = "Show which imports a cold start spends its time on (python -X importtime)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15)
+
+    def handle(self, *args, **options):
+        imports = parse_importtime(run_startup('-X', 'importtime').stderr)
+        top = options['top']
+
+        packages = defaultdict(int)
+        for self_us, _, _, module in imports:
+            packages[module.split('.')[0]] += self_us
+        total = sum(packages.values())
+        self.stdout.write(
+            f"{len(imports)} modules imported in {total / 1000:.0f} ms "
+            f"(own time, excluding interpreter start-up)")
+
+        self.stdout.write("\nBy top-level package:")
+        for package, self_us in sorted(
+                packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(
+                f"  {self_us / 1000:8.1f} ms  {100 * self_us / total:5.1f}%  {package}")
+
+        # Imports made directly by the project or Django, with everything
+        # they pulled in: where a lazy import would help
+        self.stdout.write("\nSlowest imports including their dependencies:")
+        for _, cumulative_us, depth, module in sorted(
+                imports, key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  {module}")
@@ -0,0 +1,37 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database over its SQLite replicas, to try "
+            "the replica router locally (there is no replication to SQLite)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep copying every this many seconds, "
+                                 "which stands in for replication lag")
+
+    def handle(self, *args, **options):
+        replicas = [alias for alias in settings.REPLICA_DATABASES
+                    if connections[alias].vendor == 'sqlite']
+        if not replicas or connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError(
+                "Set DATABASE_URL and DATABASE_REPLICA_URLS to SQLite files")
+        while True:
+            primary = connections[DEFAULT_DB_ALIAS]
+            primary.ensure_connection()
+            for alias in replicas:
+                connections[alias].close()
+                replica = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    primary.connection.backup(replica)
+                finally:
+                    replica.close()
+                self.stdout.write(f"copied {primary.settings_dict['NAME']} "
+                                  f"to {alias}")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
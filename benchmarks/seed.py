@@ -0,0 +1,111 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.utils import timezone
+from bookings.models import Booking
+from events.models import Event, TicketType
+from payments.models import Payment
+
+# Deterministic seed data for benchmarks. Everything is bulk-created so
+# seeding stays fast even at tens of thousands of rows.
+
+
+def sample_callback(checkout_request_id, receipt, amount, phone):
+    """A successful stkCallback body as Daraja sends it"""
+    return {
+        "Body": {
+            "stkCallback": {
+                "MerchantRequestID": "29115-34620561-1",
+                "CheckoutRequestID": checkout_request_id,
+                "ResultCode": 0,
+                "ResultDesc": "The service request is processed successfully.",
+                "CallbackMetadata": {
+                    "Item": [
+                        {"Name": "Amount", "Value": float(amount)},
+                        {"Name": "MpesaReceiptNumber", "Value": receipt},
+                        {"Name": "Balance"},
+                        {"Name": "TransactionDate", "Value": 20251130171200},
+                        {"Name": "PhoneNumber", "Value": int(phone)},
+                    ]
+                },
+            }
+        }
+    }
+
+
+def seed_users(count, prefix='user'):
+    User.objects.bulk_create([
+        User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com",
+             first_name='Bench', last_name=str(i))
+        for i in range(count)
+    ], batch_size=1000)
+    return list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+
+def seed_events(count, ticket_types=('regular', 'vip')):
+    now = timezone.now()
+    Event.objects.bulk_create([
+        Event(
+            title=f"Event {i}",
+            description="Benchmark event " * 20,
+            short_description=f"Benchmark event {i}",
+            start_date=now + timedelta(days=7 + i % 60),
+            end_date=now + timedelta(days=7 + i % 60, hours=4),
+            venue=f"Venue {i % 25}",
+            city="Nairobi",
+            total_capacity=100000,
+            is_featured=i % 10 == 0,
+            is_coming_soon=i % 17 == 0,
+        )
+        for i in range(count)
+    ], batch_size=1000)
+    events = list(Event.objects.order_by('id'))
+    TicketType.objects.bulk_create([
+        TicketType(event=event, category=category,
+                   price=Decimal('500') * (position + 1),
+                   quantity_available=50000)
+        for event in events
+        for position, category in enumerate(ticket_types)
+    ], batch_size=1000)
+    return events
+
+
+def seed_bookings(event, users, count, status='confirmed'):
+    now = timezone.now()
+    bookings = [
+        Booking(
+            user=users[i % len(users)], event=event, ticket_type='regular',
+            quantity=1 + i % 3, unit_price=Decimal('500'),
+            total_price=Decimal('500') * (1 + i % 3), status=status,
+            expires_at=now + timedelta(minutes=30),
+        )
+        for i in range(count)
+    ]
+    Booking.objects.bulk_create(bookings, batch_size=1000)
+    return list(Booking.objects.filter(event=event).order_by('id'))
+
+
+def seed_payments(bookings, status='successful', with_callback=True):
+    """Create one payment per booking. Returns {payment_id: callback_body}."""
+    rng = random.Random(42)
+    payments = []
+    for booking in bookings:
+        receipt = ''.join(rng.choices('ABCDEFGHJKLMNPQRSTUVWXYZ0123456789', k=10))
+        payments.append(Payment(
+            booking=booking, user_id=booking.user_id,
+            phone_number='254708374149', amount=booking.total_price,
+            status=status, merchant_request_id='29115-34620561-1',
+            checkout_request_id=f"ws_CO_{booking.id:020d}",
+            mpesa_receipt_number=receipt, transaction_date=timezone.now(),
+            callback_received=with_callback, result_code=0,
+            result_desc="The service request is processed successfully.",
+        ))
+    Payment.objects.bulk_create(payments, batch_size=1000)
+    created = Payment.objects.filter(booking__in=bookings)
+    return {
+        payment.id: sample_callback(payment.checkout_request_id,
+                                    payment.mpesa_receipt_number,
+                                    payment.amount, payment.phone_number)
+        for payment in created
+    } if with_callback else {}
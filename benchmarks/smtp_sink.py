@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+# Minimal SMTP server that accepts and discards mail, for email benchmarks.
+#
+# connect_delay is spent before the greeting on every new connection to
+# stand in for TCP setup, STARTTLS and AUTH against a real provider, which
+# is the cost connection reuse saves.
+
+
+class SmtpSink:
+
+    def __init__(self, connect_delay=0.05):
+        self.connect_delay = connect_delay
+        self.connections = 0
+        self.messages = 0
+        self.loop = None
+        self.port = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        await asyncio.sleep(self.connect_delay)
+        writer.write(b"220 sink ESMTP\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line[:4].upper()
+                if command in (b'EHLO', b'HELO'):
+                    writer.write(b"250-sink\r\n250 8BITMIME\r\n")
+                elif command == b'DATA':
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await reader.readuntil(b"\r\n.\r\n")
+                    self.messages += 1
+                    writer.write(b"250 OK queued\r\n")
+                elif command == b'QUIT':
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self, host='127.0.0.1'):
+        """Serve on a background thread. Returns the port."""
+        ready = threading.Event()
+
+        async def serve():
+            server = await asyncio.start_server(self.handle, host, 0)
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            async with server:
+                await server.serve_forever()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.loop.run_until_complete(serve())
+            except asyncio.CancelledError:
+                pass
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self.port
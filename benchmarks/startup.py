@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+from django.conf import settings
+
+# Cold-start measurements: each run is a fresh interpreter doing what a
+# serverless instance does before its first response, i.e. load settings,
+# import eventify.wsgi (app set-up and the handler) and import the URLconf
+# (which imports every view). Phase timings are reported by the child as JSON.
+
+# Only needed once a page renders a PDF or starts a payment
+HEAVY_MODULES = ('reportlab', 'PIL', 'requests')
+
+STARTUP_SCRIPT = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + """
+import time
+start = time.perf_counter()
+import json, os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eventify.settings')
+phases = {}
+from django.conf import settings
+settings.INSTALLED_APPS
+phases['settings'] = time.perf_counter()
+from eventify.wsgi import application
+phases['wsgi'] = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+phases['urls'] = time.perf_counter()
+previous, timings = start, {}
+for name, moment in phases.items():
+    timings[name] = moment - previous
+    previous = moment
+heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+print(json.dumps({'phases': timings, 'heavy': heavy}))
+"""
+
+
+def run_startup(*interpreter_args):
+    """Run the startup script in a fresh interpreter. Returns CompletedProcess."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'eventify.settings')
+    return subprocess.run(
+        [sys.executable, *interpreter_args, '-c', STARTUP_SCRIPT],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        check=True)
+
+
+def startup_report(completed):
+    """The child's report: {'phases': {phase: seconds}, 'heavy': [module, ...]}"""
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def parse_importtime(stderr):
+    """(self_us, cumulative_us, depth, module) for each `-X importtime` line"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return imports
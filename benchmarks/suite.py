@@ -0,0 +1,224 @@
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from unittest import mock
+from django.test import Client, override_settings
+from benchmarks.seed import (sample_callback, seed_bookings, seed_events,
+                             seed_payments, seed_users)
+from benchmarks.utils import throwaway_database
+from bookings.models import Booking
+from payments.models import Payment
+
+# Regression suite: the hot paths, each timed on its own seeded scratch
+# database.
+#
+# A benchmark runs `repeat` batches and returns the time per operation of
+# each batch; the suite keeps the median and the fastest. Batches that
+# change data (bookings, callbacks, status checks) get fresh rows each time
+# so every batch does the same work. Results are compared with a saved
+# baseline by bench_suite, which fails when a median gets slower by more
+# than the threshold.
+
+BENCHMARKS = {}
+
+
+def benchmark(name, description):
+    def register(func):
+        BENCHMARKS[name] = (func, description)
+        return func
+    return register
+
+
+def per_operation(func, operations):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) / operations
+
+
+@contextmanager
+def isolated():
+    """A scratch database, with metrics, cached PDFs and the payment views'
+    print() output kept out of the real directories and the terminal"""
+    scratch = tempfile.mkdtemp()
+    try:
+        with throwaway_database(), override_settings(
+                DEBUG=False, ALLOWED_HOSTS=['testserver'],
+                MEDIA_ROOT=os.path.join(scratch, 'media'),
+                TICKET_PDF_CACHE_DIR=os.path.join(scratch, 'tickets'),
+                METRICS_DIR=os.path.join(scratch, 'metrics')), \
+                open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            yield
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def event_list(count, repeat):
+    with isolated():
+        seed_events(count)
+        client = Client()
+        client.get('/')
+        return [per_operation(lambda: client.get('/'), 1) for _ in range(repeat)]
+
+
+@benchmark('event_list_100', "Home page with 100 events")
+def event_list_100(repeat):
+    return event_list(100, repeat)
+
+
+@benchmark('event_list_1k', "Home page with 1,000 events")
+def event_list_1k(repeat):
+    return event_list(1000, repeat)
+
+
+@benchmark('event_list_10k', "Home page with 10,000 events")
+def event_list_10k(repeat):
+    return event_list(10000, repeat)
+
+
+@benchmark('create_booking', "POST /bookings/create/ (one booking)")
+def create_booking(repeat, batch=100):
+    with isolated():
+        event = seed_events(1)[0]
+        client = Client()
+        client.force_login(seed_users(1, prefix='booker')[0])
+        path = f'/bookings/create/{event.id}/'
+        form = {'ticket_type': 'regular', 'quantity': '1'}
+        client.post(path, form)
+
+        def book():
+            for _ in range(batch):
+                client.post(path, form)
+        return [per_operation(book, batch) for _ in range(repeat)]
+
+
+@benchmark('mpesa_callback', "POST /payments/callback/ (successful payment)")
+def mpesa_callback(repeat, batch=200):
+    with isolated():
+        event = seed_events(1)[0]
+        users = seed_users(50)
+        client = Client()
+        bodies = []
+        for _ in range(repeat + 1):
+            bookings = seed_bookings(event, users, batch, status='pending')[-batch:]
+            seed_payments(bookings, status='pending', with_callback=False)
+            bodies.append([
+                json.dumps(sample_callback(
+                    payment.checkout_request_id, f"BENCH{payment.id:05d}",
+                    payment.amount, payment.phone_number))
+                for payment in Payment.objects.filter(booking__in=bookings)
+            ])
+
+        def deliver(batch_bodies):
+            for body in batch_bodies:
+                client.post('/payments/callback/', body,
+                            content_type='application/json')
+        # The first batch warms up
+        deliver(bodies[0])
+        return [per_operation(lambda: deliver(batch_bodies), batch)
+                for batch_bodies in bodies[1:]]
+
+
+@benchmark('check_mpesa_status', "Payment.check_mpesa_status, gateway stubbed")
+def check_mpesa_status(repeat, batch=200):
+    def query_result(gateway, checkout_request_id):
+        data = {
+            'ResponseCode': '0', 'MerchantRequestID': '29115-34620561-1',
+            'CheckoutRequestID': checkout_request_id, 'ResultCode': '0',
+            'ResultDesc': "The service request is processed successfully.",
+        }
+        return {'status': 'successful', 'message': data['ResultDesc'],
+                'data': data}, None
+
+    with isolated(), mock.patch(
+            'payments.mpesa_utils.MpesaGateway.check_transaction_status',
+            query_result):
+        event = seed_events(1)[0]
+        users = seed_users(50)
+        batches = []
+        for _ in range(repeat + 1):
+            bookings = seed_bookings(event, users, batch, status='pending')[-batch:]
+            seed_payments(bookings, status='pending', with_callback=False)
+            batches.append(list(Payment.objects.filter(booking__in=bookings)))
+
+        def check(payments):
+            for payment in payments:
+                payment.check_mpesa_status()
+        check(batches[0])
+        return [per_operation(lambda: check(payments), batch)
+                for payments in batches[1:]]
+
+
+def ticket_pdfs(repeat, batch, cached):
+    from emails.utils import generate_ticket_pdf
+    with isolated():
+        event = seed_events(1)[0]
+        seed_payments(seed_bookings(event, seed_users(50), batch * (repeat + 1)))
+        tickets = [(booking, booking.payment) for booking in
+                   Booking.objects.select_related('user', 'event', 'payment')]
+        batches = [tickets[i * batch:(i + 1) * batch] for i in range(repeat + 1)]
+
+        def render(chunk):
+            for booking, payment in chunk:
+                generate_ticket_pdf(booking, payment)
+        # Warm-up, and with cached=True fill the cache for every batch
+        render(tickets if cached else batches[0])
+        return [per_operation(lambda: render(chunk), batch)
+                for chunk in batches[1:]]
+
+
+@benchmark('generate_ticket_pdf', "generate_ticket_pdf, rendered (cache miss)")
+def generate_ticket_pdf(repeat, batch=50):
+    return ticket_pdfs(repeat, batch, cached=False)
+
+
+@benchmark('generate_ticket_pdf_cached', "generate_ticket_pdf, cache hit")
+def generate_ticket_pdf_cached(repeat, batch=200):
+    return ticket_pdfs(repeat, batch, cached=True)
+
+
+def phone_inputs(count):
+    """Phone numbers the way people type them, with some that are invalid"""
+    rng = random.Random(3)
+    shapes = ('07{} {} {}', '+2547{}{}{}', '2541{}{}{}', '7{}{}{}',
+              '07{}-{}-{}', '0{}{}{}', '')
+    inputs = []
+    for _ in range(count):
+        shape = rng.choice(shapes)
+        inputs.append(shape.format(rng.randint(10, 99), rng.randint(100, 999),
+                                   rng.randint(100, 999)))
+    return inputs
+
+
+@benchmark('format_phone_number', "format_phone_number over 1M inputs")
+def format_phone_number(repeat, count=1000000):
+    from emails.utils import format_phone_number
+    inputs = phone_inputs(count)
+
+    def format_all():
+        for phone in inputs:
+            format_phone_number(phone)
+    return [per_operation(format_all, count) for _ in range(repeat)]
+
+
+def run(name, repeat):
+    """Median and fastest seconds per operation"""
+    func, _ = BENCHMARKS[name]
+    timings = func(repeat)
+    return {'median': statistics.median(timings), 'min': min(timings),
+            'runs': len(timings)}
+
+
+def compare(results, baseline, threshold):
+    """Benchmarks whose median is more than `threshold` (a fraction) slower
+    than the baseline's: {name: (baseline median, current median)}"""
+    regressions = {}
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous and result['median'] > previous['median'] * (1 + threshold):
+            regressions[name] = (previous['median'], result['median'])
+    return regressions
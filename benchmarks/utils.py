@@ -0,0 +1,56 @@
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+
+
+@contextmanager
+def throwaway_database():
+    """Run a benchmark against a freshly migrated scratch database.
+
+    SQLite scratch databases are real files (not :memory:) so timings
+    include page reads like the production database would.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    scratch_file = None
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        fd, scratch_file = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        test_settings['NAME'] = scratch_file
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if scratch_file:
+            test_settings['NAME'] = None
+            # WAL mode leaves -wal and -shm files next to the database
+            for path in (scratch_file, f"{scratch_file}-wal", f"{scratch_file}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def time_call(func, repeat=5):
+    """Median wall time of func() in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def git_revision():
+    """Short hash of the checked-out commit, for results files"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -1,13 +1,22 @@
 from django.contrib import admin
+from eventify.db_router import ReplicaAdminMixin
+from . import inventory
 from .models import Booking
 
-# Register your models here.
+
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'event', 'ticket_type', 'quantity', 'total_price', 'status', 'created_at']
     list_filter = ['status', 'ticket_type', 'created_at']
     search_fields = ['user__username', 'event__title']
-    readonly_fields = ['created_at', 'updated_at', 'expires_at']
+    # Status changes move ticket stock, so they go through the cancel action
+    readonly_fields = ['status', 'created_at', 'updated_at', 'expires_at']
+    actions = ['cancel_bookings']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user', 'event')
\ No newline at end of file
+        return super().get_queryset(request).select_related('user', 'event')
+
+    @admin.action(description="Cancel selected bookings and return their tickets")
+    def cancel_bookings(self, request, queryset):
+        count = inventory.cancel(queryset.values_list('pk', flat=True))
+        self.message_user(request, f"{count} booking(s) cancelled.")
\ No newline at end of file
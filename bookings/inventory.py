@@ -0,0 +1,91 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from eventify import metrics
+from events.models import Event, TicketType
+from .models import Booking
+
+# Ticket stock.
+#
+# TicketType.quantity_available is what is left to sell and
+# Event.tickets_sold is what pending and confirmed bookings hold. A booking
+# takes its tickets when it is created, with a conditional UPDATE that only
+# succeeds if enough are left, so concurrent buyers can never take the same
+# tickets. On Postgres the ticket type row is also locked FOR UPDATE while
+# the booking is written, so the stock and the booking commit together.
+#
+# Tickets go back when a booking is cancelled or expires unpaid. Expiry runs
+# from `manage.py expire_bookings` where there is a scheduler, and otherwise
+# whenever a buyer finds an event or ticket type short of stock.
+
+# Booking statuses that hold tickets
+HOLDING_STATUSES = ('pending', 'confirmed')
+
+
+def reserve(ticket_type, quantity):
+    """Take `quantity` tickets of a type. Call inside transaction.atomic().
+    Returns False, taking nothing, if fewer are left."""
+    # Holds other buyers of this ticket type until the booking commits
+    TicketType.objects.select_for_update().filter(pk=ticket_type.pk).first()
+    if not TicketType.objects.filter(
+            pk=ticket_type.pk, quantity_available__gte=quantity).update(
+                quantity_available=F('quantity_available') - quantity):
+        return False
+    Event.objects.filter(pk=ticket_type.event_id).update(
+        tickets_sold=F('tickets_sold') + quantity)
+    return True
+
+
+def _release(bookings, from_statuses, status, now):
+    """Move each of `bookings` still in `from_statuses` to `status` and put
+    its tickets back. Returns the number released."""
+    if connection.features.has_select_for_update_skip_locked:
+        # Concurrent sweeps each take different bookings
+        bookings = bookings.select_for_update(skip_locked=True, of=('self',))
+    released = 0
+    for pk, event_id, category, quantity in bookings.values_list(
+            'pk', 'event_id', 'ticket_type', 'quantity'):
+        # Conditional, so a booking that moved meanwhile keeps its tickets
+        if Booking.objects.filter(pk=pk, status__in=from_statuses).exclude(
+                payment__status='pending').update(status=status, updated_at=now):
+            TicketType.objects.filter(event_id=event_id, category=category).update(
+                quantity_available=F('quantity_available') + quantity)
+            Event.objects.filter(pk=event_id).update(
+                tickets_sold=F('tickets_sold') - quantity)
+            released += 1
+    return released
+
+
+def cancel(booking_ids, now=None):
+    """Cancel pending or confirmed bookings and return their tickets to
+    stock. Returns the number cancelled.
+
+    Bookings with a payment still in progress are left alone.
+    """
+    now = now or timezone.now()
+    bookings = Booking.objects.filter(
+        pk__in=list(booking_ids), status__in=HOLDING_STATUSES).exclude(
+            payment__status='pending')
+    with transaction.atomic():
+        return _release(bookings, HOLDING_STATUSES, 'cancelled', now)
+
+
+def release_expired(now=None, event=None, category=None):
+    """Expire unpaid pending bookings past their expiry, for one event (and
+    ticket category) or all of them, and return their tickets to stock.
+    Returns the number of bookings expired.
+
+    Bookings with a payment still in progress are left for the callback.
+    """
+    now = now or timezone.now()
+    due = Booking.objects.filter(status='pending', expires_at__lt=now).exclude(
+        payment__status='pending')
+    if event is not None:
+        due = due.filter(event=event)
+    if category is not None:
+        due = due.filter(ticket_type=category)
+    with transaction.atomic():
+        expired = _release(due, ('pending',), 'expired', now)
+    if expired:
+        metrics.bookings_expired.inc(expired)
+    return expired
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from bookings.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = ("Mark unpaid pending bookings past their expiry as expired and "
+            "return their tickets to stock (run every few minutes)")
+
+    def handle(self, *args, **options):
+        expired = release_expired()
+        self.stdout.write(f"{expired} booking(s) expired")
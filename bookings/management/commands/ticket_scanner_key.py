@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from bookings.ticket_codes import TicketVerifier, event_key
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = "Print the key a gate scanner needs to verify one event's ticket codes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int)
+        parser.add_argument(
+            '--check', metavar='CODE',
+            help="Verify a ticket code against this event's key instead")
+
+    def handle(self, *args, **options):
+        event_id = options['event_id']
+        if not Event.objects.filter(pk=event_id).exists():
+            raise CommandError(f"Event #{event_id} does not exist")
+
+        key = event_key(event_id)
+        if options['check']:
+            ticket, error = TicketVerifier({event_id: key}).verify(options['check'])
+            if error:
+                raise CommandError(error)
+            self.stdout.write(
+                f"Valid: booking #{ticket.booking_id}, {ticket.quantity} ticket(s)")
+            return
+        self.stdout.write(key.hex())
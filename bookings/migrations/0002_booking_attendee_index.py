@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+        ('events', '0002_alter_tickettype_category'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['event', 'status', 'user'], name='bookings_bo_event_i_2f8bcb_idx'),
+        ),
+    ]
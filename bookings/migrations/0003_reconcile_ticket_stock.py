@@ -0,0 +1,60 @@
+from django.db import migrations
+from django.db.models import Sum
+
+# quantity_available used to be the number of tickets on offer, never
+# decremented, and tickets_sold was never updated. Bookings now take their
+# tickets from stock, so take out what pending and confirmed bookings
+# already hold.
+
+HOLDING_STATUSES = ('pending', 'confirmed')
+
+
+def held_tickets(Booking):
+    """{(event_id, category): tickets held by pending and confirmed bookings}"""
+    return {
+        (row['event_id'], row['ticket_type']): row['held']
+        for row in Booking.objects.filter(status__in=HOLDING_STATUSES).values(
+            'event_id', 'ticket_type').annotate(held=Sum('quantity'))
+    }
+
+
+def take_held_tickets(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    Event = apps.get_model('events', 'Event')
+    TicketType = apps.get_model('events', 'TicketType')
+    held = held_tickets(Booking)
+    for ticket_type in TicketType.objects.all():
+        taken = held.get((ticket_type.event_id, ticket_type.category), 0)
+        if taken:
+            ticket_type.quantity_available = max(0, ticket_type.quantity_available - taken)
+            ticket_type.save(update_fields=['quantity_available'])
+    sold = {}
+    for (event_id, _), quantity in held.items():
+        sold[event_id] = sold.get(event_id, 0) + quantity
+    for event_id, quantity in sold.items():
+        Event.objects.filter(pk=event_id).update(tickets_sold=quantity)
+
+
+def return_held_tickets(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    Event = apps.get_model('events', 'Event')
+    TicketType = apps.get_model('events', 'TicketType')
+    held = held_tickets(Booking)
+    for ticket_type in TicketType.objects.all():
+        taken = held.get((ticket_type.event_id, ticket_type.category), 0)
+        if taken:
+            ticket_type.quantity_available += taken
+            ticket_type.save(update_fields=['quantity_available'])
+    Event.objects.update(tickets_sold=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_booking_attendee_index'),
+        ('events', '0002_alter_tickettype_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(take_held_tickets, return_held_tickets),
+    ]
@@ -38,6 +38,10 @@ class Booking(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Attendee lists: confirmed bookings of an event, walked by user
+            models.Index(fields=['event', 'status', 'user']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.event.title} - {self.quantity}x {self.ticket_type}"
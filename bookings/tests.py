@@ -1,3 +1,110 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from events.models import Event, TicketType
+from payments.models import Payment
+from .inventory import cancel, release_expired
+from .models import Booking
+from .ticket_codes import TicketVerifier, event_key, sign_ticket
 
-# Create your tests here.
+
+class TicketCodeTests(TestCase):
+    def setUp(self):
+        self.key = event_key(7)
+        self.verifier = TicketVerifier({7: self.key})
+        self.code = sign_ticket(42, 7, 2, self.key)
+
+    def test_genuine_code(self):
+        ticket, error = self.verifier.verify(self.code.lower())
+        self.assertIsNone(error)
+        self.assertEqual(tuple(ticket), (42, 7, 2))
+
+    def test_tampered_codes_are_rejected(self):
+        # Every single-character change, e.g. a booking id or quantity edited
+        for position in range(3, len(self.code)):
+            replacement = 'A' if self.code[position] != 'A' else 'B'
+            tampered = self.code[:position] + replacement + self.code[position + 1:]
+            with self.subTest(position=position):
+                ticket, error = self.verifier.verify(tampered)
+                self.assertIsNone(ticket)
+                self.assertIsNotNone(error)
+
+    def test_codes_signed_with_another_key_are_rejected(self):
+        forged = sign_ticket(42, 7, 2, event_key(8))
+        self.assertEqual(self.verifier.verify(forged), (None, "Invalid signature"))
+        other_event = sign_ticket(42, 8, 2, event_key(8))
+        self.assertEqual(self.verifier.verify(other_event),
+                         (None, "Ticket is for a different event"))
+        self.assertEqual(self.verifier.verify('EV1' + self.code[3:-1]),
+                         (None, "Not an EVENTIFY ticket"))
+
+
+class TicketStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + timedelta(days=7)
+        cls.event = Event.objects.create(
+            title="Test Event", description="Test event", venue="KICC",
+            start_date=start, end_date=start + timedelta(hours=4),
+            total_capacity=3)
+        TicketType.objects.create(
+            event=cls.event, category='regular', price=Decimal('500'),
+            quantity_available=3)
+        cls.users = [User.objects.create_user(f'buyer{i}') for i in range(2)]
+
+    def book(self, user, quantity):
+        self.client.force_login(user)
+        return self.client.post(
+            reverse('create_booking', args=[self.event.id]),
+            {'ticket_type': 'regular', 'quantity': str(quantity)})
+
+    def stock(self):
+        self.event.refresh_from_db()
+        return (TicketType.objects.get(event=self.event).quantity_available,
+                self.event.tickets_sold)
+
+    def test_booking_takes_tickets_from_stock(self):
+        self.assertEqual(self.book(self.users[0], 2).status_code, 302)
+        self.assertEqual(self.stock(), (1, 2))
+
+    def test_no_booking_beyond_stock(self):
+        self.book(self.users[0], 2)
+        response = self.book(self.users[1], 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Booking.objects.filter(user=self.users[1]).count(), 0)
+        self.assertEqual(self.stock(), (1, 2))
+
+    def test_expired_bookings_return_their_tickets(self):
+        self.book(self.users[0], 2)
+        self.book(self.users[1], 1)
+        Booking.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        # A payment in progress keeps its booking
+        paying = Booking.objects.get(user=self.users[1])
+        Payment.objects.create(
+            booking=paying, user=self.users[1], phone_number='254708374149',
+            amount=paying.total_price)
+
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(self.stock(), (2, 1))
+        self.assertEqual(Booking.objects.get(user=self.users[0]).status, 'expired')
+        self.assertEqual(paying.status, 'pending')
+        self.assertEqual(release_expired(), 0)
+
+    def test_abandoned_bookings_are_released_when_stock_runs_out(self):
+        self.book(self.users[0], 3)
+        Booking.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.book(self.users[1], 2).status_code, 302)
+        self.assertEqual(Booking.objects.get(user=self.users[0]).status, 'expired')
+        self.assertEqual(self.stock(), (1, 2))
+
+    def test_cancelled_bookings_return_their_tickets(self):
+        self.book(self.users[0], 2)
+        booking = Booking.objects.get(user=self.users[0])
+        Booking.objects.filter(pk=booking.pk).update(status='confirmed')
+
+        self.assertEqual(cancel([booking.pk]), 1)
+        self.assertEqual(cancel([booking.pk]), 0)
+        self.assertEqual(self.stock(), (3, 0))
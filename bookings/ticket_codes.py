@@ -0,0 +1,79 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+from collections import namedtuple
+from django.conf import settings
+
+# Signed ticket codes for the QR code on each ticket.
+#
+# A code is "EV1" followed by the base32 encoding of
+#   booking id (4 bytes) | event id (4 bytes) | quantity (2 bytes) | HMAC (10 bytes)
+# 35 characters from the QR alphanumeric set, so the QR stays small.
+#
+# Each event gets its own key derived from TICKET_SIGNING_KEY, so a gate
+# scanner is given only the key for its event (`manage.py ticket_scanner_key`)
+# and can verify codes without the database. TicketVerifier itself needs no
+# Django and runs at hundreds of thousands of checks per second.
+
+CODE_PREFIX = 'EV1'
+PAYLOAD = struct.Struct('>IIH')
+SIGNATURE_BYTES = 10
+CODE_LENGTH = len(CODE_PREFIX) + len(base64.b32encode(
+    bytes(PAYLOAD.size + SIGNATURE_BYTES)).rstrip(b'='))
+
+TicketCode = namedtuple('TicketCode', ['booking_id', 'event_id', 'quantity'])
+
+
+def event_key(event_id):
+    """Signing key for one event's tickets"""
+    master = settings.TICKET_SIGNING_KEY.encode()
+    return hmac.digest(master, b'eventify.ticket-code:%d' % event_id, hashlib.sha256)
+
+
+def _signature(key, payload):
+    return hmac.digest(key, payload, hashlib.sha256)[:SIGNATURE_BYTES]
+
+
+def sign_ticket(booking_id, event_id, quantity, key=None):
+    """Compact signed code for a ticket"""
+    payload = PAYLOAD.pack(booking_id, event_id, quantity)
+    key = key or event_key(event_id)
+    raw = payload + _signature(key, payload)
+    return CODE_PREFIX + base64.b32encode(raw).decode('ascii').rstrip('=')
+
+
+def ticket_code(booking):
+    return sign_ticket(booking.id, booking.event_id, booking.quantity)
+
+
+class TicketVerifier:
+    """Checks ticket codes offline against per-event keys.
+
+    `keys` maps event id to the key from event_key(); codes for any other
+    event are rejected.
+    """
+
+    def __init__(self, keys):
+        self.keys = dict(keys)
+
+    def verify(self, code):
+        """Returns (TicketCode, None) if the code is genuine, else (None, error)"""
+        code = code.strip().upper()
+        if len(code) != CODE_LENGTH or not code.startswith(CODE_PREFIX):
+            return None, "Not an EVENTIFY ticket"
+        body = code[len(CODE_PREFIX):]
+        try:
+            raw = base64.b32decode(body + '=' * (-len(body) % 8))
+        except (binascii.Error, ValueError):
+            return None, "Not an EVENTIFY ticket"
+
+        payload, signature = raw[:PAYLOAD.size], raw[PAYLOAD.size:]
+        ticket = TicketCode(*PAYLOAD.unpack(payload))
+        key = self.keys.get(ticket.event_id)
+        if key is None:
+            return None, "Ticket is for a different event"
+        if not hmac.compare_digest(_signature(key, payload), signature):
+            return None, "Invalid signature"
+        return ticket, None
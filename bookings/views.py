@@ -1,15 +1,23 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
+from eventify import metrics
+from eventify.db_router import read_only_view
 from events.models import Event, TicketType
+from . import inventory
 from .models import Booking
 
-# Create your views here.
+
 @login_required
 def create_booking(request, event_id):
     event = get_object_or_404(Event, id=event_id, is_active=True)
     
+    # Unpaid bookings past their expiry may be all that sells it out
+    if event.is_sold_out and inventory.release_expired(event=event):
+        event.refresh_from_db()
+    
     # Check if event is available for booking
     if not event.can_book:
         messages.error(request, "This event is not available for booking.")
@@ -52,16 +60,9 @@ def create_booking(request, event_id):
             }
             return render(request, 'create_booking.html', context)
         
-        # Validate ticket type and quantity
+        # Validate ticket type
         try:
             ticket_info = event.ticket_types.get(category=ticket_type)
-            if quantity > ticket_info.quantity_available:
-                messages.error(request, f"Only {ticket_info.quantity_available} {ticket_type} tickets available.")
-                context = {
-                    'event': event,
-                    'ticket_types': event.ticket_types.all(),
-                }
-                return render(request, 'create_booking.html', context)
         except TicketType.DoesNotExist:
             messages.error(request, "Invalid ticket type selected.")
             context = {
@@ -70,15 +71,33 @@ def create_booking(request, event_id):
             }
             return render(request, 'create_booking.html', context)
         
-        # Create booking
-        booking = Booking.objects.create(
-            user=request.user,
-            event=event,
-            ticket_type=ticket_type,
-            quantity=quantity,
-            unit_price=ticket_info.price,
-            total_price=ticket_info.price * quantity
-        )
+        # Take the tickets and create the booking together, so two buyers
+        # can't both get the last ones. If stock is short, unpaid bookings
+        # past their expiry give their tickets back and we try once more.
+        booking = None
+        for _ in range(2):
+            with transaction.atomic():
+                if inventory.reserve(ticket_info, quantity):
+                    booking = Booking.objects.create(
+                        user=request.user,
+                        event=event,
+                        ticket_type=ticket_type,
+                        quantity=quantity,
+                        unit_price=ticket_info.price,
+                        total_price=ticket_info.price * quantity
+                    )
+            if booking or not inventory.release_expired(
+                    event=event, category=ticket_type):
+                break
+        if booking is None:
+            ticket_info.refresh_from_db()
+            messages.error(request, f"Only {ticket_info.quantity_available} {ticket_type} tickets available.")
+            context = {
+                'event': event,
+                'ticket_types': event.ticket_types.all(),
+            }
+            return render(request, 'create_booking.html', context)
+        metrics.bookings_created.inc()
         
         messages.success(request, "Booking created successfully! Proceed to payment.")
         return redirect('process_payment', booking_id=booking.id)
@@ -92,15 +111,18 @@ def create_booking(request, event_id):
 
 @login_required
 def booking_success(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = get_object_or_404(
+        Booking.objects.select_related('event'), id=booking_id, user=request.user)
     context = {
         'booking': booking,
     }
     return render(request, 'booking_success.html', context)
 
 @login_required
+@read_only_view
 def my_bookings(request):
-    bookings = Booking.objects.filter(user=request.user).order_by('-created_at')
+    bookings = Booking.objects.filter(user=request.user).select_related(
+        'event', 'ticket_delivery').order_by('-created_at')
     context = {
         'bookings': bookings,
     }
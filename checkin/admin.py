@@ -0,0 +1,12 @@
+from django.contrib import admin
+from eventify.db_router import ReplicaAdminMixin
+from .models import Admission
+
+
+@admin.register(Admission)
+class AdmissionAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['booking', 'event', 'scanner', 'admitted_at']
+    list_filter = ['scanner', 'admitted_at']
+    search_fields = ['booking__user__username', 'booking__user__email', 'event__title']
+    list_select_related = ['booking__user', 'event']
+    readonly_fields = ['event', 'booking', 'scanner', 'admitted_at']
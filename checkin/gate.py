@@ -0,0 +1,210 @@
+import logging
+import os
+import socket
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from django.conf import settings
+from django.utils import timezone
+from bookings.models import Booking
+from bookings.ticket_codes import TicketVerifier, event_key
+from events.models import Event
+from .models import Admission
+
+# Gate check-in: "is this ticket valid and not used yet?" from memory.
+#
+# An EventGate preloads the event's confirmed booking ids into a sorted
+# array, with the party size and an admitted flag per position, so a scan
+# is a signature check (bookings.ticket_codes), a bisect and a byte flip.
+# Admissions are queued and written in batches to the append-only
+# Admission table. sync() flushes the queue and reads the rows other
+# scanners wrote since the last sync, so every gate learns about every
+# admission within CHECKIN_SYNC_SECONDS.
+#
+# Two gates can both admit the same ticket inside that window; the first
+# row written wins and the other gate logs the double entry on its flush.
+# Gates also reload everything every CHECKIN_RELOAD_SECONDS, which picks
+# up cancellations and any admission a sync read past.
+
+logger = logging.getLogger(__name__)
+
+SCANNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+Decision = namedtuple('Decision', ['admitted', 'reason', 'booking_id', 'quantity'])
+
+
+def _mark(booking_ids, admitted, booking_id):
+    """Flag a booking as admitted, if it is in `booking_ids`"""
+    position = bisect_left(booking_ids, booking_id)
+    if position < len(booking_ids) and booking_ids[position] == booking_id:
+        admitted[position] = 1
+
+
+class EventGate:
+    """In-memory admitted-set for one event, shared by a process's scanners"""
+
+    def __init__(self, event_id, scanner=SCANNER_ID, key=None):
+        self.event_id = event_id
+        self.scanner = scanner
+        self.verifier = TicketVerifier({event_id: key or event_key(event_id)})
+        self.lock = threading.Lock()
+        self.booking_ids = array('I')
+        self.quantities = array('H')
+        self.admitted = bytearray()
+        self.pending = []
+        self.cursor = 0
+        self.loaded_at = self.synced_at = 0.0
+
+    def __len__(self):
+        return len(self.booking_ids)
+
+    def load(self):
+        """(Re)load the event's confirmed bookings and every admission so far"""
+        self.flush()
+        rows = Booking.objects.filter(
+            event_id=self.event_id, status='confirmed',
+        ).order_by('id').values_list('id', 'quantity')
+        booking_ids, quantities = array('I'), array('H')
+        for booking_id, quantity in rows.iterator(chunk_size=5000):
+            booking_ids.append(booking_id)
+            quantities.append(min(quantity, 0xFFFF))
+
+        # The new set is complete before it is swapped in, so there is no
+        # moment where a ticket already let in looks unused
+        admitted = bytearray(len(booking_ids))
+        cursor = 0
+        for cursor, booking_id in Admission.objects.filter(
+                event_id=self.event_id).order_by('id').values_list(
+                    'id', 'booking_id').iterator(chunk_size=5000):
+            _mark(booking_ids, admitted, booking_id)
+
+        with self.lock:
+            # Scans since the query above, flushed or not, were marked in
+            # the old set; admissions are never undone, so carry them over
+            position = self.admitted.find(1)
+            while position != -1:
+                _mark(booking_ids, admitted, self.booking_ids[position])
+                position = self.admitted.find(1, position + 1)
+            self.booking_ids, self.quantities = booking_ids, quantities
+            self.admitted = admitted
+            self.cursor = max(self.cursor, cursor)
+        self.loaded_at = self.synced_at = time.monotonic()
+
+    def _position(self, booking_id):
+        position = bisect_left(self.booking_ids, booking_id)
+        if position < len(self.booking_ids) and self.booking_ids[position] == booking_id:
+            return position
+        return None
+
+    def _mark(self, booking_id):
+        _mark(self.booking_ids, self.admitted, booking_id)
+
+    def _add_booking(self, booking_id):
+        """Pick up a booking confirmed after the last load. Returns its position."""
+        quantity = Booking.objects.filter(
+            pk=booking_id, event_id=self.event_id, status='confirmed',
+        ).values_list('quantity', flat=True).first()
+        if quantity is None:
+            return None
+        # Another gate may have let it in already
+        admitted = Admission.objects.filter(booking_id=booking_id).exists()
+        with self.lock:
+            position = bisect_left(self.booking_ids, booking_id)
+            if position < len(self.booking_ids) and self.booking_ids[position] == booking_id:
+                return position
+            self.booking_ids.insert(position, booking_id)
+            self.quantities.insert(position, min(quantity, 0xFFFF))
+            self.admitted.insert(position, admitted)
+            return position
+
+    def scan(self, code, scanner=None):
+        """Decide whether to let a ticket in. Returns a Decision."""
+        ticket, error = self.verifier.verify(code)
+        if error:
+            return Decision(False, error, None, 0)
+
+        booking_id = ticket.booking_id
+        with self.lock:
+            position = self._position(booking_id)
+        if position is None:
+            # Rare, so worth a query: bought at the door or confirmed late
+            position = self._add_booking(booking_id)
+            if position is None:
+                return Decision(False, "Booking is not confirmed", booking_id, 0)
+
+        with self.lock:
+            position = self._position(booking_id)
+            if position is None:
+                return Decision(False, "Booking is not confirmed", booking_id, 0)
+            quantity = self.quantities[position]
+            if self.admitted[position]:
+                return Decision(False, "Already admitted", booking_id, quantity)
+            self.admitted[position] = 1
+            self.pending.append((booking_id, scanner or self.scanner, timezone.now()))
+        return Decision(True, "Admitted", booking_id, quantity)
+
+    def flush(self):
+        """Write queued admissions. Returns how many were written."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+        try:
+            Admission.objects.bulk_create([
+                Admission(event_id=self.event_id, booking_id=booking_id,
+                          scanner=scanner, admitted_at=admitted_at)
+                for booking_id, scanner, admitted_at in pending
+            ], ignore_conflicts=True)
+        except Exception:
+            with self.lock:
+                self.pending = pending + self.pending
+            raise
+
+        # A conflict means another gate admitted the same ticket first
+        ours = {booking_id: scanner for booking_id, scanner, _ in pending}
+        for booking_id, scanner in Admission.objects.filter(
+                booking_id__in=list(ours)).values_list('booking_id', 'scanner'):
+            if scanner != ours[booking_id]:
+                logger.warning("Booking #%s was admitted twice (%s and %s)",
+                               booking_id, scanner, ours[booking_id])
+        return len(pending)
+
+    def sync(self):
+        """Flush our admissions and mark everyone else's"""
+        self.flush()
+        rows = list(Admission.objects.filter(
+            event_id=self.event_id, id__gt=self.cursor,
+        ).order_by('id').values_list('id', 'booking_id'))
+        with self.lock:
+            for admission_id, booking_id in rows:
+                self._mark(booking_id)
+            if rows:
+                self.cursor = max(self.cursor, rows[-1][0])
+        self.synced_at = time.monotonic()
+
+    def maybe_sync(self):
+        """Sync or reload when due; cheap to call after every scan"""
+        now = time.monotonic()
+        if now - self.loaded_at >= settings.CHECKIN_RELOAD_SECONDS:
+            self.load()
+        elif (len(self.pending) >= settings.CHECKIN_BATCH_SIZE
+                or now - self.synced_at >= settings.CHECKIN_SYNC_SECONDS):
+            self.sync()
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def get_gate(event_id):
+    """This process's gate for an event, loaded on first use. None if no such event."""
+    with _gates_lock:
+        gate = _gates.get(event_id)
+        if gate is None:
+            if not Event.objects.filter(pk=event_id).exists():
+                return None
+            gate = _gates[event_id] = EventGate(event_id)
+            gate.load()
+        return gate
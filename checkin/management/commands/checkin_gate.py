@@ -0,0 +1,37 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from checkin.gate import SCANNER_ID, EventGate
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = "Run a gate scanner: read ticket codes from stdin, one per line"
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int)
+        parser.add_argument('--scanner', default=SCANNER_ID,
+                            help="Name recorded on this gate's admissions")
+
+    def handle(self, *args, **options):
+        event_id = options['event_id']
+        if not Event.objects.filter(pk=event_id).exists():
+            raise CommandError(f"Event #{event_id} does not exist")
+
+        gate = EventGate(event_id, scanner=options['scanner'][:64])
+        gate.load()
+        self.stdout.write(f"Gate ready: {len(gate)} confirmed bookings")
+        try:
+            for line in sys.stdin:
+                code = line.strip()
+                if not code:
+                    continue
+                decision = gate.scan(code)
+                if decision.admitted:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"ADMIT booking #{decision.booking_id} "
+                        f"({decision.quantity} ticket(s))"))
+                else:
+                    self.stdout.write(self.style.ERROR(f"DENY {decision.reason}"))
+                gate.maybe_sync()
+        finally:
+            gate.sync()
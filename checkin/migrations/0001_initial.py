@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('bookings', '0002_booking_attendee_index'),
+        ('events', '0002_alter_tickettype_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Admission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scanner', models.CharField(max_length=64)),
+                ('admitted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='admission', to='bookings.booking')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='admissions', to='events.event')),
+            ],
+            options={
+                'ordering': ['-admitted_at'],
+                'indexes': [models.Index(fields=['event', 'id'], name='checkin_adm_event_i_9ec205_idx')],
+            },
+        ),
+    ]
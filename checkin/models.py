@@ -0,0 +1,27 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Admission(models.Model):
+    """A booking let in at the gate.
+
+    Rows are only ever inserted, in batches, by the scanners (see
+    checkin.gate). Scanners learn about each other's admissions by reading
+    rows past the last id they have seen, so `event` is stored alongside
+    the booking to keep that read off the bookings table.
+    """
+    event = models.ForeignKey(
+        'events.Event', on_delete=models.CASCADE, related_name='admissions')
+    booking = models.OneToOneField(
+        'bookings.Booking', on_delete=models.CASCADE, related_name='admission')
+    scanner = models.CharField(max_length=64)
+    admitted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-admitted_at']
+        indexes = [
+            models.Index(fields=['event', 'id']),
+        ]
+
+    def __str__(self):
+        return f"Booking #{self.booking_id} admitted by {self.scanner}"
@@ -0,0 +1,63 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from bookings.models import Booking
+from bookings.ticket_codes import event_key, sign_ticket
+from events.models import Event
+from . import gate
+from .gate import EventGate
+from .models import Admission
+
+
+class EventGateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + timedelta(days=7)
+        cls.event = Event.objects.create(
+            title="Test Event", description="Test event", venue="KICC",
+            start_date=start, end_date=start + timedelta(hours=4),
+            total_capacity=100)
+        cls.bookings = [
+            Booking.objects.create(
+                user=User.objects.create_user(f'guest{i}'), event=cls.event,
+                ticket_type='regular', quantity=1, unit_price=Decimal('500'),
+                total_price=Decimal('500'), status='confirmed')
+            for i in range(3)
+        ]
+
+    def code(self, booking):
+        return sign_ticket(booking.id, self.event.id, booking.quantity,
+                           event_key(self.event.id))
+
+    def test_load_marks_admissions_by_other_gates(self):
+        Admission.objects.create(event=self.event, booking=self.bookings[0],
+                                 scanner='other-gate')
+        entrance = EventGate(self.event.id)
+        entrance.load()
+        self.assertEqual(entrance.scan(self.code(self.bookings[0])).reason,
+                         "Already admitted")
+        self.assertTrue(entrance.scan(self.code(self.bookings[1])).admitted)
+
+    def test_reload_keeps_admissions(self):
+        entrance = EventGate(self.event.id)
+        entrance.load()
+        self.assertTrue(entrance.scan(self.code(self.bookings[0])).admitted)
+        entrance.load()
+        self.assertEqual(entrance.scan(self.code(self.bookings[0])).reason,
+                         "Already admitted")
+        self.assertEqual(Admission.objects.count(), 1)
+
+    def test_scan_survives_failed_sync(self):
+        gate._gates.clear()
+        self.client.force_login(User.objects.create_superuser('staff', 'staff@example.com', 'x'))
+        with mock.patch.object(EventGate, 'maybe_sync', side_effect=DatabaseError), \
+                self.assertLogs('checkin.views', 'ERROR'):
+            response = self.client.post(reverse('scan_ticket', args=[self.event.id]),
+                                        {'code': self.code(self.bookings[2])})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['admitted'])
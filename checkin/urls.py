@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('<int:event_id>/scan/', views.scan_ticket, name='scan_ticket'),
+]
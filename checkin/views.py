@@ -0,0 +1,24 @@
+import logging
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
+from .gate import SCANNER_ID, get_gate
+
+logger = logging.getLogger(__name__)
+
+
+@staff_member_required
+@require_POST
+def scan_ticket(request, event_id):
+    """Admit or turn away the ticket code a gate scanner read"""
+    gate = get_gate(event_id)
+    if gate is None:
+        raise Http404("No such event")
+    scanner = request.POST.get('scanner') or f"{SCANNER_ID}/{request.user.username}"
+    decision = gate.scan(request.POST.get('code', ''), scanner=scanner[:64])
+    try:
+        gate.maybe_sync()
+    except Exception:
+        # The decision stands; unflushed admissions are kept for the next sync
+        logger.exception("Check-in sync failed for event %s", event_id)
+    return JsonResponse(decision._asdict())
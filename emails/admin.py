@@ -1,3 +1,29 @@
 from django.contrib import admin
+from eventify.db_router import ReplicaAdminMixin
+from .models import ReminderSent, TicketDelivery
 
-# Register your models here.
+
+@admin.register(TicketDelivery)
+class TicketDeliveryAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['booking', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'updated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['booking__user__username', 'booking__user__email', 'booking__event__title']
+    readonly_fields = ['created_at', 'updated_at', 'sent_at', 'claimed_by', 'locked_until', 'last_error']
+    actions = ['resend_tickets']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('booking__user', 'booking__event')
+
+    @admin.action(description="Resend selected tickets")
+    def resend_tickets(self, request, queryset):
+        count = TicketDelivery.resend(list(queryset.values_list('booking_id', flat=True)))
+        self.message_user(request, f"{count} ticket(s) queued for resending.")
+
+
+@admin.register(ReminderSent)
+class ReminderSentAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['event', 'window', 'user', 'sent_at']
+    list_filter = ['window', 'sent_at']
+    search_fields = ['event__title', 'user__username', 'user__email']
+    list_select_related = ['event', 'user']
+    readonly_fields = ['event', 'user', 'window', 'claimed_by', 'claimed_at', 'sent_at']
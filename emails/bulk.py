@@ -0,0 +1,138 @@
+import logging
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.core.mail import get_connection
+from payments.resilience import TokenBucket
+
+# Bulk email sending over reused SMTP connections.
+#
+# Opening an SMTP connection costs a TCP connect, STARTTLS and a login, which
+# dwarfs sending one message. A BulkMailer keeps one connection open across
+# messages and only reconnects after EMAIL_MESSAGES_PER_CONNECTION messages
+# (most providers cap messages per session) or after an error. Sending is
+# paced by a token bucket shared by every worker through the cache, so the
+# outbox and campaigns together stay under EMAIL_RATE_LIMIT.
+
+logger = logging.getLogger(__name__)
+
+
+class BulkResult(namedtuple('BulkResult', ['sent', 'failed', 'seconds'])):
+
+    @property
+    def rate(self):
+        return self.sent / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.sent} sent, {self.failed} failed in "
+                f"{self.seconds:.1f}s ({self.rate:.1f} msg/s)")
+
+
+class SendThrottle:
+    """Blocks until the provider's send rate allows more messages"""
+
+    def __init__(self, rate=None, burst=None):
+        rate = settings.EMAIL_RATE_LIMIT if rate is None else rate
+        burst = settings.EMAIL_RATE_BURST if burst is None else burst
+        self.bucket = TokenBucket(
+            'smtp', rate, max(burst, 1), prefix='email') if rate > 0 else None
+
+    def wait(self):
+        if self.bucket is None:
+            return
+        while not self.bucket.acquire():
+            time.sleep(max(self.bucket.retry_after(), 0.01))
+
+
+class BulkMailer:
+    """Sends messages over one reused connection. Not thread-safe."""
+
+    def __init__(self, throttle=None, per_connection=None, fail_silently=False):
+        self.throttle = throttle or SendThrottle()
+        self.per_connection = (per_connection
+                               or settings.EMAIL_MESSAGES_PER_CONNECTION)
+        self.fail_silently = fail_silently
+        self.connection = None
+        self.sent_on_connection = 0
+        self.connections_opened = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connection(self, count):
+        if (self.connection is not None
+                and self.sent_on_connection + count > self.per_connection):
+            self.close()
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=self.fail_silently)
+            self.connection.open()
+            self.connections_opened += 1
+            self.sent_on_connection = 0
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+        self.connection = None
+
+    def send(self, message):
+        """Send one message. Raises on failure, after dropping the connection."""
+        self.throttle.wait()
+        connection = self._connection(1)
+        try:
+            connection.send_messages([message])
+        except Exception:
+            self.close()
+            raise
+        self.sent_on_connection += 1
+
+    def send_batch(self, messages):
+        """Send a batch with one send_messages call. Returns how many went out.
+
+        Failures are counted, not raised; the connection is dropped after a
+        batch with failures so the next batch starts on a fresh one.
+        """
+        for _ in messages:
+            self.throttle.wait()
+        connection = self._connection(len(messages))
+        try:
+            sent = connection.send_messages(messages) or 0
+        except Exception as e:
+            logger.warning("Bulk send failed: %s", e)
+            sent = 0
+        self.sent_on_connection += len(messages)
+        if sent < len(messages):
+            self.close()
+        return sent
+
+
+def send_bulk(messages, batch_size=None, mailer=None):
+    """Send an iterable of messages in batches over reused connections"""
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    owns_mailer = mailer is None
+    mailer = mailer or BulkMailer(fail_silently=True)
+    start = time.perf_counter()
+    sent = failed = 0
+    batch = []
+    try:
+        for message in messages:
+            batch.append(message)
+            if len(batch) >= batch_size:
+                count = mailer.send_batch(batch)
+                sent += count
+                failed += len(batch) - count
+                batch = []
+        if batch:
+            count = mailer.send_batch(batch)
+            sent += count
+            failed += len(batch) - count
+    finally:
+        if owns_mailer:
+            mailer.close()
+    return BulkResult(sent, failed, time.perf_counter() - start)
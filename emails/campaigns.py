@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from bookings.models import Booking
+from .bulk import send_bulk
+from .layouts import Layout, cached_layout, template_layout
+
+# Event-wide emails to every attendee: reminders before the event and free
+# text announcements from the organizers. Messages are built lazily while
+# the attendee list is streamed, and sent in batches by emails.bulk. The
+# body is rendered once per event (emails.layouts) and only the attendee's
+# name is filled in per message.
+
+CAMPAIGN_KINDS = ('reminder', 'announcement')
+
+SUBJECTS = {
+    'reminder': "⏰ Reminder: {title} is coming up",
+    'announcement': "📣 Update for {title}",
+}
+
+
+def attendee_batches(event, batch_size=None):
+    """Lists of (user_id, email, name) for users with a confirmed booking.
+
+    Keyset-paginated on user_id, so each batch is an index range scan no
+    matter how deep into a 100k attendee list it is, and no cursor is held
+    open between batches.
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE * 20
+    confirmed = (Booking.objects.filter(event=event, status='confirmed')
+                 .exclude(user__email='')
+                 .values_list('user_id', 'user__email', 'user__first_name',
+                              'user__last_name', 'user__username')
+                 .order_by('user_id').distinct())
+    last_user_id = 0
+    while True:
+        rows = list(confirmed.filter(user_id__gt=last_user_id)[:batch_size])
+        if not rows:
+            return
+        yield [
+            (user_id, email, f"{first_name} {last_name}".strip() or username)
+            for user_id, email, first_name, last_name, username in rows
+        ]
+        last_user_id = rows[-1][0]
+
+
+def attendees(event):
+    """(email, name) once per user with a confirmed booking for the event"""
+    for batch in attendee_batches(event):
+        for _, email, name in batch:
+            yield email, name
+
+
+def campaign_layouts(event, kind, message=''):
+    """(html, text) layouts of a campaign email, built once per event"""
+    def build():
+        html = template_layout('event_campaign.html', {
+            'event': event,
+            'kind': kind,
+            'message': message,
+        }, ['name'])
+        text = Layout(
+            lambda field: f"Hello {field['name']},\n\n"
+            + (f"{message}\n\n" if message else "")
+            + f"Event: {event.title}\n"
+            f"Date: {event.start_date.strftime('%A, %B %d, %Y')}\n"
+            f"Time: {event.start_date.strftime('%I:%M %p')}\n"
+            f"Venue: {event.venue}\n\n"
+            "EVENTIFY Team",
+            ['name'], html=False)
+        return html, text
+    return cached_layout(
+        ('event_campaign', event.pk, event.updated_at, kind, message), build)
+
+
+def campaign_message(event, kind, email, name, message='', subject=None):
+    subject = subject or SUBJECTS[kind].format(title=event.title)
+    html_layout, text_layout = campaign_layouts(event, kind, message)
+    fields = {'name': name}
+    email_message = EmailMultiAlternatives(
+        subject=subject,
+        body=text_layout.fill(fields),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email],
+    )
+    email_message.attach_alternative(html_layout.fill(fields), "text/html")
+    return email_message
+
+
+def send_event_campaign(event, kind, message='', subject=None, mailer=None):
+    """Email every attendee of an event. Returns a BulkResult."""
+    if kind not in CAMPAIGN_KINDS:
+        raise ValueError(f"Unknown campaign kind: {kind}")
+    messages = (
+        campaign_message(event, kind, email, name, message, subject)
+        for email, name in attendees(event)
+    )
+    return send_bulk(messages, mailer=mailer)
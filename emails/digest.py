@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db.models import Count
+from .models import TicketDelivery
+
+# Daily summary of ticket emails for the admin mailbox. It replaces the BCC
+# that used to copy every ticket to DEFAULT_FROM_EMAIL.
+
+
+def ticket_digest_message(since, until):
+    """Summary of ticket deliveries in [since, until), or None if there were none"""
+    sent = (TicketDelivery.objects.filter(status='sent', sent_at__gte=since,
+                                          sent_at__lt=until)
+            .values('booking__event__title').annotate(tickets=Count('id'))
+            .order_by('-tickets'))
+    failed = TicketDelivery.objects.filter(
+        status='failed', updated_at__gte=since, updated_at__lt=until)
+    sent = list(sent)
+    sent_count = sum(row['tickets'] for row in sent)
+    failed_count = failed.count()
+    if not sent_count and not failed_count:
+        return None
+
+    lines = [
+        f"Ticket emails {since:%Y-%m-%d %H:%M} to {until:%Y-%m-%d %H:%M} UTC",
+        "",
+        f"Sent: {sent_count}",
+    ]
+    lines += [f"  {row['tickets']:>6}  {row['booking__event__title']}" for row in sent]
+    lines += ["", f"Failed: {failed_count}"]
+    lines += [
+        f"  #{delivery.booking_id}  {delivery.booking.user.email}  "
+        f"{delivery.booking.event.title}: {delivery.last_error[:200]}"
+        for delivery in failed.select_related(
+            'booking__user', 'booking__event').order_by('updated_at')[:200]
+    ]
+    return EmailMessage(
+        subject=f"EVENTIFY ticket digest: {sent_count} sent, {failed_count} failed",
+        body="\n".join(lines),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[settings.DEFAULT_FROM_EMAIL],
+    )
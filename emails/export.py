@@ -0,0 +1,71 @@
+import zipfile
+from io import RawIOBase
+from django.conf import settings
+from bookings.models import Booking
+from .utils import generate_ticket_pdfs
+
+# Streaming ZIP export of an event's tickets.
+#
+# Bookings are read with .iterator() and rendered a batch at a time on the
+# PDF pool (cache hits skip rendering), and each file is handed to the
+# client as soon as it is written, so memory stays flat however big the
+# event is.
+
+
+class ZipStream(RawIOBase):
+    """Write-only sink that hands back whatever zipfile wrote since last drain.
+
+    It is not seekable, so zipfile writes sizes in data descriptors after
+    each file instead of seeking back to the header.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def confirmed_bookings(event, batch_size):
+    """Confirmed bookings with payments, in batches, event attached"""
+    bookings = Booking.objects.filter(
+        event=event, status='confirmed', payment__isnull=False,
+    ).select_related('user', 'payment').order_by('id')
+
+    batch = []
+    for booking in bookings.iterator(chunk_size=batch_size):
+        booking.event = event
+        batch.append(booking)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ticket_filename(booking):
+    return f"ticket_{booking.id}_{booking.user.username}.pdf"
+
+
+def stream_event_tickets(event, batch_size=None):
+    """Yield a ZIP of every confirmed ticket for an event, chunk by chunk"""
+    batch_size = batch_size or settings.TICKET_PDF_WORKERS * 8
+    sink = ZipStream()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for batch in confirmed_bookings(event, batch_size):
+            pdfs = generate_ticket_pdfs(
+                [(booking, booking.payment) for booking in batch])
+            for booking, pdf in zip(batch, pdfs):
+                # PDF streams are already deflated, so store them as-is
+                archive.writestr(ticket_filename(booking), pdf)
+                yield sink.drain()
+    yield sink.drain()
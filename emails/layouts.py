@@ -0,0 +1,84 @@
+import logging
+import time
+from django.template.loader import render_to_string
+from django.utils.html import conditional_escape
+
+# Email bodies rendered once per event, filled in per attendee.
+#
+# Ticket and campaign emails are the same page for every attendee of an
+# event apart from a handful of fields (name, booking id, ...). A Layout is
+# the template rendered once with a marker in place of each of those
+# fields, split into its static chunks; building a message is then a join
+# of the chunks with the attendee's escaped values instead of a full
+# template render. Templates rendered this way may only use per-attendee
+# fields as plain {{ field }} output, never in tags or through filters.
+#
+# A layout whose markers don't come back one per field, because a field
+# was used in a tag or through a filter or event text contains the marker
+# character, can't be split safely. Its messages are rendered in full
+# instead, the way they were before layouts.
+#
+# Layouts are cached per key for LAYOUT_TTL seconds, which also keeps
+# time-relative text such as "starts in 3 hours" current.
+
+MARKER = '\x00'
+LAYOUT_TTL = 60
+MAX_LAYOUTS = 256
+
+_layouts = {}
+
+logger = logging.getLogger(__name__)
+
+
+def slots(fields):
+    """Context mapping each per-attendee field to its marker"""
+    return {field: f"{MARKER}{field}{MARKER}" for field in fields}
+
+
+class Layout:
+    """A rendered body with slots for per-attendee values.
+
+    `render(values)` builds the body from a dict of the per-attendee
+    `fields`; it is called once with markers for values.
+    """
+
+    def __init__(self, render, fields, html=True):
+        self.render = render
+        self.html = html
+        parts = render(slots(fields)).split(MARKER)
+        if len(parts) % 2 == 1 and set(parts[1::2]) == set(fields):
+            self.chunks = parts[0::2]
+            self.fields = parts[1::2]
+        else:
+            logger.warning("Slot markers lost in layout with fields %s; "
+                           "rendering each message in full", ', '.join(fields))
+            self.chunks = None
+
+    def fill(self, values):
+        if self.chunks is None:
+            return self.render(values)
+        escape = conditional_escape if self.html else str
+        out = [self.chunks[0]]
+        for field, chunk in zip(self.fields, self.chunks[1:]):
+            out.append(escape(values[field]))
+            out.append(chunk)
+        return ''.join(out)
+
+
+def template_layout(template_name, context, fields):
+    """Layout of a template rendered with `context` and a slot for each of
+    `fields`"""
+    return Layout(
+        lambda values: render_to_string(template_name, {**context, **values}),
+        fields)
+
+
+def cached_layout(key, build):
+    """The cached value for `key`, from build() when missing or expired"""
+    now = time.monotonic()
+    entry = _layouts.get(key)
+    if entry is None or now - entry[0] > LAYOUT_TTL:
+        if len(_layouts) >= MAX_LAYOUTS:
+            _layouts.clear()
+        entry = _layouts[key] = (now, build())
+    return entry[1]
@@ -0,0 +1,34 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from emails.outbox import run_workers
+from emails.pdf import shutdown_pool, start_pool
+
+
+class Command(BaseCommand):
+    help = "Send queued ticket emails from the delivery outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.TICKET_DELIVERY_WORKERS,
+            help="Concurrent delivery threads")
+        parser.add_argument(
+            '--batch-size', type=int,
+            help="Deliveries claimed per round (default: 4 per worker)")
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit when nothing is due instead of polling (for cron)")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        start_pool(settings.TICKET_PDF_WORKERS)
+        try:
+            sent, failed = run_workers(
+                workers=options['workers'], batch_size=options['batch_size'],
+                once=options['once'])
+        finally:
+            shutdown_pool()
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f"Sent {sent} ticket(s), {failed} failed or retrying, "
+            f"in {elapsed:.1f}s")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from emails.campaigns import CAMPAIGN_KINDS, send_event_campaign
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = "Email a reminder or announcement to every attendee of an event"
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int)
+        parser.add_argument('--kind', choices=CAMPAIGN_KINDS, default='reminder')
+        parser.add_argument('--subject', help="Override the default subject")
+        parser.add_argument(
+            '--message', default='',
+            help="Text shown at the top of the email (required for announcements)")
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(pk=options['event_id'])
+        except Event.DoesNotExist:
+            raise CommandError(f"Event {options['event_id']} does not exist")
+        if options['kind'] == 'announcement' and not options['message']:
+            raise CommandError("Announcements need --message")
+
+        result = send_event_campaign(
+            event, options['kind'], message=options['message'],
+            subject=options['subject'])
+        self.stdout.write(f"{event.title} {options['kind']}: {result}")
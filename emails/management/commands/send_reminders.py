@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from emails.reminders import run_reminders
+
+
+class Command(BaseCommand):
+    help = "Email attendees of events starting in the next 24 hours or 1 hour"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', type=int, metavar='SECONDS',
+            help="Keep running, checking for due reminders this often")
+
+    def handle(self, *args, **options):
+        while True:
+            result = run_reminders()
+            self.stdout.write(f"Reminders: {result}")
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
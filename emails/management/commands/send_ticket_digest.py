@@ -0,0 +1,23 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from emails.digest import ticket_digest_message
+
+
+class Command(BaseCommand):
+    help = "Email the admin a summary of ticket emails sent and failed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=24,
+            help="Cover this many hours up to now (run it from cron at the same interval)")
+
+    def handle(self, *args, **options):
+        until = timezone.now()
+        message = ticket_digest_message(
+            until - timedelta(hours=options['hours']), until)
+        if message is None:
+            self.stdout.write("No ticket emails in that period")
+            return
+        message.send(fail_silently=False)
+        self.stdout.write(f"Sent digest: {message.subject}")
@@ -1,3 +1,102 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class TicketDelivery(models.Model):
+    """Outbox row for emailing a booking's ticket.
+
+    Written in the same transaction that confirms the booking and drained by
+    `manage.py deliver_tickets`. One row per booking, so confirming twice
+    never sends twice.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    booking = models.OneToOneField(
+        'bookings.Booking', on_delete=models.CASCADE, related_name='ticket_delivery')
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    # Set while a worker holds the row; an expired lease is picked up again
+    claimed_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = "Ticket deliveries"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"Ticket for Booking #{self.booking_id} - {self.status}"
+
+    @classmethod
+    def enqueue(cls, booking_id):
+        """Queue a ticket email for a booking (no-op if already queued)"""
+        cls.objects.bulk_create(
+            [cls(booking_id=booking_id)], ignore_conflicts=True)
+
+    @classmethod
+    def resend(cls, booking_ids):
+        """Queue the tickets again, e.g. when a customer lost the email.
+
+        Returns the number of tickets queued; tickets being sent at that
+        moment are skipped.
+        """
+        booking_ids = list(booking_ids)
+        for booking_id in booking_ids:
+            cls.enqueue(booking_id)
+        # A row a worker is sending right now is left alone: resetting it
+        # would void the worker's claim and the ticket would go out twice
+        return cls.objects.filter(booking_id__in=booking_ids).exclude(
+            status='sending').update(
+                status='pending', attempts=0, next_attempt_at=timezone.now(),
+                last_error='', updated_at=timezone.now())
+
+
+class ReminderSent(models.Model):
+    """Marker for one reminder email to one attendee.
+
+    A scheduler run inserts markers for a batch of attendees with its run
+    token (ignoring ones that already exist) and only emails the rows that
+    carry its token, so overlapping runs or several scheduler nodes never
+    send the same reminder twice.
+    """
+    WINDOW_CHOICES = [
+        ('24h', '24 hours before'),
+        ('1h', '1 hour before'),
+    ]
+
+    event = models.ForeignKey(
+        'events.Event', on_delete=models.CASCADE, related_name='reminders_sent')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    window = models.CharField(max_length=8, choices=WINDOW_CHOICES)
+
+    # Run that owns the marker; unsent markers older than the lease are retaken
+    claimed_by = models.CharField(max_length=64)
+    claimed_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['event', 'window', 'user'], name='unique_reminder_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.window} reminder for event #{self.event_id} to user #{self.user_id}"
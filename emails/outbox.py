@@ -0,0 +1,167 @@
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from bookings.models import Booking
+from .bulk import BulkMailer
+from .models import TicketDelivery
+from .utils import generate_ticket_pdfs, send_ticket_email
+
+# Ticket delivery outbox worker.
+#
+# Workers claim due rows by stamping them with a per-batch token in one
+# conditional UPDATE, so several worker processes can drain the same table
+# without sending a ticket twice. A claim is a lease: if the worker dies the
+# row becomes claimable again once locked_until passes. On Postgres the
+# candidate rows are also locked with SKIP LOCKED, so concurrent workers
+# pick disjoint batches instead of racing for the same rows.
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter: base, 2x base, 4x base ... capped"""
+    delay = settings.TICKET_DELIVERY_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0)
+    delay = min(delay, settings.TICKET_DELIVERY_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def due_deliveries(now):
+    return TicketDelivery.objects.filter(
+        Q(status='pending', next_attempt_at__lte=now)
+        | Q(status='sending', locked_until__lt=now))
+
+
+def claim_batch(limit):
+    """Lease up to `limit` due deliveries. Returns the claimed rows."""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        due = due_deliveries(now).order_by('next_attempt_at')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        # Re-check the due condition so rows taken by another worker since
+        # the SELECT are skipped
+        due_deliveries(now).filter(id__in=ids).update(
+            status='sending', claimed_by=token, attempts=F('attempts') + 1,
+            locked_until=now + timezone.timedelta(
+                seconds=settings.TICKET_DELIVERY_LEASE_SECONDS),
+            updated_at=now)
+    return list(TicketDelivery.objects.filter(claimed_by=token, status='sending'))
+
+
+def load_bookings(deliveries):
+    """Bookings for a batch of deliveries, keyed by id"""
+    return Booking.objects.select_related('user', 'event', 'payment').in_bulk(
+        [delivery.booking_id for delivery in deliveries])
+
+
+def render_batch(deliveries, bookings):
+    """Render the batch's PDFs, on the renderer pool under deliver_tickets.
+
+    Returns a PDF (or None) per delivery; deliver() renders any missing
+    ticket itself and records the error if that fails too.
+    """
+    pdfs = [None] * len(deliveries)
+    tickets, positions = [], []
+    for position, delivery in enumerate(deliveries):
+        booking = bookings.get(delivery.booking_id)
+        payment = getattr(booking, 'payment', None) if booking else None
+        if payment is not None:
+            tickets.append((booking, payment))
+            positions.append(position)
+    try:
+        for position, pdf in zip(positions, generate_ticket_pdfs(tickets)):
+            pdfs[position] = pdf
+    except Exception as e:
+        logger.warning("Batch ticket rendering failed: %s", e)
+    return pdfs
+
+
+def deliver(delivery, booking=None, pdf_content=None, mailer=None):
+    """Send one claimed delivery and record the outcome"""
+    try:
+        if booking is None:
+            booking = Booking.objects.select_related(
+                'user', 'event', 'payment').get(pk=delivery.booking_id)
+        success, message = send_ticket_email(
+            booking, booking.payment, pdf_content=pdf_content, mailer=mailer)
+    except Exception as e:
+        success, message = False, str(e)
+
+    now = timezone.now()
+    mine = TicketDelivery.objects.filter(
+        pk=delivery.pk, claimed_by=delivery.claimed_by, status='sending')
+    if success:
+        mine.update(status='sent', sent_at=now, last_error='',
+                    locked_until=None, updated_at=now)
+    elif delivery.attempts >= settings.TICKET_DELIVERY_MAX_ATTEMPTS:
+        logger.warning("Ticket delivery for booking #%s failed: %s", delivery.booking_id, message)
+        mine.update(status='failed', last_error=message,
+                    locked_until=None, updated_at=now)
+    else:
+        mine.update(
+            status='pending', last_error=message, locked_until=None,
+            next_attempt_at=now + timezone.timedelta(
+                seconds=backoff_seconds(delivery.attempts)),
+            updated_at=now)
+    return success
+
+
+def run_workers(workers=None, batch_size=None, poll_interval=None, once=False):
+    """Drain the outbox with a thread pool.
+
+    Each worker thread keeps its own SMTP connection open across messages
+    and batches; connections are closed whenever the outbox runs dry.
+    With once=True, returns when nothing is due; otherwise polls forever.
+    Returns (sent, failed) counts.
+    """
+    workers = workers or settings.TICKET_DELIVERY_WORKERS
+    batch_size = batch_size or workers * 4
+    poll_interval = poll_interval or settings.TICKET_DELIVERY_POLL_SECONDS
+    sent = failed = 0
+    local = threading.local()
+    mailers = []
+
+    def deliver_in_worker(delivery, booking, pdf_content):
+        mailer = getattr(local, 'mailer', None)
+        if mailer is None:
+            mailer = local.mailer = BulkMailer()
+            mailers.append(mailer)
+        try:
+            return deliver(delivery, booking, pdf_content, mailer)
+        finally:
+            close_old_connections()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            while True:
+                batch = claim_batch(batch_size)
+                if not batch:
+                    for mailer in mailers:
+                        mailer.close()
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                bookings = load_bookings(batch)
+                pdfs = render_batch(batch, bookings)
+                for ok in pool.map(deliver_in_worker, batch,
+                                   [bookings.get(d.booking_id) for d in batch], pdfs):
+                    if ok:
+                        sent += 1
+                    else:
+                        failed += 1
+        finally:
+            for mailer in mailers:
+                mailer.close()
+    return sent, failed
@@ -0,0 +1,411 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from itertools import repeat
+from io import BytesIO
+from xml.sax.saxutils import escape
+from PIL import Image
+from reportlab.graphics.barcode.qrencoder import QRCode, QRErrorCorrectLevel
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+from reportlab.platypus import (
+    Flowable, SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle)
+
+# Ticket PDF rendering.
+#
+# Two renderers draw the same fields: 'platypus' lays the ticket out with
+# flowables, 'canvas' draws it directly at fixed positions on one page.
+# Styles and the fixed page furniture are built once per process, so a
+# ticket only pays for its own text. Rendering takes a plain dict from
+# emails.utils.ticket_context rather than model instances, so it can run
+# in a worker process: this module deliberately does not import Django.
+#
+# Both renderers carry the ticket's signed entry code (bookings.ticket_codes)
+# as a QR code; qr_png() draws the same code for the ticket email.
+
+# Part of every cached ticket's key: bump one when its layout changes
+RENDERER_VERSIONS = {
+    'platypus': 'platypus-2',
+    'canvas': 'canvas-2',
+}
+
+TITLE_COLOR = colors.HexColor("#340BED")
+SUBTITLE_COLOR = colors.HexColor("#E11616")
+INFO_COLOR = colors.HexColor("#060505")
+TABLE_HEADER_COLOR = colors.HexColor('#667eea')
+TABLE_BODY_COLOR = colors.HexColor('#f8f9fa')
+
+STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=STYLES['Heading1'],
+    fontSize=24,
+    textColor=TITLE_COLOR,
+    alignment=TA_CENTER,
+    spaceAfter=30
+)
+
+SUBTITLE_STYLE = ParagraphStyle(
+    'CustomSubtitle',
+    parent=STYLES['Heading2'],
+    fontSize=16,
+    textColor=SUBTITLE_COLOR,
+    alignment=TA_CENTER,
+    spaceAfter=20
+)
+
+INFO_STYLE = ParagraphStyle(
+    'InfoStyle',
+    parent=STYLES['Normal'],
+    fontSize=12,
+    textColor=INFO_COLOR,
+    spaceAfter=10
+)
+
+FOOTER_STYLE = ParagraphStyle(
+    'FooterStyle',
+    parent=STYLES['Normal'],
+    fontSize=10,
+    textColor=colors.gray,
+    alignment=TA_CENTER
+)
+
+PRICE_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), TABLE_HEADER_COLOR),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), TABLE_BODY_COLOR),
+    ('GRID', (0, 0), (-1, -1), 1, colors.gray),
+])
+
+SECTIONS = (
+    ('EVENT DETAILS', (
+        ('Event:', 'event_title'),
+        ('Date:', 'event_date'),
+        ('Time:', 'event_time'),
+        ('Venue:', 'venue'),
+    )),
+    ('TICKET INFORMATION', (
+        ('Ticket Type:', 'ticket_type'),
+        ('Quantity:', 'quantity_label'),
+        ('Booking ID:', 'booking_ref'),
+        ('Transaction ID:', 'receipt_number'),
+    )),
+    ('CUSTOMER INFORMATION', (
+        ('Name:', 'customer_name'),
+        ('Email:', 'customer_email'),
+        ('Booking Date:', 'booked_at'),
+    )),
+)
+
+# Parsed once per process. Flowables pick up layout state while a document
+# is built, so each build works on shallow copies and these stay pristine.
+HEADER = (
+    Paragraph("🎪 EVENTIFY", TITLE_STYLE),
+    Paragraph("E-TICKET", SUBTITLE_STYLE),
+)
+HEADINGS = {
+    heading: Paragraph(f"<b>{heading}</b>", STYLES['Heading2'])
+    for heading, _ in SECTIONS + (('PRICE SUMMARY', ()),)
+}
+LABELS = {
+    label: Paragraph(label, INFO_STYLE)
+    for _, fields in SECTIONS for label, _ in fields
+}
+FOOTER_TEXT = ("Present this e-ticket at the event entrance. "
+               "For any inquiries, contact support@eventify.com")
+FOOTER = Paragraph(FOOTER_TEXT, FOOTER_STYLE)
+
+
+QR_SIZE = 100
+QR_QUIET_ZONE = 4
+
+
+def qr_modules(code):
+    """The QR code's module matrix, one row of booleans per line"""
+    qr = QRCode(None, QRErrorCorrectLevel.M)
+    qr.addData(code)
+    qr.make()
+    return [row[:] for row in qr.modules]
+
+
+def draw_qr(c, code, x, y, size=QR_SIZE):
+    """Draw `code` as a QR code with its bottom-left corner at (x, y)"""
+    modules = qr_modules(code)
+    count = len(modules)
+    module = size / (count + 2 * QR_QUIET_ZONE)
+    origin_x = x + QR_QUIET_ZONE * module
+    top = y + size - QR_QUIET_ZONE * module
+    c.saveState()
+    c.setFillColor(colors.black)
+    # One rect per run of dark modules keeps the page stream small
+    for row_index, row in enumerate(modules):
+        row_y = top - (row_index + 1) * module
+        column = 0
+        while column < count:
+            if not row[column]:
+                column += 1
+                continue
+            start = column
+            while column < count and row[column]:
+                column += 1
+            c.rect(origin_x + start * module, row_y, (column - start) * module,
+                   module, stroke=0, fill=1)
+    c.restoreState()
+
+
+def qr_png(code, scale=6):
+    """PNG bytes of `code` as a QR code, `scale` pixels per module"""
+    modules = qr_modules(code)
+    count = len(modules)
+    side = count + 2 * QR_QUIET_ZONE
+    image = Image.new('1', (side, side), 1)
+    for row_index, row in enumerate(modules):
+        for column, dark in enumerate(row):
+            if dark:
+                image.putpixel((column + QR_QUIET_ZONE, row_index + QR_QUIET_ZONE), 0)
+    image = image.resize((side * scale, side * scale), Image.NEAREST)
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+class QrFlowable(Flowable):
+    """The entry code as a centred QR code with the code printed beneath"""
+
+    def __init__(self, code, size=QR_SIZE):
+        super().__init__()
+        self.code = code
+        self.size = size
+
+    def wrap(self, available_width, available_height):
+        self.width = available_width
+        return available_width, self.size + 12
+
+    def draw(self):
+        left = (self.width - self.size) / 2
+        draw_qr(self.canv, self.code, left, 12, self.size)
+        self.canv.setFont('Helvetica', 8)
+        self.canv.setFillColor(colors.gray)
+        self.canv.drawCentredString(self.width / 2, 2, self.code)
+
+
+def price_rows(context):
+    return [
+        ["Description", "Amount"],
+        ["Ticket Price", f"KSh {context['unit_price']}"],
+        ["Quantity", f"{context['quantity']}"],
+        ["Total Amount", f"<b>KSh {context['total_price']}</b>"],
+        ["Payment Status", f"<b>{context['payment_status']}</b>"],
+    ]
+
+
+def render_platypus(context):
+    """Flowable layout: the original ticket design"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+
+    story = [copy(flowable) for flowable in HEADER]
+    story.append(QrFlowable(context['ticket_code']))
+    story.append(Spacer(1, 20))
+    for heading, fields in SECTIONS:
+        story.append(copy(HEADINGS[heading]))
+        story.append(Spacer(1, 10))
+        for label, key in fields:
+            story.append(copy(LABELS[label]))
+            story.append(Paragraph(f"<b>{escape(context[key])}</b>", INFO_STYLE))
+            story.append(Spacer(1, 5))
+        story.append(Spacer(1, 20))
+
+    story.append(copy(HEADINGS['PRICE SUMMARY']))
+    story.append(Spacer(1, 10))
+    price_table = Table(price_rows(context), colWidths=[3*inch, 2*inch])
+    price_table.setStyle(PRICE_TABLE_STYLE)
+    story.append(price_table)
+    story.append(Spacer(1, 30))
+    story.append(copy(FOOTER))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 72
+LABEL_WIDTH = 1.6 * inch
+PRICE_COLUMNS = (3 * inch, 2 * inch)
+PRICE_ROW_HEIGHT = 22
+
+
+def render_canvas(context):
+    """Direct drawing on a single page, same fields as render_platypus"""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    centre = PAGE_WIDTH / 2
+    value_width = PAGE_WIDTH - 2 * MARGIN - LABEL_WIDTH
+
+    y = PAGE_HEIGHT - MARGIN - 24
+    c.setFillColor(TITLE_COLOR)
+    c.setFont('Helvetica-Bold', 24)
+    c.drawCentredString(centre, y, "🎪 EVENTIFY")
+    y -= 36
+    c.setFillColor(SUBTITLE_COLOR)
+    c.setFont('Helvetica-Bold', 16)
+    c.drawCentredString(centre, y, "E-TICKET")
+    y -= 44
+
+    # Entry code in the top-right corner, clear of the centred header
+    qr_left = PAGE_WIDTH - MARGIN - QR_SIZE
+    qr_bottom = PAGE_HEIGHT - MARGIN + 18 - QR_SIZE
+    draw_qr(c, context['ticket_code'], qr_left, qr_bottom)
+    c.setFillColor(colors.gray)
+    c.setFont('Helvetica', 6)
+    c.drawCentredString(qr_left + QR_SIZE / 2, qr_bottom - 6,
+                        context['ticket_code'])
+
+    for heading, fields in SECTIONS:
+        c.setFillColor(colors.black)
+        c.setFont('Helvetica-Bold', 14)
+        c.drawString(MARGIN, y, heading)
+        y -= 22
+        for label, key in fields:
+            c.setFillColor(INFO_COLOR)
+            c.setFont('Helvetica', 12)
+            c.drawString(MARGIN, y, label)
+            c.setFont('Helvetica-Bold', 12)
+            for line in simpleSplit(str(context[key]), 'Helvetica-Bold', 12,
+                                    value_width) or ['']:
+                c.drawString(MARGIN + LABEL_WIDTH, y, line)
+                y -= 16
+            y -= 4
+        y -= 16
+
+    c.setFillColor(colors.black)
+    c.setFont('Helvetica-Bold', 14)
+    c.drawString(MARGIN, y, 'PRICE SUMMARY')
+    y -= 14
+
+    # Price table: coloured header row, light body, grey grid
+    rows = price_rows(context)
+    table_width = sum(PRICE_COLUMNS)
+    left = centre - table_width / 2
+    top = y
+    c.setFillColor(TABLE_HEADER_COLOR)
+    c.rect(left, top - PRICE_ROW_HEIGHT, table_width, PRICE_ROW_HEIGHT,
+           stroke=0, fill=1)
+    c.setFillColor(TABLE_BODY_COLOR)
+    c.rect(left, top - PRICE_ROW_HEIGHT * len(rows), table_width,
+           PRICE_ROW_HEIGHT * (len(rows) - 1), stroke=0, fill=1)
+    for index, row in enumerate(rows):
+        baseline = top - PRICE_ROW_HEIGHT * (index + 1) + 7
+        c.setFillColor(colors.white if index == 0 else colors.black)
+        x = left
+        for column, text in zip(PRICE_COLUMNS, row):
+            bold = index == 0 or text.startswith('<b>')
+            text = text.replace('<b>', '').replace('</b>', '')
+            c.setFont('Helvetica-Bold' if bold else 'Helvetica',
+                      12 if index == 0 else 10)
+            c.drawCentredString(x + column / 2, baseline, text)
+            x += column
+    c.setStrokeColor(colors.gray)
+    c.grid([left, left + PRICE_COLUMNS[0], left + table_width],
+           [top - PRICE_ROW_HEIGHT * i for i in range(len(rows) + 1)])
+
+    c.setFillColor(colors.gray)
+    c.setFont('Helvetica', 10)
+    c.drawCentredString(centre, MARGIN - 20, FOOTER_TEXT)
+
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'platypus': render_platypus,
+    'canvas': render_canvas,
+}
+
+
+def render_ticket(context, renderer='platypus'):
+    """Render one ticket PDF from a ticket_context dict. Returns bytes."""
+    return RENDERERS[renderer](context)
+
+
+def timed_render(context, renderer='platypus'):
+    """render_ticket(), returning (pdf, seconds spent rendering)"""
+    start = time.perf_counter()
+    pdf = render_ticket(context, renderer)
+    return pdf, time.perf_counter() - start
+
+
+# The renderer pool. Only bulk senders start it (deliver_tickets, the
+# benchmarks); web requests never do, so a gunicorn or runserver process
+# doesn't fork with its threads and connections. Workers come from a
+# forkserver (spawn where there is none) that has imported this module once.
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def start_pool(workers=None):
+    """Start the renderer pool with `workers` processes, replacing any
+    running one"""
+    global _pool, _pool_workers
+    workers = workers or os.cpu_count() or 1
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context('spawn')
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        _pool_workers = workers
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = _pool_workers = None
+
+
+def render_tickets(contexts, renderer='platypus', timings=None):
+    """Render many tickets. Returns PDFs in input order.
+
+    Tickets go to the renderer pool if start_pool() was called, and are
+    rendered in this process otherwise, or when there is only one since
+    shipping it out would cost more than it saves. Each ticket's render
+    time is appended to `timings` if given.
+    """
+    contexts = list(contexts)
+    pool, workers = _pool, _pool_workers
+    if pool is None or workers == 1 or len(contexts) <= 1:
+        results = [timed_render(context, renderer) for context in contexts]
+    else:
+        chunksize = max(1, len(contexts) // (workers * 4))
+        results = list(pool.map(timed_render, contexts, repeat(renderer),
+                                chunksize=chunksize))
+    if timings is not None:
+        timings.extend(seconds for _, seconds in results)
+    return [pdf for pdf, _ in results]
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from django.conf import settings
+
+# Content-addressed cache of rendered ticket PDFs.
+#
+# A ticket is stored under TICKET_PDF_CACHE_DIR/<event_id>/<sha256>.pdf,
+# where the hash covers every value the PDF shows (see
+# emails.utils.ticket_context) plus the renderer and its version. Any
+# change that would alter the PDF therefore changes the key, and an event's
+# directory is dropped when its date or venue changes so stale files don't
+# linger.
+#
+# The cache is bounded by TICKET_PDF_CACHE_MAX_BYTES. Hits touch the file's
+# mtime, and eviction removes the least recently used files.
+
+_lock = threading.Lock()
+_written_since_sweep = 0
+
+
+def cache_key(context, renderer):
+    """Hash of everything that affects how a ticket renders"""
+    # Imported here so loading the cache (e.g. from emails.signals at
+    # startup) doesn't pull in ReportLab
+    from .pdf import RENDERER_VERSIONS
+    payload = json.dumps([RENDERER_VERSIONS[renderer], context], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_path(event_id, key):
+    return os.path.join(settings.TICKET_PDF_CACHE_DIR, str(event_id), f"{key}.pdf")
+
+
+def lookup(event_id, key):
+    """Path of the cached PDF, or None. Marks the entry as recently used."""
+    path = cache_path(event_id, key)
+    try:
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+def store(event_id, key, pdf):
+    """Write a PDF into the cache atomically. Returns its path."""
+    global _written_since_sweep
+    path = cache_path(event_id, key)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(pdf)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Sweeping walks the whole cache, so only do it once a slice of the
+    # budget has been written since the last sweep
+    with _lock:
+        _written_since_sweep += len(pdf)
+        sweep_due = _written_since_sweep >= settings.TICKET_PDF_CACHE_MAX_BYTES // 20
+        if sweep_due:
+            _written_since_sweep = 0
+    if sweep_due:
+        evict()
+    return path
+
+
+def cached_files():
+    """(mtime, size, path) for every cached PDF"""
+    entries = []
+    for root, _, files in os.walk(settings.TICKET_PDF_CACHE_DIR):
+        for name in files:
+            if not name.endswith('.pdf'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def evict(max_bytes=None):
+    """Remove least recently used PDFs until the cache is 90% of its budget.
+
+    Returns the number of files removed.
+    """
+    max_bytes = settings.TICKET_PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = cached_files()
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return 0
+
+    target = max_bytes * 0.9
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def invalidate_event(event_id):
+    """Drop every cached ticket for an event"""
+    shutil.rmtree(os.path.join(settings.TICKET_PDF_CACHE_DIR, str(event_id)),
+                  ignore_errors=True)
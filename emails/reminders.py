@@ -0,0 +1,111 @@
+import logging
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from events.models import Event
+from .bulk import BulkMailer, BulkResult
+from .campaigns import attendee_batches, campaign_message
+from .models import ReminderSent
+
+# Scheduled attendee reminders, 24 hours and 1 hour before an event starts.
+#
+# Meant to run every few minutes (`manage.py send_reminders`). Each run
+# finds events inside a reminder window, walks their attendees in keyset
+# batches and claims a ReminderSent marker per attendee before emailing
+# them. Markers are unique per (event, window, user) and a run only emails
+# the markers carrying its own token, so re-runs and parallel schedulers
+# never double-send. Failed sends drop their marker so the next run retries.
+
+logger = logging.getLogger(__name__)
+
+# Largest first: an event inside the 1h window is not sent the 24h reminder
+REMINDER_WINDOWS = (
+    ('24h', timedelta(hours=24)),
+    ('1h', timedelta(hours=1)),
+)
+
+
+def events_in_window(window, now):
+    """Active events whose `window` reminder is due at `now`"""
+    offsets = [offset for _, offset in REMINDER_WINDOWS]
+    index = [name for name, _ in REMINDER_WINDOWS].index(window)
+    upper = now + offsets[index]
+    lower = now + offsets[index + 1] if index + 1 < len(offsets) else now
+    return Event.objects.filter(
+        is_active=True, start_date__gt=lower, start_date__lte=upper)
+
+
+def claim_reminders(event, window, user_ids, token, now):
+    """Insert markers for these attendees; returns the user ids this run owns"""
+    markers = ReminderSent.objects.filter(
+        event=event, window=window, user_id__in=user_ids)
+    # Building rows is most of bulk_create's cost, so skip attendees that
+    # already have a marker; ignore_conflicts covers a concurrent insert
+    existing = set(markers.values_list('user_id', flat=True))
+    ReminderSent.objects.bulk_create([
+        ReminderSent(event=event, window=window, user_id=user_id,
+                     claimed_by=token, claimed_at=now)
+        for user_id in user_ids if user_id not in existing
+    ], ignore_conflicts=True)
+
+    markers = markers.filter(sent_at__isnull=True)
+    # Take over markers left unsent by a run that died mid-batch
+    markers.filter(
+        claimed_at__lt=now - timedelta(seconds=settings.REMINDER_LEASE_SECONDS),
+    ).exclude(claimed_by=token).update(claimed_by=token, claimed_at=now)
+    return set(markers.filter(claimed_by=token).values_list('user_id', flat=True))
+
+
+def send_reminder_batch(event, window, batch, token, mailer):
+    """Email the attendees in `batch` this run owns. Returns (sent, failed)."""
+    ours = claim_reminders(
+        event, window, [user_id for user_id, _, _ in batch], token, timezone.now())
+    sent = failed = 0
+    chunk = settings.EMAIL_BATCH_SIZE
+    recipients = [row for row in batch if row[0] in ours]
+
+    # Record progress every few messages so a crash re-sends as little as possible
+    for start in range(0, len(recipients), chunk):
+        delivered, undelivered = [], []
+        for user_id, email, name in recipients[start:start + chunk]:
+            try:
+                mailer.send(campaign_message(event, 'reminder', email, name))
+                delivered.append(user_id)
+            except Exception as e:
+                logger.warning("Reminder to %s for event #%s failed: %s", email, event.id, e)
+                undelivered.append(user_id)
+
+        mine = ReminderSent.objects.filter(
+            event=event, window=window, claimed_by=token, sent_at__isnull=True)
+        if delivered:
+            mine.filter(user_id__in=delivered).update(sent_at=timezone.now())
+        if undelivered:
+            mine.filter(user_id__in=undelivered).delete()
+        sent += len(delivered)
+        failed += len(undelivered)
+    return sent, failed
+
+
+def run_reminders(now=None, mailer=None, batch_size=None):
+    """Send every reminder that is due. Returns a BulkResult."""
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    owns_mailer = mailer is None
+    mailer = mailer or BulkMailer()
+    start = time.perf_counter()
+    sent = failed = 0
+    try:
+        for window, _ in REMINDER_WINDOWS:
+            for event in events_in_window(window, now):
+                for batch in attendee_batches(event, batch_size):
+                    batch_sent, batch_failed = send_reminder_batch(
+                        event, window, batch, token, mailer)
+                    sent += batch_sent
+                    failed += batch_failed
+    finally:
+        if owns_mailer:
+            mailer.close()
+    return BulkResult(sent, failed, time.perf_counter() - start)
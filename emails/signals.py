@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from events.models import Event
+from .pdf_cache import invalidate_event
+
+# Event fields printed on tickets. Cached PDFs are content-addressed, so
+# they can never be served stale; this just frees the old files promptly.
+TICKET_FIELDS = ('title', 'start_date', 'venue')
+
+
+@receiver(pre_save, sender=Event)
+def invalidate_ticket_pdfs(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Drop an event's cached tickets when its date, venue or title changes"""
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(TICKET_FIELDS):
+        return
+    old = Event.objects.filter(pk=instance.pk).values(*TICKET_FIELDS).first()
+    if old and any(old[field] != getattr(instance, field) for field in TICKET_FIELDS):
+        event_id = instance.pk
+        transaction.on_commit(lambda: invalidate_event(event_id))
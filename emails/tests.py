@@ -1,3 +1,253 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from smtplib import SMTPServerDisconnected
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends import locmem
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from bookings.models import Booking
+from events.models import Event
+from payments.models import Payment
+from . import outbox, pdf, pdf_cache
+from .bulk import BulkMailer, SendThrottle, send_bulk
+from .campaigns import campaign_message
+from .layouts import MARKER, Layout
+from .models import ReminderSent, TicketDelivery
+from .reminders import run_reminders
+from .utils import generate_ticket_pdfs, ticket_context, ticket_fields, ticket_layouts
 
-# Create your tests here.
+
+def create_booking(event=None, username='buyer', status='confirmed'):
+    """A paid booking for next week's event (or `event`)"""
+    if event is None:
+        start = timezone.now() + timedelta(days=7)
+        event = Event.objects.create(
+            title="Test Event", description="Test event", venue="KICC",
+            start_date=start, end_date=start + timedelta(hours=4),
+            total_capacity=100)
+    user = User.objects.create_user(username, f'{username}@example.com')
+    booking = Booking.objects.create(
+        user=user, event=event, ticket_type='regular', quantity=1,
+        unit_price=Decimal('500'), total_price=Decimal('500'), status=status)
+    Payment.objects.create(
+        booking=booking, user=user, phone_number='254708374149',
+        amount=booking.total_price, status='successful',
+        mpesa_receipt_number=f'TEST{booking.id:06d}')
+    return booking
+
+
+class FlakyBackend(locmem.EmailBackend):
+    """locmem backend whose next `failures` sends fail, like a dropped
+    SMTP session. Records the size of each send_messages call."""
+    failures = 0
+    batches = []
+
+    def send_messages(self, messages):
+        FlakyBackend.batches.append(len(messages))
+        if FlakyBackend.failures:
+            FlakyBackend.failures -= 1
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+        return super().send_messages(messages)
+
+
+class TicketDeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.booking = create_booking()
+        TicketDelivery.enqueue(cls.booking.id)
+
+    def test_resend_leaves_a_ticket_being_sent_alone(self):
+        [claimed] = outbox.claim_batch(10)
+        self.assertEqual(TicketDelivery.resend([self.booking.id]), 0)
+        # Still leased to the first worker, so nobody else picks it up
+        self.assertEqual(outbox.claim_batch(10), [])
+
+        with mock.patch('emails.outbox.send_ticket_email',
+                        return_value=(True, "Sent")) as send:
+            self.assertTrue(outbox.deliver(claimed))
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(TicketDelivery.objects.get(booking=self.booking).status, 'sent')
+
+        self.assertEqual(TicketDelivery.resend([self.booking.id]), 1)
+        delivery = TicketDelivery.objects.get(booking=self.booking)
+        self.assertEqual((delivery.status, delivery.attempts), ('pending', 0))
+
+
+class ReminderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + timedelta(minutes=30)
+        cls.event = Event.objects.create(
+            title="Test Event", description="Test event", venue="KICC",
+            start_date=start, end_date=start + timedelta(hours=4),
+            total_capacity=100)
+        for i in range(3):
+            create_booking(cls.event, f'guest{i}')
+
+    def test_reminder_is_sent_once(self):
+        mailer = mock.Mock()
+        self.assertEqual(run_reminders(mailer=mailer).sent, 3)
+        self.assertEqual(run_reminders(mailer=mailer).sent, 0)
+        self.assertEqual(mailer.send.call_count, 3)
+        self.assertEqual(ReminderSent.objects.filter(
+            event=self.event, window='1h', sent_at__isnull=False).count(), 3)
+
+    def test_failed_reminder_is_retried(self):
+        mailer = mock.Mock()
+        mailer.send.side_effect = [ConnectionError("SMTP down"), None, None, None]
+        with self.assertLogs('emails.reminders', 'WARNING'):
+            self.assertEqual(tuple(run_reminders(mailer=mailer)[:2]), (2, 1))
+        self.assertEqual(run_reminders(mailer=mailer).sent, 1)
+        self.assertEqual(mailer.send.call_count, 4)
+
+
+class EmailLayoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.booking = create_booking()
+        cls.event = cls.booking.event
+        cls.event.title = '<b>Gala</b> & "Friends"'
+        cls.event.save()
+        cls.booking.user.first_name = '<script>alert(1)</script>'
+        cls.booking.user.save()
+
+    def setUp(self):
+        layouts = mock.patch.dict('emails.layouts._layouts', clear=True)
+        layouts.start()
+        self.addCleanup(layouts.stop)
+
+    def test_layout_matches_a_full_render(self):
+        html, text = ticket_layouts(self.event)
+        self.assertIsNotNone(html.chunks)
+        self.assertIsNotNone(text.chunks)
+        fields = ticket_fields(self.booking, self.booking.payment, 'EVT-CODE')
+        body = html.fill(fields)
+        self.assertEqual(body, render_to_string(
+            'ticket_email.html', {'event': self.event, **fields}))
+        # Event and attendee text are escaped once, not twice
+        self.assertIn('&lt;b&gt;Gala&lt;/b&gt; &amp; &quot;Friends&quot;', body)
+        self.assertIn('&lt;script&gt;alert(1)&lt;/script&gt;', body)
+        self.assertNotIn('&amp;lt;', body)
+        self.assertIn('Event: <b>Gala</b> & "Friends"', text.fill(fields))
+
+    def test_field_through_a_filter_falls_back_to_full_render(self):
+        with self.assertLogs('emails.layouts', 'WARNING'):
+            layout = Layout(lambda values: f"Hello {values['name'].upper()}",
+                            ['name'], html=False)
+        self.assertEqual(layout.fill({'name': 'Wanjiru'}), 'Hello WANJIRU')
+
+    def test_marker_in_event_text_falls_back_to_full_render(self):
+        self.event.title = f'Gala{MARKER}'
+        with self.assertLogs('emails.layouts', 'WARNING'):
+            message = campaign_message(self.event, 'announcement', 'a@example.com',
+                                       '<i>Amina</i>', message='Gates open at 6')
+        html = message.alternatives[0][0]
+        self.assertIn('&lt;i&gt;Amina&lt;/i&gt;', html)
+        self.assertIn(f'Gala{MARKER}', html)
+        self.assertTrue(message.body.startswith('Hello <i>Amina</i>,'))
+
+
+class PdfCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(TICKET_PDF_CACHE_DIR=directory,
+                                     TICKET_PDF_CACHE_MAX_BYTES=1000)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def store(self, key, last_used):
+        path = pdf_cache.store(1, key, b'%' * 300)
+        os.utime(path, (last_used, last_used))
+        return path
+
+    def test_least_recently_used_are_evicted_past_the_cap(self):
+        for last_used, key in enumerate(['a', 'b', 'c'], start=1):
+            self.store(key, last_used)
+        # A hit makes 'a' the most recently used
+        self.assertIsNotNone(pdf_cache.lookup(1, 'a'))
+
+        # 1200 bytes: 'b' goes, leaving 900, within 90% of the cap
+        pdf_cache.store(1, 'd', b'%' * 300)
+        self.assertIsNone(pdf_cache.lookup(1, 'b'))
+        for key in ('a', 'c', 'd'):
+            self.assertIsNotNone(pdf_cache.lookup(1, key))
+        self.assertEqual(sum(size for _, size, _ in pdf_cache.cached_files()), 900)
+
+    def test_eviction_stops_at_90_percent(self):
+        with override_settings(TICKET_PDF_CACHE_MAX_BYTES=10_000):
+            for last_used, key in enumerate('abcdef', start=1):
+                self.store(key, last_used)
+        self.assertEqual(pdf_cache.evict(max_bytes=1800), 0)
+        self.assertEqual(pdf_cache.evict(max_bytes=700), 4)
+        self.assertEqual(sorted(os.path.basename(path) for _, _, path
+                                in pdf_cache.cached_files()), ['e.pdf', 'f.pdf'])
+
+
+@override_settings(EMAIL_BACKEND='emails.tests.FlakyBackend')
+class BulkMailerTests(TestCase):
+    def setUp(self):
+        FlakyBackend.failures = 0
+        FlakyBackend.batches = []
+        self.mailer = BulkMailer(throttle=SendThrottle(rate=0), per_connection=10)
+        self.addCleanup(self.mailer.close)
+
+    def messages(self, count):
+        return (EmailMessage("Hello", "Body", to=[f'guest{i}@example.com'])
+                for i in range(count))
+
+    def test_batches_share_a_connection(self):
+        result = send_bulk(self.messages(12), batch_size=5, mailer=self.mailer)
+        self.assertEqual(result[:2], (12, 0))
+        self.assertEqual(len(mail.outbox), 12)
+        self.assertEqual(FlakyBackend.batches, [5, 5, 2])
+        # A new connection once 10 messages have gone over one
+        self.assertEqual(self.mailer.connections_opened, 2)
+
+    def test_reconnects_after_a_failed_batch(self):
+        FlakyBackend.failures = 1
+        with self.assertLogs('emails.bulk', 'WARNING'):
+            result = send_bulk(self.messages(8), batch_size=4, mailer=self.mailer)
+        self.assertEqual(result[:2], (4, 4))
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(self.mailer.connections_opened, 2)
+
+    def test_single_send_reconnects_after_a_failure(self):
+        FlakyBackend.failures = 1
+        message, retry = self.messages(2)
+        with self.assertRaises(SMTPServerDisconnected):
+            self.mailer.send(message)
+        self.mailer.send(retry)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.mailer.connections_opened, 2)
+
+
+class TicketRenderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        first = create_booking()
+        second = create_booking(first.event, 'guest')
+        cls.tickets = [(booking, booking.payment) for booking in (first, second)]
+
+    def test_renders_in_process_without_a_pool(self):
+        # As in a web request, e.g. the ticket export
+        with mock.patch('emails.pdf.ProcessPoolExecutor') as executor:
+            pdfs = generate_ticket_pdfs(self.tickets)
+        executor.assert_not_called()
+        self.assertEqual([content[:5] for content in pdfs], [b'%PDF-'] * 2)
+
+    def test_pool_workers_do_not_fork_this_process(self):
+        pdf.start_pool(2)
+        self.addCleanup(pdf.shutdown_pool)
+        self.assertIn(pdf._pool._mp_context.get_start_method(), ('forkserver', 'spawn'))
+        contexts = [ticket_context(*ticket) for ticket in self.tickets]
+        # PDFs carry a timestamped ID, so compare everything but that
+        self.assertEqual([len(content) for content in pdf.render_tickets(contexts)],
+                         [len(pdf.render_ticket(context)) for context in contexts])
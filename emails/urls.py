@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('ticket/<int:booking_id>/', views.download_ticket, name='download_ticket'),
+    path('export/<int:event_id>/', views.export_event_tickets, name='export_event_tickets'),
+]
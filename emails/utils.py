@@ -1,176 +1,125 @@
+import logging
 import os
 from io import BytesIO
 from datetime import datetime
+from email.mime.image import MIMEImage
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-
-
-def generate_ticket_pdf(booking, payment):
-    """Generate PDF ticket for a booking"""
-    buffer = BytesIO()
-
-    # Create PDF document
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-    )
-
-    # Prepare story (content)
-    story = []
-
-    # Styles
-    styles = getSampleStyleSheet()
+from bookings.ticket_codes import ticket_code
+from eventify import metrics
+from . import pdf_cache
+from .layouts import Layout, cached_layout, template_layout
+
+# ReportLab and Pillow (emails.pdf) take a noticeable share of a cold start,
+# so they are imported by the functions that render, not at module load.
+
+logger = logging.getLogger(__name__)
+
+
+def ticket_context(booking, payment):
+    """Everything a ticket PDF shows, as plain strings the renderer can pickle"""
+    event = booking.event
+    return {
+        'event_title': event.title,
+        'event_date': event.start_date.strftime('%A, %B %d, %Y'),
+        'event_time': event.start_date.strftime('%I:%M %p'),
+        'venue': event.venue,
+        'ticket_type': f"{booking.get_ticket_type_display()} TICKET",
+        'quantity': str(booking.quantity),
+        'quantity_label': f"{booking.quantity} ticket(s)",
+        'booking_ref': f"#{booking.id}",
+        'receipt_number': str(payment.mpesa_receipt_number),
+        'customer_name': booking.user.get_full_name() or booking.user.username,
+        'customer_email': booking.user.email,
+        'booked_at': booking.created_at.strftime('%Y-%m-%d %I:%M %p'),
+        'unit_price': str(booking.unit_price),
+        'total_price': str(booking.total_price),
+        'payment_status': payment.get_status_display(),
+        'ticket_code': ticket_code(booking),
+    }
+
+
+def _cache_ticket(event_id, key, pdf):
+    try:
+        return pdf_cache.store(event_id, key, pdf)
+    except OSError as e:
+        logger.warning("Could not cache ticket PDF: %s", e)
+        return None
 
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor("#340BED"),
-        alignment=TA_CENTER,
-        spaceAfter=30
-    )
 
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor("#E11616"),
-        alignment=TA_CENTER,
-        spaceAfter=20
-    )
+def _read_cached(event_id, key):
+    path = pdf_cache.lookup(event_id, key)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        # Evicted between the lookup and the read
+        return None
 
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=12,
-        textColor=colors.HexColor("#060505"),
-        spaceAfter=10
-    )
 
-    # Header with logo
-    story.append(Paragraph("🎪 EVENTIFY", title_style))
-    story.append(Paragraph("E-TICKET", subtitle_style))
-    story.append(Spacer(1, 20))
-
-    # Event Details
-    story.append(Paragraph("<b>EVENT DETAILS</b>", styles['Heading2']))
-    story.append(Spacer(1, 10))
-
-    event_details = [
-        ["Event:", f"<b>{booking.event.title}</b>"],
-        ["Date:",
-            f"<b>{booking.event.start_date.strftime('%A, %B %d, %Y')}</b>"],
-        ["Time:", f"<b>{booking.event.start_date.strftime('%I:%M %p')}</b>"],
-        ["Venue:", f"<b>{booking.event.venue}</b>"],
-    ]
-
-    for label, value in event_details:
-        story.append(Paragraph(f"{label}", info_style))
-        story.append(Paragraph(f"{value}", info_style))
-        story.append(Spacer(1, 5))
-
-    story.append(Spacer(1, 20))
-
-    # Ticket Details
-    story.append(Paragraph("<b>TICKET INFORMATION</b>", styles['Heading2']))
-    story.append(Spacer(1, 10))
-
-    ticket_details = [
-        ["Ticket Type:", f"<b>{booking.get_ticket_type_display()} TICKET</b>"],
-        ["Quantity:", f"<b>{booking.quantity} ticket(s)</b>"],
-        ["Booking ID:", f"<b>#{booking.id}</b>"],
-        ["Transaction ID:", f"<b>{payment.mpesa_receipt_number}</b>"],
-    ]
-
-    for label, value in ticket_details:
-        story.append(Paragraph(f"{label}", info_style))
-        story.append(Paragraph(f"{value}", info_style))
-        story.append(Spacer(1, 5))
-
-    story.append(Spacer(1, 20))
-
-    # Customer Information
-    story.append(Paragraph("<b>CUSTOMER INFORMATION</b>", styles['Heading2']))
-    story.append(Spacer(1, 10))
-
-    customer_details = [
-        ["Name:",
-            f"<b>{booking.user.get_full_name() or booking.user.username}</b>"],
-        ["Email:", f"<b>{booking.user.email}</b>"],
-        ["Booking Date:",
-            f"<b>{booking.created_at.strftime('%Y-%m-%d %I:%M %p')}</b>"],
-    ]
-
-    for label, value in customer_details:
-        story.append(Paragraph(f"{label}", info_style))
-        story.append(Paragraph(f"{value}", info_style))
-        story.append(Spacer(1, 5))
-
-    story.append(Spacer(1, 20))
-
-    # Price Summary
-    story.append(Paragraph("<b>PRICE SUMMARY</b>", styles['Heading2']))
-    story.append(Spacer(1, 10))
-
-    price_data = [
-        ["Description", "Amount"],
-        ["Ticket Price", f"KSh {booking.unit_price}"],
-        ["Quantity", f"{booking.quantity}"],
-        ["Total Amount", f"<b>KSh {booking.total_price}</b>"],
-        ["Payment Status", f"<b>{payment.get_status_display()}</b>"],
-    ]
-
-    price_table = Table(price_data, colWidths=[3*inch, 2*inch])
-    price_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8f9fa')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.gray),
-    ]))
-
-    story.append(price_table)
-    story.append(Spacer(1, 30))
-
-    # Footer Note
-    footer_style = ParagraphStyle(
-        'FooterStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.gray,
-        alignment=TA_CENTER
-    )
+def _render(context):
+    """Render one ticket PDF in this process, recording how long it took"""
+    from .pdf import timed_render
+    pdf, seconds = timed_render(context, settings.TICKET_PDF_RENDERER)
+    metrics.pdf_render.observe(seconds, renderer=settings.TICKET_PDF_RENDERER)
+    return pdf
 
-    story.append(Paragraph(
-        "Present this e-ticket at the event entrance. "
-        "For any inquiries, contact support@eventify.com",
-        footer_style
-    ))
 
-    # Build PDF
-    doc.build(story)
+def generate_ticket_pdf(booking, payment):
+    """Generate PDF ticket for a booking, reusing the cached copy if any"""
+    context = ticket_context(booking, payment)
+    key = pdf_cache.cache_key(context, settings.TICKET_PDF_RENDERER)
+    pdf = _read_cached(booking.event_id, key)
+    if pdf is None:
+        pdf = _render(context)
+        _cache_ticket(booking.event_id, key, pdf)
+    return pdf
 
-    # Get PDF value
-    pdf = buffer.getvalue()
-    buffer.close()
 
-    return pdf
+def generate_ticket_pdfs(tickets):
+    """Generate PDFs for (booking, payment) pairs, rendering cache misses on
+    the renderer pool if this process started one"""
+    from .pdf import render_tickets
+    pdfs, misses = [], []
+    for position, (booking, payment) in enumerate(tickets):
+        context = ticket_context(booking, payment)
+        key = pdf_cache.cache_key(context, settings.TICKET_PDF_RENDERER)
+        pdfs.append(_read_cached(booking.event_id, key))
+        if pdfs[-1] is None:
+            misses.append((position, booking.event_id, key, context))
+
+    timings = []
+    rendered = render_tickets([context for *_, context in misses],
+                              renderer=settings.TICKET_PDF_RENDERER,
+                              timings=timings)
+    for seconds in timings:
+        metrics.pdf_render.observe(seconds, renderer=settings.TICKET_PDF_RENDERER)
+    for (position, event_id, key, _), pdf in zip(misses, rendered):
+        pdfs[position] = pdf
+        _cache_ticket(event_id, key, pdf)
+    return pdfs
+
+
+def open_ticket_pdf(booking, payment):
+    """Open the booking's ticket PDF for reading, rendering it on a cache miss"""
+    context = ticket_context(booking, payment)
+    key = pdf_cache.cache_key(context, settings.TICKET_PDF_RENDERER)
+    path = pdf_cache.lookup(booking.event_id, key)
+    if path is not None:
+        try:
+            return open(path, 'rb')
+        except OSError:
+            pass
+    pdf = _render(context)
+    path = _cache_ticket(booking.event_id, key, pdf)
+    if path is not None:
+        try:
+            return open(path, 'rb')
+        except OSError:
+            pass
+    return BytesIO(pdf)
 
 
 def format_phone_number(phone):
@@ -198,74 +147,132 @@ def format_phone_number(phone):
         return None
 
 
-def send_ticket_email(booking, payment):
-    """Send ticket email with PDF attachment"""
-    try:
-        # Generate PDF ticket
-        pdf_content = generate_ticket_pdf(booking, payment)
+TICKET_FIELDS = (
+    'name', 'ticket_type', 'badge', 'badge_label', 'quantity', 'booking_id',
+    'receipt_number', 'unit_price', 'total_price', 'payment_status', 'ticket_code',
+)
 
-        # Prepare email
-        subject = f"🎫 Your Event Ticket: {booking.event.title}"
+# The fields the text ticket shows
+TEXT_TICKET_FIELDS = (
+    'name', 'ticket_type', 'quantity', 'total_price', 'booking_id',
+    'receipt_number', 'ticket_code',
+)
 
-        # HTML email content
-        html_content = render_to_string('ticket_email.html', {
-            'booking': booking,
-            'payment': payment,
-            'user': booking.user,
-        })
+BADGES = {'vip': 'vip', 'vvip': 'vvip'}
 
+
+def ticket_layouts(event):
+    """(html, text) layouts of the ticket email, built once per event"""
+    def build():
+        html = template_layout('ticket_email.html', {'event': event}, TICKET_FIELDS)
         # Text email content (fallback)
-        text_content = f"""
-        EVENTIFY - Your Ticket Confirmation
-        
-        Hello {booking.user.get_full_name() or booking.user.username},
-        
-        Thank you for your booking! Here are your ticket details:
-        
-        Event: {booking.event.title}
-        Date: {booking.event.start_date.strftime('%A, %B %d, %Y')}
-        Time: {booking.event.start_date.strftime('%I:%M %p')}
-        Venue: {booking.event.venue}
-        
-        Ticket Type: {booking.get_ticket_type_display()}
-        Quantity: {booking.quantity}
-        Total Amount: KSh {booking.total_price}
-        
-        Your e-ticket is attached as a PDF. Please present it at the event entrance.
-        
-        Booking ID: #{booking.id}
-        Transaction ID: {payment.mpesa_receipt_number}
-        
-        Thank you for choosing EVENTIFY!
-        
-        Best regards,
-        EVENTIFY Team
-        """
-
-        # Create email
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[booking.user.email],
-            bcc=[settings.DEFAULT_FROM_EMAIL]  # Keep copy for admin
-        )
-
-        # Attach HTML content
-        email.attach_alternative(html_content, "text/html")
-
-        # Attach PDF
-        email.attach(
-            filename=f"ticket_{booking.id}_{booking.user.username}.pdf",
-            content=pdf_content,
-            mimetype="application/pdf"
-        )
+        text = Layout(lambda field: f"""
+    EVENTIFY - Your Ticket Confirmation
+    
+    Hello {field['name']},
+    
+    Thank you for your booking! Here are your ticket details:
+    
+    Event: {event.title}
+    Date: {event.start_date.strftime('%A, %B %d, %Y')}
+    Time: {event.start_date.strftime('%I:%M %p')}
+    Venue: {event.venue}
+    
+    Ticket Type: {field['ticket_type']}
+    Quantity: {field['quantity']}
+    Total Amount: KSh {field['total_price']}
+    
+    Your e-ticket is attached as a PDF. Please present it at the event entrance.
+    
+    Booking ID: #{field['booking_id']}
+    Transaction ID: {field['receipt_number']}
+    Entry Code: {field['ticket_code']}
+    
+    Thank you for choosing EVENTIFY!
+    
+    Best regards,
+    EVENTIFY Team
+    """, TEXT_TICKET_FIELDS, html=False)
+        return html, text
+    return cached_layout(('ticket_email', event.pk, event.updated_at), build)
+
+
+def ticket_fields(booking, payment, code):
+    """The per-attendee values of a ticket email"""
+    ticket_type = booking.get_ticket_type_display()
+    return {
+        'name': booking.user.get_full_name() or booking.user.username,
+        'ticket_type': ticket_type,
+        'badge': BADGES.get(booking.ticket_type, 'success'),
+        'badge_label': ticket_type.upper(),
+        'quantity': booking.quantity,
+        'booking_id': booking.id,
+        'receipt_number': payment.mpesa_receipt_number,
+        'unit_price': booking.unit_price,
+        'total_price': booking.total_price,
+        'payment_status': payment.get_status_display(),
+        'ticket_code': code,
+    }
+
+
+def ticket_message(booking, payment, pdf_content):
+    """Build the ticket email with its PDF attached and the QR code inline.
+
+    Admins no longer get a BCC of every ticket; see `manage.py send_ticket_digest`.
+    """
+    from .pdf import qr_png
+
+    # Prepare email
+    subject = f"🎫 Your Event Ticket: {booking.event.title}"
+    code = ticket_code(booking)
+    html_layout, text_layout = ticket_layouts(booking.event)
+    fields = ticket_fields(booking, payment, code)
+
+    # Create email
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=text_layout.fill(fields),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[booking.user.email],
+    )
+
+    # Attach HTML content
+    email.attach_alternative(html_layout.fill(fields), "text/html")
+
+    # Attach PDF
+    email.attach(
+        filename=f"ticket_{booking.id}_{booking.user.username}.pdf",
+        content=pdf_content,
+        mimetype="application/pdf"
+    )
+
+    # QR code shown inline by the HTML part (cid:ticket-qr)
+    email.mixed_subtype = 'related'
+    qr_image = MIMEImage(qr_png(code), 'png')
+    qr_image.add_header('Content-ID', '<ticket-qr>')
+    qr_image.add_header('Content-Disposition', 'inline', filename='ticket-qr.png')
+    email.attach(qr_image)
+
+    return email
+
+
+def send_ticket_email(booking, payment, pdf_content=None, mailer=None):
+    """Send ticket email with PDF attachment, over the mailer's connection if given"""
+    try:
+        # Generate PDF ticket unless it was rendered in a batch already
+        if pdf_content is None:
+            pdf_content = generate_ticket_pdf(booking, payment)
+
+        email = ticket_message(booking, payment, pdf_content)
 
         # Send email
-        email.send(fail_silently=False)
+        if mailer is not None:
+            mailer.send(email)
+        else:
+            email.send(fail_silently=False)
 
         return True, "Ticket email sent successfully!"
 
     except Exception as e:
-        print(f"Error sending ticket email: {e}")
+        logger.warning("Error sending ticket email: %s", e)
         return False, str(e)
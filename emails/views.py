@@ -1,97 +1,36 @@
-from django.shortcuts import render
-from io import BytesIO
+from django.shortcuts import render, get_object_or_404
+from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from bookings.models import Booking
+from events.models import Event
+from .export import stream_event_tickets
+from .utils import open_ticket_pdf
 
-# Create your views here.
-def generate_ticket_pdf(booking, payment):
-    """Generate simple PDF ticket for a booking"""
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Title
-    p.setFont("Helvetica-Bold", 24)
-    p.drawCentredString(width/2, height-100, "🎪 EVENTIFY")
-    p.setFont("Helvetica", 18)
-    p.drawCentredString(width/2, height-130, "E-TICKET")
-    
-    # Event Details
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(100, height-180, "EVENT DETAILS:")
-    p.setFont("Helvetica", 12)
-    
-    details = [
-        f"Event: {booking.event.title}",
-        f"Date: {booking.event.start_date.strftime('%A, %B %d, %Y')}",
-        f"Time: {booking.event.start_date.strftime('%I:%M %p')}",
-        f"Venue: {booking.event.venue}",
-    ]
-    
-    y = height-210
-    for detail in details:
-        p.drawString(120, y, detail)
-        y -= 25
-    
-    # Ticket Information
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(100, y-30, "TICKET INFORMATION:")
-    p.setFont("Helvetica", 12)
-    
-    ticket_info = [
-        f"Ticket Type: {booking.get_ticket_type_display()}",
-        f"Quantity: {booking.quantity}",
-        f"Booking ID: #{booking.id}",
-        f"Transaction ID: {payment.mpesa_receipt_number}",
-    ]
-    
-    y -= 60
-    for info in ticket_info:
-        p.drawString(120, y, info)
-        y -= 25
-    
-    # Customer Information
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(100, y-30, "CUSTOMER INFORMATION:")
-    p.setFont("Helvetica", 12)
-    
-    customer_info = [
-        f"Name: {booking.user.get_full_name() or booking.user.username}",
-        f"Email: {booking.user.email}",
-        f"Booking Date: {booking.created_at.strftime('%Y-%m-%d %I:%M %p')}",
-    ]
-    
-    y -= 60
-    for info in customer_info:
-        p.drawString(120, y, info)
-        y -= 25
-    
-    # Price Summary
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(100, y-30, "PRICE SUMMARY:")
-    p.setFont("Helvetica", 12)
-    
-    price_info = [
-        f"Ticket Price: KSh {booking.unit_price}",
-        f"Quantity: {booking.quantity}",
-        f"Total Amount: KSh {booking.total_price}",
-        f"Payment Status: {payment.get_status_display()}",
-    ]
-    
-    y -= 60
-    for info in price_info:
-        p.drawString(120, y, info)
-        y -= 25
-    
-    # Footer
-    p.setFont("Helvetica-Oblique", 10)
-    p.drawCentredString(width/2, 50, "Present this ticket at the event entrance.")
-    p.drawCentredString(width/2, 35, "For inquiries: support@eventify.com")
-    
-    p.showPage()
-    p.save()
-    
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
\ No newline at end of file
+
+@login_required
+def download_ticket(request, booking_id):
+    """Serve the ticket PDF for a confirmed booking from the PDF cache"""
+    booking = get_object_or_404(
+        Booking.objects.select_related('user', 'event', 'payment'),
+        id=booking_id, user=request.user, status='confirmed')
+    payment = getattr(booking, 'payment', None)
+    if payment is None:
+        raise Http404("No ticket for this booking")
+    return FileResponse(
+        open_ticket_pdf(booking, payment),
+        as_attachment=True,
+        filename=f"ticket_{booking.id}_{booking.user.username}.pdf",
+        content_type='application/pdf',
+    )
+
+
+@staff_member_required
+def export_event_tickets(request, event_id):
+    """Stream every confirmed ticket for an event as a ZIP"""
+    event = get_object_or_404(Event, id=event_id)
+    response = StreamingHttpResponse(
+        stream_event_tickets(event), content_type='application/zip')
+    response['Content-Disposition'] = (
+        f'attachment; filename="event_{event.id}_tickets.zip"')
+    return response
@@ -0,0 +1,113 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Read replicas with read-your-writes.
+#
+# Reads go to the primary unless they run inside use_replica() (or a view
+# wrapped in read_only_view), which picks one replica for the whole block so
+# a page never mixes two replicas' states. Writes always go to the primary.
+#
+# Replicas lag the primary, so a user who has just booked or paid could load
+# My Bookings from a replica that hasn't seen it yet. ReplicaPinMiddleware
+# notes when a request writes and sets a short-lived cookie; while the cookie
+# is there, that user's reads stay on the primary. A cookie rather than
+# server-side state keeps the pin working across workers and hosts.
+
+PIN_COOKIE = 'eventify_primary'
+
+# The replica for reads in the current block, or None for the primary
+_replica = ContextVar('replica', default=None)
+# {'pinned': bool, 'wrote': bool} for the request being handled. Mutated in
+# place: async views run their sync parts in copies of the context.
+_request = ContextVar('replica_request', default=None)
+
+
+def pinned():
+    state = _request.get()
+    return state is not None and state['pinned']
+
+
+def replicas():
+    """Replica aliases. Test mirrors, which share the primary's database
+    (NAME), are left out so tests don't need a second connection."""
+    primary = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    return [alias for alias in settings.REPLICA_DATABASES
+            if connections[alias].settings_dict['NAME'] != primary]
+
+
+@contextmanager
+def use_replica():
+    """Run the block's reads on a replica, unless the user is pinned"""
+    alias = None
+    if settings.REPLICA_DATABASES and not pinned():
+        alias = random.choice(replicas() or [None])
+    token = _replica.set(alias)
+    try:
+        yield alias
+    finally:
+        _replica.reset(token)
+
+
+def read_only_view(view):
+    """Serve a view's reads from a replica. The view must not write."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with use_replica():
+            response = view(request, *args, **kwargs)
+            # TemplateResponses render their querysets after the view returns
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Keep a user's reads on the primary for a while after they write"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {'pinned': PIN_COOKIE in request.COOKIES, 'wrote': False}
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        if state['wrote']:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+
+class ReplicaAdminMixin:
+    """ModelAdmin mixin serving changelist pages from a replica"""
+
+    def changelist_view(self, request, extra_context=None):
+        # POSTs run admin actions and list_editable saves
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        return read_only_view(super().changelist_view)(request, extra_context)
@@ -0,0 +1,289 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: files of exited processes are kept
+    fcntl = None
+
+# Counters and histograms shared by every worker process, for /metrics.
+#
+# Each process writes its own file in METRICS_DIR (<pid>.metrics), so
+# updates take no locks across processes; /metrics reads every file and
+# adds them up. A file is a memory-mapped list of (key, float64) entries
+# behind an 8-byte header holding the bytes in use. An entry is appended
+# whole before the header moves past it, so readers never see half of one.
+#
+# Files outlive their process so counters keep counting across worker
+# restarts. So that they don't pile up, /metrics folds the file of every
+# process that has exited into one aggregate file (merged.metrics) and
+# deletes it. Merging and reading both hold an exclusive lock on
+# merged.lock, so a scrape never counts a file twice. Empty METRICS_DIR when
+# deploying a new release if you want the counts to start again from zero.
+
+INITIAL_SIZE = 64 * 1024
+HEADER = struct.Struct('<Q')
+KEY_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+AGGREGATE = 'merged.metrics'
+
+
+def _entries(data):
+    """(key, value offset) for each entry in a metrics file's bytes"""
+    used = HEADER.unpack_from(data, 0)[0]
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(data, position)[0]
+        key = bytes(data[position + 4:position + 4 + length]).decode()
+        # Values are 8-byte aligned
+        position += (4 + length + 7) & ~7
+        yield key, position
+        position += VALUE.size
+
+
+class ValueFile:
+    """Float values by key in one process's memory-mapped file"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        if HEADER.unpack_from(self.map, 0)[0] == 0:
+            HEADER.pack_into(self.map, 0, HEADER.size)
+        self.positions = dict(_entries(self.map))
+
+    def add(self, key, amount):
+        position = self.positions.get(key)
+        if position is None:
+            position = self._append(key)
+        VALUE.pack_into(
+            self.map, position, VALUE.unpack_from(self.map, position)[0] + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        used = HEADER.unpack_from(self.map, 0)[0]
+        value_at = used + ((4 + len(encoded) + 7) & ~7)
+        end = value_at + VALUE.size
+        if end > len(self.map):
+            self.map.close()
+            self.file.truncate(max(end, 2 * os.fstat(self.file.fileno()).st_size))
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        KEY_LENGTH.pack_into(self.map, used, len(encoded))
+        self.map[used + 4:used + 4 + len(encoded)] = encoded
+        VALUE.pack_into(self.map, value_at, 0.0)
+        HEADER.pack_into(self.map, 0, end)
+        self.positions[key] = value_at
+        return value_at
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+_file = None
+_file_pid = None
+_lock = threading.Lock()
+
+
+def add(key, amount):
+    """Add to a value in this process's file, opening it on first use (and
+    again after a fork)"""
+    global _file, _file_pid
+    with _lock:
+        if _file_pid != os.getpid():
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            _file = ValueFile(os.path.join(
+                settings.METRICS_DIR, f'{os.getpid()}.metrics'))
+            _file_pid = os.getpid()
+        _file.add(key, amount)
+
+
+def _read(path):
+    """{key: value} from one metrics file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return {}
+    return {key: VALUE.unpack_from(data, position)[0]
+            for key, position in _entries(data)}
+
+
+def _exited(path):
+    """Whether the process that wrote <pid>.metrics has exited"""
+    name = os.path.basename(path)[:-len('.metrics')]
+    if not name.isdigit() or int(name) == os.getpid():
+        return False
+    try:
+        os.kill(int(name), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+@contextmanager
+def _locked():
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(settings.METRICS_DIR, 'merged.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _merge_exited(paths):
+    """Fold the files of exited processes into the aggregate file and
+    delete them. Returns the paths still in use. Call with the lock held."""
+    exited = [path for path in paths if fcntl is not None and _exited(path)]
+    if not exited:
+        return paths
+    aggregate = ValueFile(os.path.join(settings.METRICS_DIR, AGGREGATE))
+    try:
+        for path in exited:
+            for key, value in _read(path).items():
+                aggregate.add(key, value)
+            os.remove(path)
+    finally:
+        aggregate.close()
+    return [path for path in paths if path not in exited] + [
+        os.path.join(settings.METRICS_DIR, AGGREGATE)]
+
+
+def collect():
+    """Values summed across every process's file: {key: value}"""
+    if not os.path.isdir(settings.METRICS_DIR):
+        return {}
+    totals = {}
+    with _locked():
+        paths = sorted(set(_merge_exited(
+            glob.glob(os.path.join(settings.METRICS_DIR, '*.metrics')))))
+        for path in paths:
+            for key, value in _read(path).items():
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _key(name, labels):
+    return f'{name}\x00{json.dumps(labels, sort_keys=True)}'
+
+
+def _number(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+
+    def inc(self, amount=1, **labels):
+        add(_key(self.name, labels), amount)
+
+    def exposition(self, values):
+        lines = [f'# HELP {self.name} {self.help_text}',
+                 f'# TYPE {self.name} counter']
+        for labels, value in values.get('', []):
+            lines.append(f'{self.name}{{{_format_labels(labels)}}} {_number(value)}'
+                         if labels else f'{self.name} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds, **labels):
+        # Buckets are stored non-cumulative and summed up when exposed
+        for bound in self.buckets:
+            if seconds <= bound:
+                break
+        else:
+            bound = '+Inf'
+        add(_key(f'{self.name}_bucket', {**labels, 'le': str(bound)}), 1)
+        add(_key(f'{self.name}_sum', labels), seconds)
+        add(_key(f'{self.name}_count', labels), 1)
+
+    def exposition(self, values):
+        lines = [f'# HELP {self.name} {self.help_text}',
+                 f'# TYPE {self.name} histogram']
+        series = {}
+        for labels, value in values.get('_bucket', []):
+            bound = labels.pop('le')
+            series.setdefault(json.dumps(labels, sort_keys=True), {})[bound] = value
+        for series_key, counts in sorted(series.items()):
+            labels = json.loads(series_key)
+            cumulative = 0.0
+            for bound in [*map(str, self.buckets), '+Inf']:
+                cumulative += counts.get(bound, 0)
+                bucket_labels = _format_labels({**labels, 'le': bound})
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {_number(cumulative)}')
+            for suffix in ('_sum', '_count'):
+                for other_labels, value in values.get(suffix, []):
+                    if other_labels == labels:
+                        formatted = _format_labels(labels)
+                        lines.append(f'{self.name}{suffix}{{{formatted}}} {_number(value)}'
+                                     if labels else f'{self.name}{suffix} {_number(value)}')
+        return lines
+
+
+bookings_created = Counter(
+    'eventify_bookings_created_total', 'Bookings created')
+# kind: mpesa or free
+bookings_confirmed = Counter(
+    'eventify_bookings_confirmed_total', 'Bookings confirmed')
+bookings_expired = Counter(
+    'eventify_bookings_expired_total',
+    'Pending bookings expired unpaid (manage.py expire_bookings)')
+# status, result_code (Daraja's, or "none" for free tickets)
+payments = Counter(
+    'eventify_payments_total', 'Payments reaching a final status')
+# outcome: applied, ignored (duplicate, unknown or still processing), error
+callbacks = Counter(
+    'eventify_mpesa_callbacks_total', 'M-Pesa STK callbacks received')
+# endpoint: oauth, stkpush, stkpushquery
+mpesa_latency = Histogram(
+    'eventify_mpesa_request_seconds', 'Daraja API call latency')
+# renderer: platypus or canvas
+pdf_render = Histogram(
+    'eventify_ticket_pdf_render_seconds', 'Ticket PDF render time')
+
+METRICS = (bookings_created, bookings_confirmed, bookings_expired, payments,
+           callbacks, mpesa_latency, pdf_render)
+
+
+def exposition():
+    """Every metric, summed across processes, in Prometheus text format"""
+    by_name = {}
+    for key, value in collect().items():
+        name, labels = key.split('\x00', 1)
+        by_name.setdefault(name, []).append((json.loads(labels), value))
+    lines = []
+    for metric in METRICS:
+        values = {}
+        for suffix in ('', '_bucket', '_sum', '_count'):
+            if f'{metric.name}{suffix}' in by_name:
+                values[suffix] = sorted(
+                    by_name[f'{metric.name}{suffix}'],
+                    key=lambda item: sorted(item[0].items()))
+        lines += metric.exposition(values)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,134 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# Per-request timings: wall time, database, template rendering and Daraja.
+#
+# A sampled request gets a Server-Timing header (shown in the browser's
+# network panel) and one JSON log line on the `eventify.perf` logger. The
+# share of requests sampled is PERF_SAMPLE_RATE, overridden per URL name by
+# PERF_ROUTE_SAMPLE_RATES. With neither set the middleware removes itself
+# at startup, so it costs nothing.
+#
+# Durations overlap: a lazy queryset evaluated while a template renders is
+# counted under both db and template.
+
+logger = logging.getLogger('eventify.perf')
+
+
+class Timings:
+    def __init__(self):
+        self.active = False
+        self.stack = None
+        self.route = None
+        self.spans = {}
+
+    def add(self, name, seconds):
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            span[0] += seconds
+            span[1] += 1
+
+
+_timings = ContextVar('perf_timings', default=None)
+
+
+def record(name, seconds):
+    """Add a span to the current request's timings, if it is sampled"""
+    timings = _timings.get()
+    if timings is not None and timings.active:
+        timings.add(name, seconds)
+
+
+def instrument_templates():
+    """Time every Django template render (once per process)"""
+    from django.template.backends.django import Template
+    if getattr(Template.render, 'perf_timed', False):
+        return
+    render = Template.render
+
+    @wraps(render)
+    def timed_render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            record('template', time.perf_counter() - start)
+
+    timed_render.perf_timed = True
+    Template.render = timed_render
+
+
+def sample_rate(route):
+    return settings.PERF_ROUTE_SAMPLE_RATES.get(route, settings.PERF_SAMPLE_RATE)
+
+
+class PerfMiddleware:
+    def __init__(self, get_response):
+        if not settings.PERF_SAMPLE_RATE and not any(
+                settings.PERF_ROUTE_SAMPLE_RATES.values()):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument_templates()
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        timings = Timings()
+        token = _timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+            if timings.stack is not None:
+                timings.stack.close()
+        if timings.active:
+            self.report(request, response, timings, time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _timings.get()
+        if timings is None:
+            return None
+        match = request.resolver_match
+        timings.route = match.url_name or match.view_name
+        rate = sample_rate(timings.route)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return None
+        timings.active = True
+        timings.stack = ExitStack()
+
+        def time_query(execute, sql, params, many, context):
+            query_start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                timings.add('db', time.perf_counter() - query_start)
+
+        for connection in connections.all():
+            timings.stack.enter_context(connection.execute_wrapper(time_query))
+        return None
+
+    def report(self, request, response, timings, total):
+        entries = [f'total;dur={total * 1000:.1f}']
+        line = {
+            'route': timings.route,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+        }
+        for name, (seconds, count) in timings.spans.items():
+            entries.append(f'{name};dur={seconds * 1000:.1f};desc="{count}"')
+            line[f'{name}_ms'] = round(seconds * 1000, 2)
+            line[f'{name}_count'] = count
+        response['Server-Timing'] = ', '.join(entries)
+        logger.info(json.dumps(line))
@@ -0,0 +1,52 @@
+import hashlib
+import os
+import re
+from django.core.files.storage import FileSystemStorage
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+# Content-hashed file names for static files and uploads.
+#
+# A file whose name carries a hash of its content never changes under that
+# name, so browsers and CDNs may cache it for good: WhiteNoise sends
+# `Cache-Control: immutable` for hashed static files, and the web server
+# (events.views.event_image under DEBUG) does the same for hashed event
+# images. New content means a new name, which the next page render links to.
+
+HASH_LENGTH = 12
+HASHED_NAME = re.compile(r'\.[0-9a-f]{%d}\.\w+$' % HASH_LENGTH)
+
+
+def is_hashed(name):
+    return HASHED_NAME.search(name) is not None
+
+
+class StaticStorage(CompressedManifestStaticFilesStorage):
+    """Hashed, gzip/brotli-compressed static files (`collectstatic` writes
+    them to STATIC_ROOT along with the manifest)"""
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # Without a collected manifest (tests, a deploy that skipped
+        # collectstatic) link the unhashed file rather than fail the page
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """Saves uploads as <name>.<content hash>.<ext>. Uploading the same
+    content twice reuses the stored file."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        root, ext = os.path.splitext(name)
+        name = f"{root}.{digest.hexdigest()[:HASH_LENGTH]}{ext}"
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
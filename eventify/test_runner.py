@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Test runner.
+#
+# The configured cache and metrics directory are shared with any server
+# running on this host: the cache holds the M-Pesa circuit breaker, rate
+# limit buckets and OAuth token, and tests call cache.clear(). Tests get a
+# per-process memory cache and scratch directories for metrics and ticket
+# PDFs instead.
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.scratch = tempfile.mkdtemp(prefix='eventify-test-')
+        self.isolated = override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'eventify-test',
+            }},
+            METRICS_DIR=os.path.join(self.scratch, 'metrics'),
+            TICKET_PDF_CACHE_DIR=os.path.join(self.scratch, 'tickets'))
+        self.isolated.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated.disable()
+        shutil.rmtree(self.scratch, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
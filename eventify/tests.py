@@ -0,0 +1,488 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import HttpResponse
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from bookings.models import Booking
+from bookings.ticket_codes import event_key, sign_ticket
+from checkin import gate
+from emails.models import TicketDelivery
+from emails.pdf import RENDERERS
+from eventify import db_router, metrics
+from eventify.perf import PerfMiddleware
+from eventify.settings import get_choice_variable
+from events.models import Event, TicketType
+from payments.models import Payment
+
+# Query budgets: the most SQL queries each URL may run, measured against a
+# database seeded at realistic volume (60 events, 40 users with bookings
+# across several events, a 40-ticket export). A page that runs a query per
+# row blows through its budget as soon as there are rows, so N+1 patterns
+# fail here instead of in production.
+#
+# Every URL in eventify.urls and every admin changelist needs a budget. When
+# a budget is exceeded the failure lists the queries that ran more than
+# once, with literals replaced by ?, which usually points at the loop.
+
+BUDGETS = {
+    'home': 8,
+    'login': 0,
+    'register': 0,
+    'logout': 4,
+    'process_payment': 5,
+    'payment_success': 3,
+    'payment_failed': 3,
+    'payment_pending': 5,
+    'payment_status': 3,
+    'mpesa_callback': 8,
+    'create_booking': 10,
+    'booking_success': 3,
+    'my_bookings': 3,
+    'download_ticket': 3,
+    'export_event_tickets': 4,
+    'scan_ticket': 5,
+    'metrics': 0,
+    'event_image': 0,
+    'admin:index': 3,
+}
+ADMIN_CHANGELIST_BUDGET = 8
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r'IN \((?:\?, )*\?\)')
+
+
+def fingerprint(sql):
+    """A query with its literals replaced, so repeats with different ids match"""
+    return IN_LISTS.sub('IN (...)', LITERALS.sub('?', sql))
+
+
+def url_names(patterns=None):
+    """Names of every URL pattern in eventify.urls outside the admin site"""
+    names = []
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace != 'admin':
+                names += url_names(pattern.url_patterns)
+        elif pattern.name:
+            names.append(pattern.name)
+    return names
+
+
+def changelists():
+    return [f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist'
+            for model in admin.site._registry]
+
+
+def create_events(count):
+    start = timezone.now() + timedelta(days=7)
+    Event.objects.bulk_create([
+        Event(title=f"Event {i}", description="Test event " * 20,
+              short_description=f"Test event {i}", venue=f"Venue {i % 25}",
+              city="Nairobi", start_date=start + timedelta(days=i),
+              end_date=start + timedelta(days=i, hours=4), total_capacity=10000,
+              is_featured=i % 10 == 0)
+        for i in range(count)
+    ])
+    events = list(Event.objects.order_by('id'))
+    TicketType.objects.bulk_create([
+        TicketType(event=event, category=category, price=price,
+                   quantity_available=5000)
+        for event in events
+        for category, price in (('regular', Decimal('500')), ('vip', Decimal('1500')))
+    ])
+    return events
+
+
+def create_users(count):
+    User.objects.bulk_create([
+        User(username=f"user{i}", email=f"user{i}@example.com") for i in range(count)
+    ])
+    return list(User.objects.filter(username__startswith='user').order_by('id'))
+
+
+def create_paid_bookings(event, users):
+    """A confirmed, paid booking with a queued ticket for each user"""
+    Booking.objects.bulk_create([
+        Booking(user=user, event=event, ticket_type='regular', quantity=1 + i % 3,
+                unit_price=Decimal('500'), total_price=Decimal('500') * (1 + i % 3),
+                status='confirmed', expires_at=timezone.now() + timedelta(minutes=30))
+        for i, user in enumerate(users)
+    ])
+    bookings = list(Booking.objects.filter(event=event))
+    Payment.objects.bulk_create([
+        Payment(booking=booking, user_id=booking.user_id, phone_number='254708374149',
+                amount=booking.total_price, status='successful',
+                checkout_request_id=f"ws_CO_{booking.id:020d}",
+                mpesa_receipt_number=f"TEST{booking.id:06d}",
+                transaction_date=timezone.now())
+        for booking in bookings
+    ])
+    TicketDelivery.objects.bulk_create(
+        [TicketDelivery(booking=booking) for booking in bookings])
+
+
+def stk_callback(payment, receipt):
+    """A successful stkCallback body for `payment`"""
+    return {"Body": {"stkCallback": {
+        "MerchantRequestID": "29115-34620561-1",
+        "CheckoutRequestID": payment.checkout_request_id,
+        "ResultCode": 0,
+        "ResultDesc": "The service request is processed successfully.",
+        "CallbackMetadata": {"Item": [
+            {"Name": "Amount", "Value": float(payment.amount)},
+            {"Name": "MpesaReceiptNumber", "Value": receipt},
+            {"Name": "TransactionDate", "Value": 20251130171200},
+            {"Name": "PhoneNumber", "Value": int(payment.phone_number)},
+        ]},
+    }}}
+
+
+def stk_query(gateway, checkout_request_id):
+    """MpesaGateway.check_transaction_status for a payment still processing"""
+    data = {'CheckoutRequestID': checkout_request_id, 'ResultCode': '4999',
+            'ResultDesc': "The transaction is still under processing"}
+    return {'status': 'pending', 'message': data['ResultDesc'], 'data': data}, None
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch = tempfile.mkdtemp()
+        cls.settings = override_settings(
+            MEDIA_ROOT=cls.scratch,
+            TICKET_PDF_CACHE_DIR=os.path.join(cls.scratch, 'tickets'),
+            METRICS_DIR=os.path.join(cls.scratch, 'metrics'))
+        cls.settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings.disable()
+        shutil.rmtree(cls.scratch, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = create_events(60)
+        users = create_users(40)
+        cls.user = users[0]
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'x')
+        for event in cls.events[:10]:
+            create_paid_bookings(event, users)
+        cls.event = cls.events[0]
+        cls.booking = Booking.objects.filter(user=cls.user, event=cls.event).first()
+
+        def pending(payment_status=None):
+            booking = Booking.objects.create(
+                user=cls.user, event=cls.events[20], ticket_type='regular',
+                quantity=1, unit_price=500, total_price=500)
+            if payment_status:
+                Payment.objects.create(
+                    booking=booking, user=cls.user, phone_number='254708374149',
+                    amount=booking.total_price, status=payment_status,
+                    checkout_request_id=f"ws_CO_{booking.id:020d}")
+            return booking
+        cls.unpaid = pending()
+        cls.failed = pending('failed').payment
+        cls.waiting = pending('pending').payment
+        cls.called_back = pending('pending').payment
+
+    def setUp(self):
+        gate._gates.clear()
+        self.client.force_login(self.user)
+
+    def assertWithinBudget(self, name, request):
+        with CaptureQueriesContext(connection) as captured, redirect_stdout(StringIO()):
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        budget = BUDGETS.get(name, ADMIN_CHANGELIST_BUDGET)
+        if len(captured) > budget:
+            repeated = Counter(fingerprint(query['sql']) for query in captured)
+            lines = [f"{count} x {sql}" for sql, count in repeated.most_common()
+                     if count > 1]
+            self.fail(f"{name} ran {len(captured)} queries, budget {budget}. "
+                      "Repeated queries:\n" + ('\n'.join(lines) or "(none)"))
+        return response
+
+    def get(self, name, *args):
+        return self.assertWithinBudget(
+            name, lambda: self.client.get(reverse(name, args=args)))
+
+    def post(self, name, data, *args, **kwargs):
+        return self.assertWithinBudget(
+            name, lambda: self.client.post(reverse(name, args=args), data, **kwargs))
+
+    def test_every_url_has_a_budget(self):
+        missing = [name for name in url_names() + ['admin:index'] if name not in BUDGETS]
+        self.assertEqual(missing, [], "URLs without a query budget")
+
+    def test_home(self):
+        response = self.get('home')
+        self.assertEqual(response.status_code, 200)
+
+    def test_home_anonymous(self):
+        self.client.logout()
+        self.get('home')
+
+    def test_login(self):
+        self.client.logout()
+        self.get('login')
+
+    def test_register(self):
+        self.client.logout()
+        self.get('register')
+
+    def test_logout(self):
+        self.get('logout')
+
+    def test_process_payment(self):
+        response = self.get('process_payment', self.unpaid.id)
+        self.assertEqual(response.status_code, 200)
+
+    def test_payment_success(self):
+        response = self.get('payment_success', self.booking.payment.id)
+        self.assertEqual(response.status_code, 200)
+
+    def test_payment_failed(self):
+        response = self.get('payment_failed', self.failed.id)
+        self.assertEqual(response.status_code, 200)
+
+    def test_payment_pending(self):
+        with mock.patch('payments.mpesa_utils.MpesaGateway.check_transaction_status',
+                        stk_query):
+            response = self.get('payment_pending', self.waiting.id)
+        self.assertEqual(response.status_code, 200)
+
+    def test_payment_status(self):
+        response = self.get('payment_status', self.failed.id)
+        self.assertEqual(response.json()['status'], 'failed')
+
+    def test_mpesa_callback(self):
+        body = stk_callback(self.called_back, 'QBUDGET001')
+        self.post('mpesa_callback', json.dumps(body), content_type='application/json')
+        self.called_back.refresh_from_db()
+        self.assertEqual(self.called_back.status, 'successful')
+
+    def test_create_booking_form(self):
+        response = self.get('create_booking', self.events[30].id)
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_booking(self):
+        response = self.post('create_booking', {'ticket_type': 'regular', 'quantity': '2'},
+                             self.events[30].id)
+        self.assertEqual(response.status_code, 302)
+
+    def test_booking_success(self):
+        self.get('booking_success', self.booking.id)
+
+    def test_my_bookings(self):
+        response = self.get('my_bookings')
+        self.assertGreaterEqual(len(response.context['bookings']), 10)
+
+    def test_download_ticket(self):
+        response = self.get('download_ticket', self.booking.id)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_export_event_tickets(self):
+        self.client.force_login(self.staff)
+        self.get('export_event_tickets', self.event.id)
+
+    def test_scan_ticket(self):
+        self.client.force_login(self.staff)
+        code = sign_ticket(self.booking.id, self.event.id, self.booking.quantity,
+                           event_key(self.event.id))
+        response = self.post('scan_ticket', {'code': code}, self.event.id)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_metrics(self):
+        response = self.get('metrics')
+        self.assertEqual(response.status_code, 200)
+
+    def test_event_image(self):
+        os.makedirs(os.path.join(self.scratch, 'event_images'), exist_ok=True)
+        with open(os.path.join(self.scratch, 'event_images', 'poster.webp'), 'wb') as f:
+            f.write(b'RIFF')
+        # Served by the web server in production
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.get(reverse('event_image', args=['poster.webp']))
+        self.assertEqual(response.status_code, 404)
+        with override_settings(DEBUG=True):
+            response = self.get('event_image', 'poster.webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_admin(self):
+        self.client.force_login(self.staff)
+        self.get('admin:index')
+        for name in changelists():
+            with self.subTest(changelist=name):
+                response = self.get(name)
+                self.assertEqual(response.status_code, 200)
+
+
+@override_settings(METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=['10.1.0.0/16'])
+class MetricsAccessTests(TestCase):
+    def scrape(self, **extra):
+        return self.client.get(reverse('metrics'), **extra)
+
+    def test_proxied_request_is_refused(self):
+        # A reverse proxy on a private network forwards everyone's requests
+        response = self.scrape(REMOTE_ADDR='10.0.0.5', HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.scrape(REMOTE_ADDR='127.0.0.1').status_code, 404)
+
+    def test_token_or_allowed_address(self):
+        self.assertEqual(self.scrape(REMOTE_ADDR='10.0.0.5',
+                                     HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer guess').status_code, 404)
+        self.assertEqual(self.scrape(REMOTE_ADDR='10.1.2.3').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[])
+    def test_off_unless_configured(self):
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+class MetricsFileTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.settings = override_settings(METRICS_DIR=self.directory)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def write(self, pid, values):
+        values_file = metrics.ValueFile(os.path.join(self.directory, f'{pid}.metrics'))
+        for key, value in values.items():
+            values_file.add(key, value)
+        values_file.close()
+
+    def test_exited_processes_are_merged(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        exited = process.pid
+        self.write(exited, {'a': 2, 'b': 1})
+        self.write(os.getpid(), {'a': 3})
+
+        self.assertEqual(metrics.collect(), {'a': 5, 'b': 1})
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         [f'{os.getpid()}.metrics', 'merged.lock', metrics.AGGREGATE])
+
+        # Merged once, then counted from the aggregate file
+        self.write(exited, {'a': 1})
+        self.assertEqual(metrics.collect(), {'a': 6, 'b': 1})
+        self.assertEqual(metrics.collect(), {'a': 6, 'b': 1})
+
+
+@override_settings(REPLICA_DATABASES=['replica_0'], REPLICA_PIN_SECONDS=5,
+                   DATABASE_ROUTERS=['eventify.db_router.ReplicaRouter'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        # The test replica mirrors the primary, so replicas() leaves it out
+        replicas = mock.patch('eventify.db_router.replicas', return_value=['replica_0'])
+        replicas.start()
+        self.addCleanup(replicas.stop)
+        self.reads = []
+
+    def handle(self, view, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        return db_router.ReplicaPinMiddleware(view)(request)
+
+    def my_bookings(self, request):
+        # Where the view's queries would go, without running them
+        self.reads.append(Booking.objects.all().db)
+        return HttpResponse()
+
+    def test_reads_go_to_a_replica(self):
+        response = self.handle(db_router.read_only_view(self.my_bookings))
+        self.assertEqual(self.reads, ['replica_0'])
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+        # Outside a read-only view reads stay on the primary
+        self.assertEqual(Booking.objects.all().db, 'default')
+
+    def test_write_pins_later_reads_to_the_primary(self):
+        def register(request):
+            User.objects.create_user('buyer')
+            return HttpResponse()
+
+        cookie = self.handle(register).cookies[db_router.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+        self.assertTrue(cookie['httponly'])
+
+        response = self.handle(db_router.read_only_view(self.my_bookings),
+                               **{db_router.PIN_COOKIE: cookie.value})
+        self.assertEqual(self.reads, ['default'])
+        # Only a write renews the pin
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+
+@override_settings(PERF_SAMPLE_RATE=0, PERF_ROUTE_SAMPLE_RATES={'home': 1})
+class PerfMiddlewareTests(TestCase):
+    def test_sampled_request_is_timed(self):
+        with self.assertLogs('eventify.perf', 'INFO') as logs:
+            response = self.client.get(reverse('home'))
+        spans = dict(entry.split(';', 1)[0:2] for entry in
+                     response['Server-Timing'].split(', '))
+        self.assertGreaterEqual(spans.keys(), {'total', 'db', 'template'})
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['route'], line['status']), ('home', 200))
+        self.assertGreater(line['db_count'], 0)
+
+    def test_route_rate_overrides_the_default(self):
+        with self.assertNoLogs('eventify.perf'):
+            response = self.client.get(reverse('login'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(PERF_SAMPLE_RATE=0.25, PERF_ROUTE_SAMPLE_RATES={})
+    def test_sample_rate(self):
+        with mock.patch('eventify.perf.random.random', return_value=0.3):
+            self.assertNotIn('Server-Timing', self.client.get(reverse('login')))
+        with mock.patch('eventify.perf.random.random', return_value=0.2), \
+                self.assertLogs('eventify.perf', 'INFO'):
+            self.assertIn('Server-Timing', self.client.get(reverse('login')))
+
+    @override_settings(PERF_ROUTE_SAMPLE_RATES={})
+    def test_off_without_a_sample_rate(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            PerfMiddleware(lambda request: None)
+
+
+class SettingsTests(TestCase):
+    def test_ticket_pdf_renderers_match_emails_pdf(self):
+        self.assertEqual(sorted(settings.TICKET_PDF_RENDERERS), sorted(RENDERERS))
+
+    def test_unknown_ticket_pdf_renderer(self):
+        # The environment wins over any .env file, so this doesn't depend on one
+        with mock.patch.dict(os.environ, TICKET_PDF_RENDERER='platypos'), \
+                self.assertRaisesMessage(ImproperlyConfigured, "'platypos'"):
+            get_choice_variable('TICKET_PDF_RENDERER', settings.TICKET_PDF_RENDERERS, 'canvas')
+        with mock.patch.dict(os.environ, TICKET_PDF_RENDERER='platypus'):
+            self.assertEqual(get_choice_variable(
+                'TICKET_PDF_RENDERER', settings.TICKET_PDF_RENDERERS, 'canvas'), 'platypus')
+
+    def test_tests_leave_server_state_alone(self):
+        # cache.clear() in a test must not reset a local server's breaker
+        self.assertEqual(settings.CACHES['default']['BACKEND'],
+                         'django.core.cache.backends.locmem.LocMemCache')
+        self.assertTrue(settings.METRICS_DIR.startswith(
+            os.path.join(tempfile.gettempdir(), 'eventify-test-')))
@@ -16,8 +16,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import path, include
+from eventify.views import metrics
+from events.views import event_image
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,7 +26,14 @@ urlpatterns = [
     path('users/', include('users.urls')),
     path('payments/', include('payments.urls')),
     path('bookings/', include('bookings.urls')),
+    path('emails/', include('emails.urls')),
+    path('checkin/', include('checkin.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Only event images: MEDIA_ROOT also holds the ticket PDF cache. The view
+# answers under DEBUG only; in production the web server serves these.
+urlpatterns += [
+    path(f"{settings.MEDIA_URL.lstrip('/')}event_images/<path:path>",
+         event_image, name='event_image'),
+]
\ No newline at end of file
@@ -0,0 +1,29 @@
+import ipaddress
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from eventify.metrics import exposition
+from payments.resilience import gateway_metrics
+
+
+def metrics_allowed(request):
+    """True if the request carries METRICS_TOKEN or comes from
+    METRICS_ALLOWED_IPS"""
+    if settings.METRICS_TOKEN and constant_time_compare(
+            request.headers.get('Authorization', ''),
+            f'Bearer {settings.METRICS_TOKEN}'):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(allowed, strict=False)
+               for allowed in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics(request):
+    """Prometheus metrics for every worker, for configured scrapers only"""
+    if not metrics_allowed(request):
+        raise Http404
+    return HttpResponse(exposition() + gateway_metrics(),
+                        content_type='text/plain; version=0.0.4')
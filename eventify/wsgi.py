@@ -7,10 +7,19 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
+import gc
 import os
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eventify.settings')
 
-application = get_wsgi_application()
+# Start-up only creates long-lived objects (modules, classes, URL patterns),
+# so garbage collections during it find nothing to free. Skip them, then
+# freeze what start-up built so later collections don't rescan it.
+gc.disable()
+try:
+    application = get_wsgi_application()
+finally:
+    gc.freeze()
+    gc.enable()
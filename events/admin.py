@@ -1,15 +1,18 @@
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
+from eventify.db_router import ReplicaAdminMixin
 from .models import Event, Category, TicketType
 
-# Register your models here.
+
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'description']
     search_fields = ['name']
 
 @admin.register(Event)
-class EventAdmin(admin.ModelAdmin):
-    list_display = ['title', 'venue', 'start_date', 'status', 'is_featured', 'available_tickets', 'can_book']
+class EventAdmin(ReplicaAdminMixin, admin.ModelAdmin):
+    list_display = ['title', 'venue', 'start_date', 'status', 'is_featured', 'available_tickets', 'can_book', 'ticket_export']
     list_filter = ['is_active', 'is_featured', 'is_coming_soon', 'start_date', 'category']
     search_fields = ['title', 'venue', 'description']
     date_hierarchy = 'start_date'
@@ -37,8 +40,13 @@ class EventAdmin(admin.ModelAdmin):
         }),
     )
 
+    @admin.display(description="Tickets")
+    def ticket_export(self, obj):
+        return format_html('<a href="{}">Download ZIP</a>',
+                           reverse('export_event_tickets', args=[obj.pk]))
+
 @admin.register(TicketType)
-class TicketTypeAdmin(admin.ModelAdmin):
+class TicketTypeAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['event', 'category', 'price', 'quantity_available', 'is_available']
     list_filter = ['category', 'event']
     search_fields = ['event__title']
\ No newline at end of file
@@ -0,0 +1,26 @@
+import os
+from django.core.management.base import BaseCommand
+from eventify.storage import is_hashed
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = ("Re-save event images uploaded before content-hashed names, so "
+            "browsers can cache them. The old files are left in place.")
+
+    def handle(self, *args, **options):
+        renamed = 0
+        for event in Event.objects.exclude(image='').exclude(image__isnull=True):
+            old_name = event.image.name
+            if is_hashed(old_name):
+                continue
+            if not event.image.storage.exists(old_name):
+                self.stderr.write(f"Event #{event.id}: {old_name} is missing")
+                continue
+            with event.image.open('rb'):
+                event.image.save(os.path.basename(old_name), event.image.file,
+                                 save=False)
+            event.save(update_fields=['image'])
+            renamed += 1
+            self.stdout.write(f"Event #{event.id}: {old_name} -> {event.image.name}")
+        self.stdout.write(f"{renamed} image(s) renamed")
@@ -3,7 +3,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
-# cretae your models here
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -1,10 +1,17 @@
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import render
 from django.utils import timezone
+from django.views.static import serve
+from eventify.db_router import read_only_view
+from eventify.storage import is_hashed
 from .models import Event, Category
 
+@read_only_view
 def event_list(request):
-    # Get all active events
-    events = Event.objects.filter(is_active=True).order_by('start_date')
+    # Get all active events; every card lists its ticket types
+    events = Event.objects.filter(is_active=True).order_by(
+        'start_date').prefetch_related('ticket_types')
     categories = Category.objects.all()
     
     # Better event separation logic
@@ -24,4 +31,20 @@ def event_list(request):
         'available_events': available_events,
         'categories': categories,
     }
-    return render(request, 'event_list.html', context)
\ No newline at end of file
+    return render(request, 'event_list.html', context)
+
+
+def event_image(request, path):
+    """Serve an uploaded event image under DEBUG only; in production the
+    web server serves MEDIA_URL/event_images/ (see README). Content-hashed
+    names never change, so browsers may keep those for a year; older
+    uploads are revalidated."""
+    if not settings.DEBUG:
+        raise Http404("Event images are served by the web server")
+    response = serve(request, f'event_images/{path}',
+                     document_root=settings.MEDIA_ROOT)
+    if is_hashed(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'no-cache'
+    return response
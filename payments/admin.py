@@ -1,13 +1,41 @@
+import json
 from django.contrib import admin
-from .models import Payment
+from django.utils.html import format_html
+from eventify.db_router import ReplicaAdminMixin
+from .models import Payment, PaymentPayload
+
+
+class PaymentPayloadInline(admin.TabularInline):
+    """Raw gateway payloads, only loaded on a payment's change page"""
+    model = PaymentPayload
+    extra = 0
+    can_delete = False
+    fields = ['kind', 'created_at', 'compressed', 'pretty_payload']
+    readonly_fields = fields
+    classes = ['collapse']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Payload')
+    def pretty_payload(self, obj):
+        return format_html('<pre>{}</pre>', json.dumps(obj.payload, indent=2))
+
 
 # reister the Payment model in the admin interface
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ReplicaAdminMixin, admin.ModelAdmin):
     list_display = ['id', 'user', 'booking', 'amount', 'status', 'phone_number', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['user__username', 'phone_number', 'mpesa_receipt_number']
     readonly_fields = ['created_at', 'updated_at']
+    inlines = [PaymentPayloadInline]
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user', 'booking')
\ No newline at end of file
+        # The booking column's __str__ shows its user and event
+        return super().get_queryset(request).select_related(
+            'user', 'booking__user', 'booking__event')
+
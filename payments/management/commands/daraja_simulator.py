@@ -0,0 +1,82 @@
+import asyncio
+from django.core.management.base import BaseCommand, CommandError
+from payments.simulator import DarajaSimulator, parse_result_codes
+
+
+class Command(BaseCommand):
+    help = "Run a local Daraja simulator for load testing the payment flow"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument(
+            '--min-latency', type=float, default=1.0,
+            help="Minimum seconds between STK push and callback")
+        parser.add_argument(
+            '--max-latency', type=float, default=3.0,
+            help="Maximum seconds between STK push and callback")
+        parser.add_argument(
+            '--result-codes', default='0:85,1032:10,1:3,4999:2',
+            help="Weighted callback result codes, e.g. 0:85,1032:10,4999:5")
+        parser.add_argument(
+            '--duplicate-rate', type=float, default=0.0,
+            help="Share of payments whose callback is delivered twice")
+        parser.add_argument(
+            '--callback-url',
+            help="Send callbacks here instead of the request's CallBackURL")
+        parser.add_argument(
+            '--workers', type=int, default=32,
+            help="Concurrent callback senders")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument(
+            '--stats-interval', type=float, default=5.0,
+            help="Seconds between throughput reports (0 to disable)")
+
+    def handle(self, *args, **options):
+        try:
+            result_codes = parse_result_codes(options['result_codes'])
+        except ValueError:
+            raise CommandError(
+                f"Invalid --result-codes: {options['result_codes']}")
+
+        simulator = DarajaSimulator(
+            min_latency=options['min_latency'],
+            max_latency=options['max_latency'],
+            result_codes=result_codes,
+            duplicate_rate=options['duplicate_rate'],
+            callback_url=options['callback_url'],
+            workers=options['workers'],
+            seed=options['seed'],
+        )
+        self.stdout.write(
+            f"Daraja simulator listening on "
+            f"http://{options['host']}:{options['port']}\n"
+            f"Set MPESA_BASE_URL to this address to use it.")
+
+        try:
+            asyncio.run(self.run(simulator, options))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(f"Final stats: {simulator.stats()}")
+
+    async def run(self, simulator, options):
+        if options['stats_interval'] > 0:
+            asyncio.create_task(
+                self.report(simulator, options['stats_interval']))
+        await simulator.serve(options['host'], options['port'])
+
+    async def report(self, simulator, interval):
+        previous = simulator.stats()
+        while True:
+            await asyncio.sleep(interval)
+            current = simulator.stats()
+            pushes = (current['pushes'] - previous['pushes']) / interval
+            callbacks = (current['callbacks_sent']
+                         - previous['callbacks_sent']) / interval
+            self.stdout.write(
+                f"push/s={pushes:.0f} callback/s={callbacks:.0f} "
+                f"pending={current['callbacks_pending']} "
+                f"failed={current['callbacks_failed']} "
+                f"duplicates={current['duplicates']}")
+            previous = current
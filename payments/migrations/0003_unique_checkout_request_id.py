@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+def blank_checkout_ids_to_null(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    Payment.objects.filter(checkout_request_id='').update(
+        checkout_request_id=None)
+
+
+def null_checkout_ids_to_blank(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    Payment.objects.filter(checkout_request_id__isnull=True).update(
+        checkout_request_id='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_payment_callback_data_payment_callback_received_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='checkout_request_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(
+            blank_checkout_ids_to_null, null_checkout_ids_to_blank),
+        migrations.AlterField(
+            model_name='payment',
+            name='checkout_request_id',
+            field=models.CharField(
+                blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
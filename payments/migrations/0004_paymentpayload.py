@@ -0,0 +1,76 @@
+import json
+import zlib
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def archive_callback_data(apps, schema_editor):
+    """Copy Payment.callback_data into PaymentPayload in keyset batches"""
+    Payment = apps.get_model('payments', 'Payment')
+    PaymentPayload = apps.get_model('payments', 'PaymentPayload')
+
+    last_id = 0
+    while True:
+        batch = list(
+            Payment.objects.filter(id__gt=last_id, callback_data__isnull=False)
+            .order_by('id').values_list('id', 'callback_data', 'updated_at')[:BATCH_SIZE])
+        if not batch:
+            break
+        payloads = [
+            PaymentPayload(
+                payment_id=payment_id, kind='callback', compressed=True,
+                data=zlib.compress(
+                    json.dumps(data, separators=(',', ':')).encode()))
+            for payment_id, data, _ in batch
+        ]
+        PaymentPayload.objects.bulk_create(payloads)
+        # auto_now_add stamped the migration time; keep the original instead
+        for payload, (_, _, updated_at) in zip(payloads, batch):
+            payload.created_at = updated_at
+        if payloads[0].pk:
+            PaymentPayload.objects.bulk_update(payloads, ['created_at'])
+        last_id = batch[-1][0]
+
+
+def restore_callback_data(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    PaymentPayload = apps.get_model('payments', 'PaymentPayload')
+
+    payloads = PaymentPayload.objects.filter(kind='callback').order_by('id')
+    for payload in payloads.iterator(chunk_size=BATCH_SIZE):
+        data = bytes(payload.data)
+        if payload.compressed:
+            data = zlib.decompress(data)
+        Payment.objects.filter(pk=payload.payment_id).update(
+            callback_data=json.loads(data))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_unique_checkout_request_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('callback', 'Callback'), ('status_query', 'Status Query')], default='callback', max_length=20)),
+                ('compressed', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payloads', to='payments.payment')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.RunPython(archive_callback_data, restore_callback_data),
+        migrations.RemoveField(
+            model_name='payment',
+            name='callback_data',
+        ),
+    ]
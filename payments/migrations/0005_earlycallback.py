@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_paymentpayload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EarlyCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(db_index=True, max_length=100)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
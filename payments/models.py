@@ -1,10 +1,11 @@
+import json
+import logging
+import zlib
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
-from django.utils import timezone
-from datetime import datetime
-from .mpesa_utils import MpesaGateway
 
-# Payment Model
+logger = logging.getLogger(__name__)
 
 
 class Payment(models.Model):
@@ -29,7 +30,10 @@ class Payment(models.Model):
 
     # M-Pesa Details
     merchant_request_id = models.CharField(max_length=100, blank=True)
-    checkout_request_id = models.CharField(max_length=100, blank=True)
+    # NULL (not '') until the STK push is accepted, so the unique index
+    # only covers real checkout requests
+    checkout_request_id = models.CharField(
+        max_length=100, blank=True, null=True, unique=True)
     mpesa_receipt_number = models.CharField(max_length=50, blank=True)
     transaction_date = models.DateTimeField(null=True, blank=True)
 
@@ -37,8 +41,7 @@ class Payment(models.Model):
     callback_received = models.BooleanField(default=False)
     result_code = models.IntegerField(null=True, blank=True)
     result_desc = models.TextField(blank=True)
-    callback_data = models.JSONField(
-        null=True, blank=True)  # Store full callback data
+    # Full callback bodies live in PaymentPayload, off this hot row
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -58,107 +61,45 @@ class Payment(models.Model):
         if self.status == 'successful' or self.status == 'failed':
             return self.status, "Status already finalized"
 
-        # Import here to avoid circular imports
+        # Import here to avoid circular imports, and to keep requests
+        # (via mpesa_utils) out of every process that loads the models
         from .mpesa_utils import MpesaGateway
+        from .state import apply_result, parse_stk_query
 
         mpesa = MpesaGateway()
         response, error = mpesa.check_transaction_status(
             self.checkout_request_id)
 
         if error:
-            print(f"M-Pesa status check error: {error}")
+            logger.warning("M-Pesa status check error: %s", error)
             return None, error
 
         if response:
-            result_status = response.get('status')
             result_message = response.get('message', '')
+            logger.debug("M-Pesa status: %s, message: %s",
+                         response.get('status'), result_message)
 
-            print(f"M-Pesa Status: {result_status}, Message: {result_message}")
-
-            if result_status == 'successful':
-                # Payment successful
-                self.status = 'successful'
-
-                # Try to extract receipt number from response data
-                response_data = response.get('data', {})
-                if response_data.get('ResultCode') == 0:
-                    # Extract from callback metadata if available
-                    callback_metadata = response_data.get(
-                        'CallbackMetadata', {})
-                    if callback_metadata:
-                        items = callback_metadata.get('Item', [])
-                        for item in items:
-                            if item.get('Name') == 'MpesaReceiptNumber':
-                                self.mpesa_receipt_number = item.get(
-                                    'Value', f"MPE{self.id:08d}")
-                            elif item.get('Name') == 'TransactionDate':
-                                transaction_date = item.get('Value')
-                                try:
-                                    self.transaction_date = timezone.make_aware(
-                                        datetime.strptime(
-                                            str(transaction_date), '%Y%m%d%H%M%S')
-                                    )
-                                except:
-                                    self.transaction_date = timezone.now()
-
-                # Update booking status
-                self.booking.status = 'confirmed'
-                self.booking.save()
-
-            elif result_status == 'failed':
-                # Payment failed
-                self.status = 'failed'
-
-            self.save()
+            data = response.get('data', {})
+            if apply_result(parse_stk_query(data), payment_id=self.id):
+                PaymentPayload.record(self.id, data, kind='status_query')
+                self.refresh_from_db()
             return self.status, result_message
 
         return None, "No response from M-Pesa"
 
     def update_status_from_callback(self, callback_data):
         """Update status from M-Pesa callback"""
-        try:
-            callback_metadata = callback_data.get(
-                'Body', {}).get('stkCallback', {})
-            result_code = callback_metadata.get('ResultCode')
-            result_desc = callback_metadata.get('ResultDesc')
-
-            self.callback_received = True
-            self.result_code = result_code
-            self.result_desc = result_desc
-            self.callback_data = callback_data
-
-            if result_code == 0:
-                # Payment successful
-                self.status = 'successful'
-                # Extract receipt number
-                callback_items = callback_metadata.get(
-                    'CallbackMetadata', {}).get('Item', [])
-                for item in callback_items:
-                    if item.get('Name') == 'MpesaReceiptNumber':
-                        self.mpesa_receipt_number = item.get('Value')
-                    elif item.get('Name') == 'TransactionDate':
-                        transaction_date = item.get('Value')
-                        try:
-                            self.transaction_date = timezone.make_aware(
-                                datetime.strptime(
-                                    str(transaction_date), '%Y%m%d%H%M%S')
-                            )
-                        except:
-                            self.transaction_date = timezone.now()
-
-                # Update booking status
-                self.booking.status = 'confirmed'
-                self.booking.save()
-            else:
-                # Payment failed or cancelled
-                self.status = 'failed'
-
-            self.save()
-            return True
-        except Exception as e:
-            print(f"Error updating from callback: {e}")
+        from .state import apply_result, parse_stk_callback
+
+        result = parse_stk_callback(callback_data)
+        if result is None:
+            logger.warning("Error updating from callback: malformed stkCallback")
             return False
 
+        if apply_result(result, callback_data=callback_data, payment_id=self.id):
+            self.refresh_from_db()
+        return True
+
     @property
     def is_successful(self):
         return self.status == 'successful'
@@ -174,3 +115,67 @@ class Payment(models.Model):
         elif phone.startswith('254'):
             return phone
         return '254' + phone
+
+
+class PaymentPayload(models.Model):
+    """Append-only archive of raw gateway payloads for a payment"""
+    KIND_CHOICES = [
+        ('callback', 'Callback'),
+        ('status_query', 'Status Query'),
+    ]
+
+    payment = models.ForeignKey(
+        Payment, on_delete=models.CASCADE, related_name='payloads')
+    kind = models.CharField(
+        max_length=20, choices=KIND_CHOICES, default='callback')
+    compressed = models.BooleanField(default=False)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for Payment #{self.payment_id}"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Payment payloads are append-only")
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def encode(cls, payload, compress=None):
+        """Serialize a payload; returns (data, compressed)"""
+        if compress is None:
+            compress = settings.PAYMENT_PAYLOAD_COMPRESS
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        if compress:
+            return zlib.compress(raw), True
+        return raw, False
+
+    @classmethod
+    def record(cls, payment_id, payload, kind='callback'):
+        data, compressed = cls.encode(payload)
+        return cls.objects.create(
+            payment_id=payment_id, kind=kind, compressed=compressed, data=data)
+
+    @property
+    def payload(self):
+        data = bytes(self.data)
+        if self.compressed:
+            data = zlib.decompress(data)
+        return json.loads(data)
+
+
+class EarlyCallback(models.Model):
+    """An STK callback that arrived before its payment's CheckoutRequestID
+    was saved. Replayed, then deleted, once the id is saved."""
+    checkout_request_id = models.CharField(max_length=100, db_index=True)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Early callback for {self.checkout_request_id}"
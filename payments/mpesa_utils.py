@@ -1,9 +1,37 @@
+import logging
 import requests
 import base64
+import time
 from datetime import datetime
 import json
 from django.conf import settings
 from django.utils import timezone
+from django.core.cache import cache
+from eventify import metrics
+from eventify.perf import record
+from .resilience import GatewayUnavailable, daraja_breaker, endpoint_buckets
+
+# One pooled session per process so Daraja connections (and their TLS
+# handshakes) are reused across requests
+session = requests.Session()
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKEN_CACHE_KEY = 'mpesa:access_token'
+
+# Daraja answers an STK query for a payment the customer hasn't finished with
+# HTTP 500 and this errorCode. It is routine while polling, not an outage.
+STK_QUERY_PROCESSING = '500.001.1001'
+
+
+def still_processing(response):
+    """True if `response` is Daraja's "still being processed" STK query answer"""
+    if response.status_code != 500:
+        return False
+    try:
+        return response.json().get('errorCode') == STK_QUERY_PROCESSING
+    except ValueError:
+        return False
 
 
 class MpesaGateway:
@@ -13,27 +41,79 @@ class MpesaGateway:
         self.shortcode = settings.MPESA_SHORTCODE
         self.passkey = settings.MPESA_PASSKEY
         self.callback_url = settings.MPESA_CALLBACK_URL
+        self.base_url = settings.MPESA_BASE_URL.rstrip('/')
+        self.timeout = settings.MPESA_TIMEOUT
         self.access_token = None
         self.token_expiry = None
+        # Seconds to wait when the last call was refused locally (rate
+        # limited or breaker open), else None
+        self.retry_after = None
+
+    def _request(self, endpoint, method, url, **kwargs):
+        """Send a Daraja request through the rate limiter and circuit breaker"""
+        self.retry_after = None
+        bucket = endpoint_buckets[endpoint]
+        if not bucket.acquire():
+            raise GatewayUnavailable(
+                "Too many M-Pesa requests, please try again shortly",
+                retry_after=bucket.retry_after())
+        allowed, trial = daraja_breaker.allow_request()
+        if not allowed:
+            raise GatewayUnavailable(
+                "M-Pesa is temporarily unavailable",
+                retry_after=daraja_breaker.retry_after())
+
+        start = time.monotonic()
+        try:
+            response = session.request(
+                method, url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            elapsed = time.monotonic() - start
+            daraja_breaker.record(False, elapsed, trial)
+            record('daraja', elapsed)
+            metrics.mpesa_latency.observe(elapsed, endpoint=endpoint)
+            raise
+
+        # Client errors (bad phone number etc.) say nothing about Daraja health
+        processing = endpoint == 'stkpushquery' and still_processing(response)
+        healthy = processing or (
+            response.status_code < 500 and response.status_code != 429)
+        elapsed = time.monotonic() - start
+        daraja_breaker.record(healthy, elapsed, trial)
+        record('daraja', elapsed)
+        metrics.mpesa_latency.observe(elapsed, endpoint=endpoint)
+        if not processing:
+            response.raise_for_status()
+        return response
 
     def get_access_token(self):
         if self.access_token and self.token_expiry and self.token_expiry > timezone.now():
             return self.access_token
 
-        url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
+        # Tokens are valid for an hour, so share them between gateway
+        # instances and workers instead of fetching one per payment
+        cached = cache.get(ACCESS_TOKEN_CACHE_KEY)
+        if cached:
+            self.access_token, self.token_expiry = cached
+            if self.token_expiry > timezone.now():
+                return self.access_token
+
+        url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
         auth_string = f"{self.consumer_key}:{self.consumer_secret}"
         encoded_auth = base64.b64encode(auth_string.encode()).decode()
         headers = {'Authorization': f'Basic {encoded_auth}'}
 
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
+            response = self._request('oauth', 'GET', url, headers=headers)
             data = response.json()
             self.access_token = data.get('access_token')
             self.token_expiry = timezone.now() + timezone.timedelta(minutes=55)
+            if self.access_token:
+                cache.set(ACCESS_TOKEN_CACHE_KEY,
+                          (self.access_token, self.token_expiry), timeout=55 * 60)
             return self.access_token
         except requests.exceptions.RequestException as e:
-            print(f"Error getting access token: {e}")
+            logger.warning("Error getting M-Pesa access token: %s", e)
             self.access_token = None
             return None
 
@@ -45,14 +125,18 @@ class MpesaGateway:
 
     def stk_push(self, phone_number, amount, account_reference, transaction_desc):
         """Initiate STK Push request"""
-        access_token = self.get_access_token()
+        try:
+            access_token = self.get_access_token()
+        except GatewayUnavailable as e:
+            self.retry_after = e.retry_after
+            return None, str(e)
         if not access_token:
             return None, "Failed to get access token"
 
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         password = self.generate_password(timestamp)
 
-        url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
+        url = f"{self.base_url}/mpesa/stkpush/v1/processrequest"
 
         headers = {
             'Authorization': f'Bearer {access_token}',
@@ -74,23 +158,30 @@ class MpesaGateway:
         }
 
         try:
-            response = requests.post(
-                url, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
+            response = self._request(
+                'stkpush', 'POST', url, json=payload, headers=headers)
 
             data = response.json()
             return data, None
+        except GatewayUnavailable as e:
+            logger.info("STK Push refused locally: %s", e)
+            self.retry_after = e.retry_after
+            return None, str(e)
         except requests.exceptions.RequestException as e:
-            print(f"Error in STK Push: {e}")
+            logger.warning("Error in STK Push: %s", e)
             return None, str(e)
 
     def check_transaction_status(self, checkout_request_id):
         """Check M-Pesa transaction status - improved version"""
-        access_token = self.get_access_token()
+        try:
+            access_token = self.get_access_token()
+        except GatewayUnavailable as e:
+            self.retry_after = e.retry_after
+            return None, str(e)
         if not access_token:
             return None, "Failed to get access token"
 
-        url = "https://sandbox.safaricom.co.ke/mpesa/stkpushquery/v1/query"
+        url = f"{self.base_url}/mpesa/stkpushquery/v1/query"
 
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         password = self.generate_password(timestamp)
@@ -108,18 +199,17 @@ class MpesaGateway:
         }
 
         try:
-            response = requests.post(
-                url, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
+            response = self._request(
+                'stkpushquery', 'POST', url, json=payload, headers=headers)
 
             data = response.json()
 
-            # Debug logging
-            print(f"M-Pesa Status Response: {data}")
+            logger.debug("M-Pesa status response: %s", data)
 
             # ✅ Replace the old ResultCode check with this new block
             if 'ResultCode' in data:
-                result_code = data['ResultCode']
+                # The query API returns ResultCode as a string ("0")
+                result_code = int(data['ResultCode'])
                 result_desc = data.get('ResultDesc', '')
 
                 if result_code == 0:
@@ -130,10 +220,16 @@ class MpesaGateway:
                 else:
                     # Payment failed or cancelled
                     return {'status': 'failed', 'message': result_desc, 'data': data}, None
+            elif data.get('errorCode') == STK_QUERY_PROCESSING:
+                return {'status': 'pending', 'message': data.get('errorMessage', ''), 'data': data}, None
             else:
                 # No ResultCode yet - treat as pending
                 return {'status': 'pending', 'message': 'Transaction still processing', 'data': data}, None
 
+        except GatewayUnavailable as e:
+            logger.info("Status check refused locally: %s", e)
+            self.retry_after = e.retry_after
+            return None, str(e)
         except requests.exceptions.RequestException as e:
-            print(f"Error checking transaction: {e}")
+            logger.warning("Error checking M-Pesa transaction: %s", e)
             return None, str(e)
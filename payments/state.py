@@ -0,0 +1,209 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.utils import timezone
+from bookings.models import Booking
+from emails.models import TicketDelivery
+from eventify import metrics
+from .models import EarlyCallback, Payment, PaymentPayload
+from .notifications import notify_status_change
+
+# The payment state machine.
+#
+# A payment only ever moves out of 'pending', and every move is a single
+# conditional UPDATE ... WHERE status = 'pending'. Duplicate or late
+# callbacks and status queries therefore match no rows and change nothing.
+# A callback's raw body is archived in PaymentPayload before that update,
+# so duplicates and late arrivals are on record as well.
+#
+# Daraja can call back before process_payment has saved the STK push's
+# CheckoutRequestID. Such a callback is parked as an EarlyCallback and
+# replayed when the id is saved. Each side writes first and looks for the
+# other second, so whichever commits last finds the other's row; applying
+# the same result twice is a no-op.
+
+StkResult = namedtuple('StkResult', [
+    'checkout_request_id', 'merchant_request_id', 'result_code',
+    'result_desc', 'receipt_number', 'transaction_date', 'amount',
+    'phone_number',
+])
+
+# Daraja result codes that mean the customer has not finished yet
+PROCESSING_RESULT_CODES = {4999}
+
+# Parked callbacks whose CheckoutRequestID never turns up are dropped after this
+EARLY_CALLBACK_TTL = timedelta(days=1)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_transaction_date(value):
+    """Parse M-Pesa's YYYYMMDDHHMMSS timestamp"""
+    try:
+        return timezone.make_aware(datetime.strptime(str(value), '%Y%m%d%H%M%S'))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_stk_callback(data):
+    """Parse a Daraja STK callback body in one pass. Returns None if malformed."""
+    callback = (data.get('Body') or {}).get('stkCallback')
+    if not callback:
+        return None
+
+    receipt_number = transaction_date = amount = phone_number = None
+    for item in (callback.get('CallbackMetadata') or {}).get('Item') or ():
+        name = item.get('Name')
+        if name == 'MpesaReceiptNumber':
+            receipt_number = item.get('Value')
+        elif name == 'TransactionDate':
+            transaction_date = parse_transaction_date(item.get('Value'))
+        elif name == 'Amount':
+            amount = item.get('Value')
+        elif name == 'PhoneNumber':
+            phone_number = item.get('Value')
+
+    return StkResult(
+        checkout_request_id=callback.get('CheckoutRequestID'),
+        merchant_request_id=callback.get('MerchantRequestID'),
+        result_code=_to_int(callback.get('ResultCode')),
+        result_desc=callback.get('ResultDesc') or '',
+        receipt_number=receipt_number,
+        transaction_date=transaction_date,
+        amount=amount,
+        phone_number=phone_number,
+    )
+
+
+def parse_stk_query(data):
+    """Parse an STK push query response into the same shape as a callback"""
+    return StkResult(
+        checkout_request_id=data.get('CheckoutRequestID'),
+        merchant_request_id=data.get('MerchantRequestID'),
+        result_code=_to_int(data.get('ResultCode')),
+        result_desc=data.get('ResultDesc') or '',
+        receipt_number=None,
+        transaction_date=None,
+        amount=None,
+        phone_number=None,
+    )
+
+
+def status_for_result(result_code):
+    """Map a Daraja result code to a payment status"""
+    if result_code is None or result_code in PROCESSING_RESULT_CODES:
+        return 'pending'
+    if result_code == 0:
+        return 'successful'
+    return 'failed'
+
+
+def apply_result(result, callback_data=None, payment_id=None):
+    """Move a pending payment to the status given by a Daraja result.
+
+    The payment is matched by payment_id if given, otherwise by the
+    result's CheckoutRequestID. callback_data, if given, is archived for
+    any matching payment, even when nothing changes. Returns the payment id
+    if this call made the transition, or None if it was a no-op (unknown
+    payment, already final, or still processing).
+    """
+    if payment_id is not None:
+        match = {'pk': payment_id}
+    elif result.checkout_request_id:
+        match = {'checkout_request_id': result.checkout_request_id}
+    else:
+        return None
+
+    new_status = status_for_result(result.result_code)
+    if new_status == 'pending' and callback_data is None:
+        return None
+    now = timezone.now()
+    fields = {
+        'status': new_status,
+        'result_code': result.result_code,
+        'result_desc': result.result_desc,
+        'updated_at': now,
+    }
+    if callback_data is not None:
+        fields['callback_received'] = True
+    if new_status == 'successful':
+        fields['transaction_date'] = result.transaction_date or now
+        if result.receipt_number:
+            fields['mpesa_receipt_number'] = result.receipt_number
+
+    with transaction.atomic():
+        if callback_data is not None:
+            # Archived before the transition, so duplicates and late
+            # callbacks are kept too
+            if payment_id is None:
+                payment_id = Payment.objects.filter(**match).values_list(
+                    'pk', flat=True).first()
+                if payment_id is None:
+                    return None
+            PaymentPayload.record(payment_id, callback_data)
+
+        if new_status == 'pending':
+            return None
+        if not Payment.objects.filter(status='pending', **match).update(**fields):
+            return None
+
+        if payment_id is None:
+            payment_id = Payment.objects.filter(**match).values_list(
+                'pk', flat=True).get()
+
+        if new_status == 'successful':
+            booking_id = Payment.objects.filter(pk=payment_id).values_list(
+                'booking_id', flat=True).get()
+            confirmed = Booking.objects.filter(pk=booking_id).exclude(
+                status='confirmed').update(status='confirmed', updated_at=now)
+            if confirmed:
+                transaction.on_commit(
+                    lambda: metrics.bookings_confirmed.inc(kind='mpesa'))
+            # Ticket email goes out via the outbox, committed with the booking
+            TicketDelivery.enqueue(booking_id)
+
+        transaction.on_commit(
+            lambda: notify_status_change(payment_id, new_status))
+        transaction.on_commit(lambda: metrics.payments.inc(
+            status=new_status, result_code=str(result.result_code)))
+
+    return payment_id
+
+
+def apply_stk_callback(data):
+    """Apply a raw Daraja callback body. Returns the payment id or None."""
+    result = parse_stk_callback(data)
+    if result is None:
+        return None
+    payment_id = apply_result(result, callback_data=data)
+    if payment_id or not result.checkout_request_id:
+        return payment_id
+    if status_for_result(result.result_code) == 'pending':
+        return None
+    if Payment.objects.filter(checkout_request_id=result.checkout_request_id).exists():
+        # Duplicate or late: the payment has already moved on
+        return None
+
+    EarlyCallback.objects.filter(
+        created_at__lt=timezone.now() - EARLY_CALLBACK_TTL).delete()
+    EarlyCallback.objects.create(
+        checkout_request_id=result.checkout_request_id, data=data)
+    # The id may have been saved since the first attempt
+    return replay_early_callbacks(result.checkout_request_id)
+
+
+def replay_early_callbacks(checkout_request_id):
+    """Apply callbacks parked for a CheckoutRequestID. Call once the id is
+    saved on its payment. Returns the payment id if one was applied."""
+    payment_id = None
+    for early in EarlyCallback.objects.filter(checkout_request_id=checkout_request_id):
+        payment_id = apply_result(
+            parse_stk_callback(early.data), callback_data=early.data) or payment_id
+    if Payment.objects.filter(checkout_request_id=checkout_request_id).exists():
+        EarlyCallback.objects.filter(checkout_request_id=checkout_request_id).delete()
+    return payment_id
@@ -1,3 +1,278 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from bookings.models import Booking
+from emails.models import TicketDelivery
+from events.models import Event
+from .models import EarlyCallback, Payment
+from .mpesa_utils import MpesaGateway
+from .notifications import notify_status_change, status_key
+from .simulator import DarajaSimulator, SimulatedPayment
+from .resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, GatewayUnavailable, daraja_breaker
+from .state import apply_stk_callback, replay_early_callbacks
 
-# Create your tests here.
+
+def create_payment(checkout_request_id='ws_CO_TEST0001', status='pending', user=None):
+    """A pending booking for next week's event and its M-Pesa payment"""
+    user = user or User.objects.create_user('buyer', 'buyer@example.com')
+    start = timezone.now() + timedelta(days=7)
+    event = Event.objects.create(
+        title="Test Event", description="Test event", venue="KICC",
+        start_date=start, end_date=start + timedelta(hours=4),
+        total_capacity=100)
+    booking = Booking.objects.create(
+        user=user, event=event, ticket_type='regular', quantity=2,
+        unit_price=Decimal('500'), total_price=Decimal('1000'))
+    return Payment.objects.create(
+        booking=booking, user=user, phone_number='254708374149',
+        amount=booking.total_price, status=status,
+        checkout_request_id=checkout_request_id)
+
+
+def stk_callback(checkout_request_id, receipt, result_code=0,
+                 result_desc="The service request is processed successfully."):
+    """An stkCallback body as Daraja sends it"""
+    callback = {
+        "MerchantRequestID": "29115-34620561-1",
+        "CheckoutRequestID": checkout_request_id,
+        "ResultCode": result_code,
+        "ResultDesc": result_desc,
+    }
+    if result_code == 0:
+        callback["CallbackMetadata"] = {
+            "Item": [
+                {"Name": "Amount", "Value": 1000.0},
+                {"Name": "MpesaReceiptNumber", "Value": receipt},
+                {"Name": "Balance"},
+                {"Name": "TransactionDate", "Value": 20251130171200},
+                {"Name": "PhoneNumber", "Value": 254708374149},
+            ]
+        }
+    return {"Body": {"stkCallback": callback}}
+
+
+class PaymentCallbackTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.payment = create_payment()
+        cls.booking = cls.payment.booking
+
+    def callback(self, receipt, **kwargs):
+        return stk_callback(self.payment.checkout_request_id, receipt, **kwargs)
+
+    def test_duplicate_callback_is_a_no_op(self):
+        self.assertEqual(apply_stk_callback(self.callback('FIRST00001')), self.payment.pk)
+        self.assertIsNone(apply_stk_callback(self.callback('SECOND0001')))
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'successful')
+        self.assertEqual(self.payment.mpesa_receipt_number, 'FIRST00001')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'confirmed')
+        self.assertEqual(TicketDelivery.objects.filter(booking=self.booking).count(), 1)
+        # A duplicate for a known payment is not mistaken for an early callback
+        self.assertFalse(EarlyCallback.objects.exists())
+        # Both are archived
+        self.assertEqual(self.payment.payloads.count(), 2)
+
+    def test_failure_after_success_is_ignored(self):
+        apply_stk_callback(self.callback('FIRST00001'))
+        cancelled = self.callback('', result_code=1032,
+                                  result_desc="Request cancelled by user")
+        self.assertIsNone(apply_stk_callback(cancelled))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'successful')
+
+
+class EarlyCallbackTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.checkout_request_id = 'ws_CO_EARLY0001'
+        # As between the STK push being sent and its response being saved
+        cls.payment = create_payment(checkout_request_id=None)
+
+    def test_callback_before_checkout_id_is_replayed(self):
+        callback = stk_callback(self.checkout_request_id, 'EARLY00001')
+        self.assertIsNone(apply_stk_callback(callback))
+        self.assertEqual(EarlyCallback.objects.count(), 1)
+
+        Payment.objects.filter(pk=self.payment.pk).update(
+            checkout_request_id=self.checkout_request_id)
+        self.assertEqual(replay_early_callbacks(self.checkout_request_id), self.payment.pk)
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'successful')
+        self.assertEqual(self.payment.booking.status, 'confirmed')
+        self.assertFalse(EarlyCallback.objects.exists())
+
+
+class PaymentStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pending = create_payment()
+        cls.user = cls.pending.user
+        cls.failed = create_payment('ws_CO_TEST0002', status='failed', user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    @override_settings(PAYMENT_STATUS_WAIT_SECONDS=30, PAYMENT_STATUS_POLL_SECONDS=3)
+    def test_wsgi_polls_instead_of_waiting(self):
+        response = self.client.get(reverse('payment_status', args=[self.pending.id]))
+        self.assertEqual(response.json(),
+                         {'status': 'pending', 'redirect': None, 'retry_after': 3})
+
+    def test_retry_forgets_failed_status(self):
+        notify_status_change(self.failed.id, 'failed')
+        seen = []
+
+        def stk_push(gateway, **kwargs):
+            seen.append(cache.get(status_key(self.failed.id)))
+            return {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_RETRY'}, None
+
+        with mock.patch('payments.mpesa_utils.MpesaGateway.stk_push', stk_push):
+            response = self.client.post(
+                reverse('process_payment', args=[self.failed.booking_id]),
+                {'phone_number': '0708374149'})
+        self.assertRedirects(response, reverse('payment_pending', args=[self.failed.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(seen, [None])
+        self.assertEqual(cache.get(status_key(self.failed.id)), 'pending')
+
+    def test_throttled_stk_push(self):
+        refused = GatewayUnavailable("Too many M-Pesa requests", retry_after=4)
+        with mock.patch.object(MpesaGateway, 'get_access_token', return_value='token'), \
+                mock.patch.object(MpesaGateway, '_request', side_effect=refused):
+            gateway = MpesaGateway()
+            self.assertEqual(gateway.stk_push('254708374149', 500, 'EVENT', 'Tickets'),
+                             (None, "Too many M-Pesa requests"))
+            self.assertEqual(gateway.retry_after, 4)
+
+            with self.assertLogs('django.request', 'ERROR'):
+                response = self.client.post(
+                    reverse('process_payment', args=[self.failed.booking_id]),
+                    {'phone_number': '0708374149'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+@override_settings(MPESA_BREAKER_MIN_CALLS=4, MPESA_BREAKER_FAILURE_RATE=0.5,
+                   MPESA_BREAKER_WINDOW_SECONDS=60, MPESA_BREAKER_COOLDOWN_SECONDS=30)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = 1_000_000.0
+        clock = mock.patch('payments.resilience.time')
+        clock.start().time.side_effect = lambda: self.now
+        self.addCleanup(clock.stop)
+        self.breaker = CircuitBreaker('test')
+
+    def trip(self):
+        with self.assertLogs('payments.resilience', 'WARNING'):
+            for success in (True, False, False, True):
+                self.breaker.record(success, 0.1)
+
+    def test_trips_on_failure_rate(self):
+        self.breaker.record(False, 0.1)
+        self.breaker.record(False, 0.1)
+        # Too few calls to judge yet
+        self.assertEqual(self.breaker.state, CLOSED)
+        with self.assertLogs('payments.resilience', 'WARNING'):
+            self.breaker.record(True, 0.1)
+            self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.allow_request(), (False, False))
+        self.assertEqual(self.breaker.retry_after(), 30)
+
+    def test_slow_calls_count_as_failures(self):
+        with self.assertLogs('payments.resilience', 'WARNING'):
+            for _ in range(4):
+                self.breaker.record(True, 10)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_one_trial_call_after_cooldown(self):
+        self.trip()
+        self.now += 29
+        self.assertEqual(self.breaker.allow_request(), (False, False))
+        self.now += 1
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertEqual(self.breaker.allow_request(), (True, True))
+        self.assertEqual(self.breaker.allow_request(), (False, False))
+
+        # A call sent before the breaker opened finishes now: it doesn't decide
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.record(True, 0.1, trial=True)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.allow_request(), (True, False))
+
+    def test_failed_trial_reopens(self):
+        self.trip()
+        self.now += 30
+        self.assertEqual(self.breaker.allow_request(), (True, True))
+        with self.assertLogs('payments.resilience', 'WARNING'):
+            self.breaker.record(False, 0.1, trial=True)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.retry_after(), 30)
+
+
+class StatusQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def query_response(self, status_code, body):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = json.dumps(body).encode()
+        return response
+
+    def test_payment_still_processing_is_pending_not_a_failure(self):
+        # What Daraja sends while the customer hasn't answered the prompt
+        processing = self.query_response(500, {
+            'requestId': '29115-34620561-1', 'errorCode': '500.001.1001',
+            'errorMessage': "The transaction is being processed"})
+        gateway = MpesaGateway()
+        with mock.patch.object(MpesaGateway, 'get_access_token', return_value='token'), \
+                mock.patch('payments.mpesa_utils.session.request', return_value=processing):
+            for _ in range(10):
+                result, error = gateway.check_transaction_status('ws_CO_TEST0001')
+                self.assertIsNone(error)
+                self.assertEqual(result['status'], 'pending')
+        self.assertEqual(daraja_breaker.state, CLOSED)
+
+    def test_server_errors_trip_the_breaker(self):
+        outage = self.query_response(500, {'errorCode': '500.003.02',
+                                           'errorMessage': "System is busy"})
+        gateway = MpesaGateway()
+        with mock.patch.object(MpesaGateway, 'get_access_token', return_value='token'), \
+                mock.patch('payments.mpesa_utils.session.request', return_value=outage), \
+                self.assertLogs('payments', 'WARNING'):
+            for _ in range(10):
+                gateway.check_transaction_status('ws_CO_TEST0001')
+        self.assertEqual(daraja_breaker.state, OPEN)
+
+
+class DarajaSimulatorTests(TestCase):
+    def test_query_answers_like_daraja_until_the_callback(self):
+        simulator = DarajaSimulator(seed=1)
+        payment = SimulatedPayment(
+            merchant_request_id='1-1-1', checkout_request_id='ws_CO_SIM0001',
+            amount=500, phone_number='254708374149',
+            callback_url='http://127.0.0.1:8000/payments/callback/',
+            result_code=0, receipt='SIM0000001')
+        simulator.payments[payment.checkout_request_id] = payment
+        query = {'CheckoutRequestID': payment.checkout_request_id}
+
+        status, body = simulator.stk_query(query)
+        self.assertEqual((status, body['errorCode']), (500, '500.001.1001'))
+        payment.completed = True
+        status, body = simulator.stk_query(query)
+        self.assertEqual((status, body['ResultCode']), (200, '0'))
@@ -6,5 +6,6 @@ urlpatterns = [
     path('success/<int:payment_id>/', views.payment_success, name='payment_success'),
     path('failed/<int:payment_id>/', views.payment_failed, name='payment_failed'),
     path('pending/<int:payment_id>/', views.payment_pending, name='payment_pending'),
+    path('status/<int:payment_id>/', views.payment_status, name='payment_status'),
     path('callback/', views.mpesa_callback, name='mpesa_callback'),
 ]
\ No newline at end of file
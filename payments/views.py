@@ -2,14 +2,25 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 import json
-from datetime import datetime
+import logging
 from bookings.models import Booking
+from eventify import metrics
+from eventify.db_router import read_only_view
 from .models import Payment
-from .mpesa_utils import MpesaGateway
-from emails.utils import send_ticket_email, format_phone_number
+from .notifications import forget_status, notify_status_change, wait_for_status_change
+from .resilience import OPEN, daraja_breaker
+from .state import apply_stk_callback, replay_early_callbacks
+from emails.models import TicketDelivery
+from emails.utils import format_phone_number
+
+logger = logging.getLogger(__name__)
 
 
 @login_required
@@ -69,6 +80,11 @@ def process_payment(request, booking_id):
                 request, "Please enter a valid Kenyan phone number.")
             return redirect('process_payment', booking_id=booking_id)
 
+        # Fail fast while Daraja is down instead of blocking this worker
+        if daraja_breaker.state == OPEN:
+            return gateway_unavailable(
+                request, booking, daraja_breaker.retry_after())
+
         # Use existing payment if available and failed, otherwise create new one
         if existing_payment and existing_payment.status == 'failed':
             payment = existing_payment
@@ -77,13 +93,14 @@ def process_payment(request, booking_id):
             payment.amount = booking.total_price
             payment.status = 'pending'
             payment.merchant_request_id = ''
-            payment.checkout_request_id = ''
+            payment.checkout_request_id = None
             payment.mpesa_receipt_number = ''
             payment.transaction_date = None
             payment.callback_received = False
             payment.result_code = None
             payment.result_desc = ''
-            payment.callback_data = None
+            payment.save()
+            forget_status(payment.id)
         else:
             # Create new payment record
             payment = Payment.objects.create(
@@ -95,6 +112,8 @@ def process_payment(request, booking_id):
             )
 
         # INITIATE REAL STK PUSH
+        # requests is only imported once a payment is actually started
+        from .mpesa_utils import MpesaGateway
         mpesa = MpesaGateway()
         account_reference = f"EVENT{booking.id:06d}"
         transaction_desc = f"Tickets for {booking.event.title}"
@@ -110,6 +129,9 @@ def process_payment(request, booking_id):
             # STK Push failed
             payment.status = 'failed'
             payment.save()
+            notify_status_change(payment.id, payment.status)
+            if mpesa.retry_after is not None:
+                return gateway_unavailable(request, booking, mpesa.retry_after)
             messages.error(request, f"Failed to initiate payment: {error}")
             return redirect('payment_failed', payment_id=payment.id)
 
@@ -117,8 +139,13 @@ def process_payment(request, booking_id):
         if response and response.get('ResponseCode') == '0':
             # Save M-Pesa request IDs
             payment.merchant_request_id = response.get('MerchantRequestID', '')
-            payment.checkout_request_id = response.get('CheckoutRequestID', '')
+            payment.checkout_request_id = response.get(
+                'CheckoutRequestID') or None
             payment.save()
+            notify_status_change(payment.id, payment.status)
+            # The callback may already have arrived
+            if payment.checkout_request_id:
+                replay_early_callbacks(payment.checkout_request_id)
 
             messages.info(request,
                           "STK Push initiated! Check your phone for M-Pesa prompt. "
@@ -131,64 +158,73 @@ def process_payment(request, booking_id):
             # STK Push failed
             payment.status = 'failed'
             payment.save()
+            notify_status_change(payment.id, payment.status)
             error_message = response.get(
                 'errorMessage', 'Payment initiation failed') if response else 'Payment initiation failed'
             messages.error(request, f"Payment failed: {error_message}")
             return redirect('payment_failed', payment_id=payment.id)
 
 
+def gateway_unavailable(request, booking, retry_after=None):
+    """Tell the user to retry later when Daraja calls are being refused"""
+    retry_after = int(retry_after or 0) + 1
+    context = {
+        'booking': booking,
+        'retry_after': retry_after,
+    }
+    response = render(request, 'payment_unavailable.html', context, status=503)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
 def handle_free_ticket(request, booking, existing_payment=None):
     """Handle free tickets (amount = 0) without payment"""
-    # Use existing payment if available, otherwise create new one
-    if existing_payment:
-        payment = existing_payment
-        # Update payment details for free ticket
-        payment.phone_number = 'FREE'
-        payment.amount = 0
-        payment.status = 'successful'
-        payment.mpesa_receipt_number = f"FREE{booking.id:06d}"
-        payment.merchant_request_id = ''
-        payment.checkout_request_id = ''
-        payment.transaction_date = timezone.now()
-        payment.callback_received = False
-        payment.result_code = None
-        payment.result_desc = ''
-        payment.callback_data = None
-    else:
-        # Create payment record with zero amount
-        payment = Payment.objects.create(
-            booking=booking,
-            user=request.user,
-            phone_number='FREE',
-            amount=0,
-            status='successful',
-            mpesa_receipt_number=f"FREE{booking.id:06d}",
-            transaction_date=timezone.now()
-        )
+    # Confirm the booking and queue the ticket email in one transaction
+    with transaction.atomic():
+        # Use existing payment if available, otherwise create new one
+        if existing_payment:
+            payment = existing_payment
+            # Update payment details for free ticket
+            payment.phone_number = 'FREE'
+            payment.amount = 0
+            payment.status = 'successful'
+            payment.mpesa_receipt_number = f"FREE{booking.id:06d}"
+            payment.merchant_request_id = ''
+            payment.checkout_request_id = None
+            payment.transaction_date = timezone.now()
+            payment.callback_received = False
+            payment.result_code = None
+            payment.result_desc = ''
+        else:
+            # Create payment record with zero amount
+            payment = Payment.objects.create(
+                booking=booking,
+                user=request.user,
+                phone_number='FREE',
+                amount=0,
+                status='successful',
+                mpesa_receipt_number=f"FREE{booking.id:06d}",
+                transaction_date=timezone.now()
+            )
 
-    # Update booking status
-    booking.status = 'confirmed'
-    booking.save()
-    payment.save()
+        # Update booking status
+        booking.status = 'confirmed'
+        booking.save()
+        payment.save()
+        TicketDelivery.enqueue(booking.id)
+    notify_status_change(payment.id, payment.status)
+    metrics.bookings_confirmed.inc(kind='free')
+    metrics.payments.inc(status='successful', result_code='none')
 
-    # SEND TICKET EMAIL FOR FREE TICKET
-    try:
-        success, message = send_ticket_email(booking, payment)
-        if success:
-            messages.success(
-                request, f"Free ticket confirmed! Ticket sent to {booking.user.email}!")
-        else:
-            messages.warning(
-                request, f"Free ticket confirmed but email failed: {message}")
-    except Exception as e:
-        messages.success(request, "Free ticket confirmed successfully!")
+    messages.success(
+        request, f"Free ticket confirmed! Your ticket will be emailed to {booking.user.email}.")
 
     return redirect('payment_success', payment_id=payment.id)
 
 
 @login_required
 def payment_pending(request, payment_id):
-    """Show pending payment page and check M-Pesa status - NO JS version"""
+    """Show pending payment page and check M-Pesa status (JS long-polls payment_status)"""
     payment = get_object_or_404(Payment, id=payment_id, user=request.user)
 
     # If payment is already successful, redirect to success
@@ -202,30 +238,15 @@ def payment_pending(request, payment_id):
     # At this point, payment.status == 'pending'
     # Try checking M-Pesa status (STK query)
     if payment.checkout_request_id:
-        mpesa = MpesaGateway()
-        status_data, error = mpesa.check_transaction_status(
-            payment.checkout_request_id)
-
-        if status_data:
-            # Update payment status based on STK query result
-            # 'successful', 'failed', or 'pending'
-            new_status = status_data['status']
-            payment.status = new_status
-            payment.result_desc = status_data.get('message', '')
-            payment.save()
+        status, message = payment.check_mpesa_status()
 
-            # If payment is now successful, send ticket email and redirect
-            if new_status == 'successful':
-                booking = payment.booking
-                try:
-                    send_ticket_email(booking, payment)
-                except Exception:
-                    pass  # Fail silently for email
-                return redirect('payment_success', payment_id=payment.id)
+        # If payment is now successful, redirect (the ticket email is queued)
+        if status == 'successful':
+            return redirect('payment_success', payment_id=payment.id)
 
-            # If payment failed, redirect to failed page
-            elif new_status == 'failed':
-                return redirect('payment_failed', payment_id=payment.id)
+        # If payment failed, redirect to failed page
+        elif status == 'failed':
+            return redirect('payment_failed', payment_id=payment.id)
 
         # If still pending (e.g., 4999), continue to render pending page
 
@@ -236,9 +257,53 @@ def payment_pending(request, payment_id):
 
 
 @login_required
+async def payment_status(request, payment_id):
+    """Long-poll for a payment status change.
+
+    Returns as soon as the payment leaves 'pending' (or immediately if it
+    already has), otherwise after PAYMENT_STATUS_WAIT_SECONDS with the
+    unchanged status so the client can poll again. Served over WSGI it
+    answers at once, with `retry_after` telling the client when to poll.
+    """
+    user = await request.auser()
+    try:
+        payment = await Payment.objects.only('id', 'status').aget(
+            id=payment_id, user=user)
+    except Payment.DoesNotExist:
+        raise Http404("Payment not found")
+
+    status = payment.status
+    retry_after = None
+    if status == 'pending':
+        if isinstance(request, ASGIRequest):
+            status = await wait_for_status_change(
+                payment.id, status, settings.PAYMENT_STATUS_WAIT_SECONDS) or status
+        else:
+            # Waiting would tie up a sync worker
+            retry_after = settings.PAYMENT_STATUS_POLL_SECONDS
+
+    redirect_url = None
+    if status == 'successful':
+        redirect_url = reverse('payment_success', args=[payment.id])
+    elif status in ('failed', 'cancelled'):
+        redirect_url = reverse('payment_failed', args=[payment.id])
+
+    return JsonResponse(
+        {'status': status, 'redirect': redirect_url, 'retry_after': retry_after})
+
+
+@login_required
+@read_only_view
 def payment_success(request, payment_id):
     """Show payment success page - ONLY if payment is actually successful"""
-    payment = get_object_or_404(Payment, id=payment_id, user=request.user)
+    payment = get_object_or_404(
+        Payment.objects.select_related('booking__event', 'booking__user'),
+        id=payment_id, user=request.user)
+
+    # The M-Pesa callback is not the user's own write, so a replica may not
+    # have it yet: check the primary before sending them back
+    if payment.status != 'successful':
+        payment.refresh_from_db(using='default')
 
     # Only show success page for actually successful payments
     if payment.status != 'successful':
@@ -264,7 +329,9 @@ def payment_success(request, payment_id):
 @login_required
 def payment_failed(request, payment_id):
     """Show payment failed page"""
-    payment = get_object_or_404(Payment, id=payment_id, user=request.user)
+    payment = get_object_or_404(
+        Payment.objects.select_related('booking__event'),
+        id=payment_id, user=request.user)
 
     context = {
         'payment': payment,
@@ -280,58 +347,14 @@ def mpesa_callback(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            print("M-Pesa Callback Received:", data)
-
-            # Extract callback metadata
-            callback_metadata = data.get('Body', {}).get('stkCallback', {})
-            checkout_request_id = callback_metadata.get('CheckoutRequestID')
-            result_code = callback_metadata.get('ResultCode')
-            result_desc = callback_metadata.get('ResultDesc')
-
-            # Find payment by checkout request ID
-            try:
-                payment = Payment.objects.get(
-                    checkout_request_id=checkout_request_id)
-                payment.callback_received = True
-                payment.result_code = result_code
-                payment.result_desc = result_desc
-                payment.callback_data = data
-
-                if result_code == 0:
-                    # Payment successful
-                    payment.status = 'successful'
-
-                    # Extract M-Pesa receipt number
-                    callback_items = callback_metadata.get(
-                        'CallbackMetadata', {}).get('Item', [])
-                    for item in callback_items:
-                        if item.get('Name') == 'MpesaReceiptNumber':
-                            payment.mpesa_receipt_number = item.get('Value')
-                        elif item.get('Name') == 'TransactionDate':
-                            transaction_date = item.get('Value')
-                            # Convert M-Pesa date format to datetime
-                            try:
-                                payment.transaction_date = timezone.make_aware(
-                                    datetime.strptime(
-                                        str(transaction_date), '%Y%m%d%H%M%S')
-                                )
-                            except:
-                                payment.transaction_date = timezone.now()
-
-                    # Update booking status
-                    booking = payment.booking
-                    booking.status = 'confirmed'
-                    booking.save()
-
-                else:
-                    # Payment failed
-                    payment.status = 'failed'
-
-                payment.save()
-
-            except Payment.DoesNotExist:
-                print(
-                    f"Payment not found for checkout request: {checkout_request_id}")
+            logger.debug("M-Pesa callback received: %s", data)
+
+            # Duplicate, late or unknown callbacks are no-ops
+            if apply_stk_callback(data):
+                metrics.callbacks.inc(outcome='applied')
+            else:
+                metrics.callbacks.inc(outcome='ignored')
+                logger.info("M-Pesa callback ignored (duplicate, unknown or still processing)")
 
             # Always return success to M-Pesa
             return JsonResponse({
@@ -340,10 +363,12 @@ def mpesa_callback(request):
             })
 
         except Exception as e:
-            print(f"Error processing callback: {e}")
+            metrics.callbacks.inc(outcome='error')
+            logger.exception("Error processing callback: %s", e)
             return JsonResponse({
                 "ResultCode": 1,
                 "ResultDesc": "Failed"
             })
 
     return JsonResponse({"error": "Method not allowed"}, status=405)
+